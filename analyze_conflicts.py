@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from make_bin_diff import sha256_stream
+from mod_catalog import ModCatalog, CATALOG_FILE_NAME, MOD_EXTENSIONS
+
+PATCHED_SUFFIX = '-trw'
+# Members every mod ships that the game keeps per mod, never an override
+IGNORED_PREFIXES = ('META-INF/',)
+# Asset folders whose ids live one level deeper, e.g. Server/Item/Items/<id>.json
+NESTED_ASSET_ROOTS = ('Item', 'Entity', 'NPC')
+
+
+def list_archives(mods_dir: str, include_sources: bool = False) -> list:
+    """
+    Archives that end up loaded together: every patched output in
+    mods_dir/patched, plus each source mod in mods_dir that has no patched
+    output. With include_sources every source mod is listed as well.
+    Returns paths relative to mods_dir.
+    """
+    patched_dir = os.path.join(mods_dir, 'patched')
+    patched = []
+    if os.path.isdir(patched_dir):
+        patched = sorted(f for f in os.listdir(patched_dir)
+                         if f.lower().endswith(MOD_EXTENSIONS) and os.path.isfile(os.path.join(patched_dir, f)))
+    patched_stems = {os.path.splitext(f)[0][:-len(PATCHED_SUFFIX)] for f in patched
+                     if os.path.splitext(f)[0].endswith(PATCHED_SUFFIX)}
+    archives = []
+    for f in sorted(os.listdir(mods_dir)):
+        if not f.lower().endswith(MOD_EXTENSIONS) or not os.path.isfile(os.path.join(mods_dir, f)):
+            continue
+        if include_sources or os.path.splitext(f)[0] not in patched_stems:
+            archives.append(f)
+    archives += [os.path.join('patched', f) for f in patched]
+    return archives
+
+
+def asset_id(path: str):
+    """
+    Return (asset type, id) for a Server/ JSON asset, e.g.
+    Server/Item/Items/Deco/Deco_Teto_Plush.json -> ('Server/Item/Items',
+    'Deco_Teto_Plush'), or None for anything else.
+    """
+    parts = path.split('/')
+    if len(parts) < 3 or parts[0] != 'Server' or not path.endswith('.json'):
+        return None
+    depth = 3 if parts[1] in NESTED_ASSET_ROOTS and len(parts) > 3 else 2
+    return '/'.join(parts[:depth]), os.path.splitext(parts[-1])[0]
+
+
+def _hash_members(mods_dir: str, archive: str, names: list) -> dict:
+    with zipfile.ZipFile(os.path.join(mods_dir, archive), 'r') as z:
+        digests = {}
+        for name in names:
+            with z.open(name) as fp:
+                digests[name] = sha256_stream(fp)
+        return digests
+
+
+def analyze(mods_dir: str, archives: list, workers: int = None) -> dict:
+    """
+    Index path -> archives and asset id -> paths from the mod catalog
+    (central directories are only read for archives that changed since the
+    last scan), then hash only members whose path appears in more than one
+    archive to tell identical copies from real overrides.
+    """
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    sizes = {}
+    ids = {}
+    with ModCatalog(os.path.join(mods_dir, 'patched', CATALOG_FILE_NAME)) as catalog:
+        catalog.refresh(mods_dir, archives)
+        valid = set(catalog.archives())
+        unreadable = [archive for archive in archives if archive not in valid]
+        readable = [archive for archive in archives if archive in valid]
+        for archive in readable:
+            for name, file_size, _, _, _, _ in catalog.members(archive):
+                if '/' not in name or name.startswith(IGNORED_PREFIXES):
+                    continue
+                sizes[(archive, name)] = file_size
+                key = asset_id(name)
+                if key is not None:
+                    ids.setdefault(key, set()).add((name, archive))
+        collisions = {path: owners for path, owners in catalog.shared_paths(readable)
+                      if (owners[0], path) in sizes}
+
+    to_hash = {}
+    for path, owners in collisions.items():
+        for archive in owners:
+            to_hash.setdefault(archive, []).append(path)
+    digests = {}
+    jobs = [(archive, names) for archive, names in sorted(to_hash.items())]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (archive, _), result in zip(jobs, pool.map(lambda job: _hash_members(mods_dir, *job), jobs)):
+            for path, digest in result.items():
+                digests[(archive, path)] = digest
+
+    overrides = []
+    for path in sorted(collisions):
+        owners = [{"archive": archive, "size": sizes[(archive, path)], "sha256": digests[(archive, path)]}
+                  for archive in collisions[path]]
+        overrides.append({"path": path, "identical": len({o["sha256"] for o in owners}) == 1, "archives": owners})
+
+    duplicate_ids = []
+    for (kind, ident), members in sorted(ids.items()):
+        paths = {path for path, _ in members}
+        if len(paths) > 1:
+            duplicate_ids.append({"type": kind, "id": ident,
+                                  "members": [{"path": p, "archive": a} for p, a in sorted(members)]})
+
+    return {"archives": len(archives) - len(unreadable), "unreadable": unreadable, "paths": len({path for _, path in sizes}),
+            "overrides": overrides, "duplicate_ids": duplicate_ids}
+
+
+def print_report(report: dict, show_identical: bool = False):
+    conflicting = [o for o in report["overrides"] if not o["identical"]]
+    identical = [o for o in report["overrides"] if o["identical"]]
+    print(f"[CONFLICTS] {report['archives']} archives, {report['paths']} paths, "
+          f"{len(conflicting)} conflicting overrides, {len(identical)} identical copies, "
+          f"{len(report['duplicate_ids'])} duplicate asset ids")
+    for archive in report["unreadable"]:
+        print(f"[WARNING] {archive} is not a readable zip archive")
+    for o in conflicting:
+        print(f"  OVERRIDE  {o['path']}")
+        for owner in o["archives"]:
+            print(f"      {owner['archive']}  ({owner['size']} bytes, {owner['sha256'][:12]})")
+    if show_identical:
+        for o in identical:
+            print(f"  SAME      {o['path']}  in {', '.join(owner['archive'] for owner in o['archives'])}")
+    for d in report["duplicate_ids"]:
+        print(f"  DUP ID    {d['type']} {d['id']}")
+        for m in d["members"]:
+            print(f"      {m['path']}  in {m['archive']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report assets that several mods (source or patched) ship under the same path or id")
+    parser.add_argument("--mods", default="mods", help="Mods folder, patched outputs are read from <mods>/patched (default: mods)")
+    parser.add_argument("--all", action="store_true", help="Also scan source mods that have a patched output (default: only what is loaded together)")
+    parser.add_argument("--show-identical", action="store_true", help="Also list paths shipped with identical contents by several archives")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Threads used to read archives")
+    parser.add_argument("--json", dest="json_out", help="Also write the report as JSON to this path")
+    parser.add_argument("--strict", action="store_true", help="Exit with status 1 if any conflicting override or duplicate id is found")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.mods):
+        print(f"Error: mods folder not found: {args.mods}", file=sys.stderr)
+        return 2
+    archives = list_archives(args.mods, include_sources=args.all)
+    report = analyze(args.mods, archives, workers=args.jobs)
+    print_report(report, show_identical=args.show_identical)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.strict and (report["duplicate_ids"] or any(not o["identical"] for o in report["overrides"])):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import max_rss
+# Importing patches fills the registry
+import patches
+import workspace
+from patch_registry import REGISTRY, PATCH_DATA_ROOT, patched_output_path
+
+# Members the registered patches read or edit, so every patch has real work
+# to do against a synthetic archive
+KNOWN_MEMBERS = {
+    "manifest.json": {"Group": "Bench", "Name": "SyntheticMod", "Version": "1.0.0", "IncludesAssetPack": False},
+    "Server/Entity/Effects/Food_Instant_Heal_T4.json": {"StatModifiers": {"Health": 10}},
+    "Server/Item/Items/Food_Pizza_Cheese.json": {"Recipe": {"Input": []}},
+    "Server/Models/Intelligent/Kweebec/LabubuBasic.json": {"AnimationSets": {"Idle": {"Animations": []}}},
+    "Server/Models/Intelligent/Kweebec/LabubuNoEars.json": {"AnimationSets": {"Idle": {"Animations": []}}},
+    "Server/NPC/Roles/Intelligent/Neutral/Kweebec/WalterWhite_Merchant.json": {"invulnerable": False},
+    "Server/Item/Items/Overworld_Portal_Key.json": {"Recipe": {"Input": []}},
+    "Server/YmmersiveMelodies/Default.json": {"Name": "Default"},
+    "Server/Drops/NPCs/Bench_Drop.json": {"Container": {}},
+}
+ITEM_CATEGORIES = ("Deco", "Bench", "Ingredient", "Portal", "Weapon", "Tool")
+
+
+def generate_mod_archive(path: str, items: int = 500, textures: int = 50, texture_kb: int = 32,
+                         models: int = 50, instances: int = 20, recipe_ratio: float = 0.5, seed: int = 0) -> dict:
+    """
+    Write a synthetic Hytale-style mod archive: manifest.json, item JSON
+    under Server/Item/Items/<Category>/, incompressible PNG-like textures and
+    models under Common/, a lowercase Server/instances tree and the members
+    in KNOWN_MEMBERS. Returns size and member counts.
+    """
+    rnd = random.Random(seed)
+    members = 0
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for name, doc in KNOWN_MEMBERS.items():
+            z.writestr(name, json.dumps(doc, indent=2))
+            members += 1
+        z.writestr("Common/Items/Consumables/Food/Carbonara.png", rnd.randbytes(texture_kb * 1024))
+        members += 1
+        for i in range(items):
+            category = ITEM_CATEGORIES[i % len(ITEM_CATEGORIES)]
+            item = {
+                "TranslationProperties": {"Name": f"server.items.Bench_{i}.name"},
+                "Model": f"Items/Bench/Model_{i % max(models, 1)}.blockymodel",
+                "Texture": f"Items/Bench/Texture_{i % max(textures, 1)}.png",
+                "Quality": rnd.choice(["Common", "Uncommon", "Rare", "Epic"]),
+                "ItemLevel": rnd.randint(1, 60),
+                "Tags": {"Type": [category]},
+            }
+            if rnd.random() < recipe_ratio:
+                item["Recipe"] = {"Input": [{"ItemId": f"Ingredient_{rnd.randint(0, 99)}", "Quantity": rnd.randint(1, 9)}],
+                                  "BenchRequirement": [{"Type": "Crafting", "Id": "Workbench"}]}
+            z.writestr(f"Server/Item/Items/{category}/Bench_Item_{i}.json", json.dumps(item, indent=2))
+            members += 1
+        for i in range(textures):
+            z.writestr(f"Common/Icons/ItemsGenerated/Texture_{i}.png", rnd.randbytes(texture_kb * 1024))
+            members += 1
+        for i in range(models):
+            model = {"nodes": [{"id": str(n), "position": [rnd.random() for _ in range(3)]} for n in range(50)]}
+            z.writestr(f"Common/Items/Bench/Model_{i}.blockymodel", json.dumps(model))
+            members += 1
+        for i in range(instances):
+            z.writestr(f"Server/instances/Bench_{i}/instance.bson", rnd.randbytes(4096))
+            members += 1
+    return {"bytes": os.path.getsize(path), "members": members}
+
+
+def mod_file_name_for(spec) -> str:
+    """
+    Build a file name the registry will route to spec.
+    """
+    name = spec.prefix or ''
+    name += 'Bench-'
+    if spec.contains:
+        name += spec.contains + '-'
+    name += '1.0.0'
+    if spec.suffix:
+        return name + spec.suffix
+    return name + ('.jar' if spec.output_ext == '.jar' else '.zip')
+
+
+def _timed_patch(patch_name: str, mod_path: str) -> dict:
+    spec = REGISTRY.get(patch_name)
+    start = time.perf_counter()
+    spec.fn(mod_path)
+    return {"seconds": time.perf_counter() - start, "peak_rss": max_rss()}
+
+
+def _timed_temp_dir(mod_path: str) -> dict:
+    start = time.perf_counter()
+    temp_dir, temp_zip_path = patches.create_temp_dir_for_modification(mod_path)
+    created = time.perf_counter()
+    try:
+        patches.rezip_temp_dir_into_patched(mod_path, temp_dir)
+    finally:
+        rezipped = time.perf_counter()
+        os.remove(temp_zip_path)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    peak = max_rss()
+    return {"create_temp_dir_for_modification": {"seconds": created - start, "peak_rss": peak},
+            "rezip_temp_dir_into_patched": {"seconds": rezipped - created, "peak_rss": peak}}
+
+
+def _timed_workspace(mod_path: str, backend: str) -> dict:
+    start = time.perf_counter()
+    with workspace.open_workspace(mod_path, backend=backend) as ws:
+        ws.write_zip(patched_output_path(mod_path))
+    return {"seconds": time.perf_counter() - start, "peak_rss": max_rss()}
+
+
+def _timed_pipeline(work_dir: str, argv: list) -> dict:
+    import build_external_mods
+    os.chdir(work_dir)
+    start = time.perf_counter()
+    build_external_mods.main(argv)
+    return {"seconds": time.perf_counter() - start, "peak_rss": max_rss()}
+
+
+def run_isolated(fn, *args) -> dict:
+    """
+    Run one measurement in a fresh worker process so peak RSS belongs to
+    that measurement alone.
+    """
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def summarize(name: str, runs: list, size: int, members: int) -> dict:
+    best = min(r["seconds"] for r in runs)
+    peaks = [r["peak_rss"] for r in runs if r["peak_rss"] is not None]
+    return {
+        "name": name,
+        "runs": len(runs),
+        "best_seconds": best,
+        "median_seconds": statistics.median(r["seconds"] for r in runs),
+        "input_bytes": size,
+        "members": members,
+        "mb_per_second": size / best / (1024 * 1024) if best else None,
+        "members_per_second": members / best if best else None,
+        "peak_rss_bytes": max(peaks) if peaks else None,
+    }
+
+
+def print_report(rows: list):
+    print(f"{'benchmark':<34} {'best s':>8} {'median s':>9} {'MB/s':>9} {'members/s':>11} {'peak RSS MB':>12}")
+    for row in rows:
+        rss = f"{row['peak_rss_bytes'] / (1024 * 1024):.1f}" if row["peak_rss_bytes"] else "n/a"
+        print(f"{row['name']:<34} {row['best_seconds']:>8.3f} {row['median_seconds']:>9.3f} "
+              f"{row['mb_per_second']:>9.1f} {row['members_per_second']:>11.0f} {rss:>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark patch functions and the build pipeline against synthetic mod archives")
+    parser.add_argument("--items", type=int, default=500, help="Item JSON files per archive (default: 500)")
+    parser.add_argument("--textures", type=int, default=50, help="PNG textures per archive (default: 50)")
+    parser.add_argument("--texture-kb", type=int, default=32, help="Size of each texture in KB (default: 32)")
+    parser.add_argument("--models", type=int, default=50, help="Model files per archive (default: 50)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, best and median are reported (default: 3)")
+    parser.add_argument("--patch", action="append", help="Only benchmark this registered patch (repeatable)")
+    parser.add_argument("--no-pipeline", action="store_true", help="Skip the full build_external_mods pipeline benchmark")
+    parser.add_argument("--pipeline-args", default="--force", help="Arguments passed to build_external_mods.main, e.g. --pipeline-args='--force --jobs 4' (default: --force)")
+    parser.add_argument("--json", dest="json_out", help="Also write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    specs = [spec for spec in REGISTRY if not args.patch or spec.name in args.patch]
+    work_dir = tempfile.mkdtemp(prefix="trw-bench-")
+    rows = []
+    try:
+        mods_dir = os.path.join(work_dir, "mods")
+        os.makedirs(mods_dir)
+        total_bytes = 0
+        total_members = 0
+        mod_paths = {}
+        for i, spec in enumerate(specs):
+            mod_path = os.path.join(mods_dir, mod_file_name_for(spec))
+            shape = generate_mod_archive(mod_path, items=args.items, textures=args.textures,
+                                         texture_kb=args.texture_kb, models=args.models, seed=i)
+            mod_paths[spec.name] = (mod_path, shape)
+            total_bytes += shape["bytes"]
+            total_members += shape["members"]
+        print(f"[BENCH] {len(specs)} synthetic mods, {total_members} members, {total_bytes / (1024 * 1024):.1f} MB in {work_dir}")
+
+        # The pipeline runs from work_dir and reads patch_data relative to it
+        os.symlink(os.path.abspath(PATCH_DATA_ROOT), os.path.join(work_dir, PATCH_DATA_ROOT))
+
+        if specs:
+            mod_path, shape = mod_paths[specs[0].name]
+            runs = [run_isolated(_timed_temp_dir, os.path.abspath(mod_path)) for _ in range(args.repeat)]
+            for stage in ("create_temp_dir_for_modification", "rezip_temp_dir_into_patched"):
+                rows.append(summarize(stage, [r[stage] for r in runs], shape["bytes"], shape["members"]))
+            for backend in workspace.BACKENDS:
+                runs = [run_isolated(_timed_workspace, os.path.abspath(mod_path), backend) for _ in range(args.repeat)]
+                rows.append(summarize(f"workspace ({backend})", runs, shape["bytes"], shape["members"]))
+
+        for spec in specs:
+            mod_path, shape = mod_paths[spec.name]
+            runs = [run_isolated(_timed_patch, spec.name, os.path.abspath(mod_path)) for _ in range(args.repeat)]
+            rows.append(summarize(spec.name, runs, shape["bytes"], shape["members"]))
+
+        if not args.no_pipeline and specs:
+            pipeline_argv = args.pipeline_args.split()
+            runs = [run_isolated(_timed_pipeline, work_dir, pipeline_argv) for _ in range(args.repeat)]
+            rows.append(summarize("build_external_mods.main", runs, total_bytes, total_members))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(rows)
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({"created": time.time(), "args": vars(args), "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+
+import sys
+
+CACHE_FILE_NAME = '.trw_build_cache.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def hash_file(path: str, h=None):
+    """
+    Feed a file into a hashlib object in chunks and return the object.
+    """
+    if h is None:
+        h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h
+
+
+def hash_patch_data(patch_data_dir: str, h=None):
+    """
+    Hash every file under patch_data_dir (relative path and contents) in a
+    stable order. A missing directory hashes the same as an empty one.
+    """
+    if h is None:
+        h = hashlib.sha256()
+    if not patch_data_dir or not os.path.isdir(patch_data_dir):
+        return h
+    for root, dirs, files in os.walk(patch_data_dir):
+        dirs.sort()
+        for fname in sorted(files):
+            full_path = os.path.join(root, fname)
+            rel_path = os.path.relpath(full_path, patch_data_dir).replace(os.path.sep, '/')
+            h.update(rel_path.encode('utf-8') + b'\0')
+            hash_file(full_path, h)
+    return h
+
+
+def _is_local(module) -> bool:
+    path = getattr(module, '__file__', None)
+    return bool(path) and os.path.dirname(os.path.abspath(path)) == SOURCE_DIR
+
+
+@functools.lru_cache(maxsize=None)
+def engine_modules(module_name: str) -> tuple:
+    """
+    The modules of this project a patch module imports, directly or through
+    each other, sorted by name. Editing any of them invalidates the cache,
+    so new engine modules are covered without listing them anywhere.
+    """
+    found = {}
+    todo = [sys.modules[module_name]]
+    while todo:
+        for ref in vars(todo.pop()).values():
+            dep = ref if inspect.ismodule(ref) else sys.modules.get(getattr(ref, '__module__', None) or '')
+            if dep is None or dep.__name__ == module_name or dep.__name__ in found or not _is_local(dep):
+                continue
+            found[dep.__name__] = dep
+            todo.append(dep)
+    return tuple(found[name] for name in sorted(found))
+
+
+def code_version(patch_fn) -> str:
+    """
+    Hash the source of a patch function, the same-module helpers it calls
+    and the engine modules, so editing any of them forces a rebuild.
+    """
+    h = hashlib.sha256()
+    if isinstance(patch_fn, functools.partial):
+        # Manifest patches: the manifest itself is hashed with patch_data
+        h.update(repr(patch_fn.keywords).encode('utf-8'))
+        patch_fn = patch_fn.func
+    module = inspect.getmodule(patch_fn)
+    seen = set()
+
+    def add(fn):
+        if fn in seen:
+            return
+        seen.add(fn)
+        h.update(inspect.getsource(fn).encode('utf-8'))
+        for name in fn.__code__.co_names:
+            ref = getattr(module, name, None)
+            if inspect.isfunction(ref) and ref.__module__ == module.__name__:
+                add(ref)
+
+    add(patch_fn)
+    for engine in engine_modules(module.__name__):
+        hash_file(inspect.getsourcefile(engine), h)
+    return h.hexdigest()
+
+
+def cache_key(mod_path: str, patch_data_dir: str, patch_fn, options: str = '', source_sha256: str = None) -> str:
+    """
+    options covers build settings that change the output bytes, such as the
+    compression policy. source_sha256 skips hashing mod_path when the hash
+    is already known (e.g. from the mod catalog).
+    """
+    if source_sha256 is None:
+        source_sha256 = hash_file(mod_path).hexdigest()
+    h = hashlib.sha256()
+    h.update(b'source\0' + source_sha256.encode('ascii'))
+    h.update(b'patch_data\0')
+    hash_patch_data(patch_data_dir, h)
+    h.update(b'code\0' + code_version(patch_fn).encode('ascii'))
+    h.update(b'options\0' + options.encode('utf-8'))
+    return h.hexdigest()
+
+
+class BuildCache:
+    """
+    Remembers, per source mod file, the cache key of its last successful
+    build and which files in the output directory it produced.
+    """
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, CACHE_FILE_NAME)
+        self.output_dir = output_dir
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def lookup(self, mod_file_name: str, key: str):
+        """
+        Return the recorded outputs if mod_file_name was last built with key
+        and all of its outputs are still present, otherwise None.
+        """
+        entry = self.entries.get(mod_file_name)
+        if not entry or entry.get('key') != key:
+            return None
+        outputs = entry.get('outputs') or []
+        if not outputs:
+            return None
+        for name in outputs:
+            if not os.path.isfile(os.path.join(self.output_dir, name)):
+                return None
+        return outputs
+
+    def record(self, mod_file_name: str, key: str, outputs: list):
+        self.entries[mod_file_name] = {'key': key, 'outputs': sorted(outputs)}
+
+    def forget(self, mod_file_name: str):
+        self.entries.pop(mod_file_name, None)
+
+    def owned_outputs(self) -> set:
+        owned = set()
+        for entry in self.entries.values():
+            owned.update(entry.get('outputs') or [])
+        return owned
+
+    def prune(self, mod_file_names):
+        """
+        Drop entries for mods that are no longer in mods/.
+        """
+        keep = set(mod_file_names)
+        for name in list(self.entries):
+            if name not in keep:
+                del self.entries[name]
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def stats_line(self) -> str:
+        return f"[CACHE] {self.hits} reused, {self.misses} rebuilt"
@@ -1,10 +1,37 @@
 import patches
+import instrumentation
+import build_settings
+import reproducible
+import patch_bundle
+import workspace
+from build_settings import BuildSettings
+from compression_policy import CompressionPolicy, CompressionPolicyError
+from patch_registry import REGISTRY, PATCH_DATA_ROOT
+from mod_watcher import ChangeWatcher
+from build_cache import BuildCache, cache_key, hash_file, CACHE_FILE_NAME
+from mod_catalog import ModCatalog, CATALOG_FILE_NAME, MOD_EXTENSIONS
 import os
+import sys
+import time
+import argparse
+import traceback
+import json
+from concurrent.futures import ProcessPoolExecutor
 
-def get_all_mod_sources() -> list:
+OUTPUT_DIR = "mods/patched"
+# sha256sum-style listing of the outputs, written in deterministic mode
+CHECKSUMS_FILE_NAME = "SHA256SUMS"
+
+def get_all_mod_sources(clean: bool = True) -> list:
+    """
+    List the mod files in mods/. With clean, everything in mods/patched is
+    removed first so every mod is rebuilt from scratch.
+    """
     os.makedirs("mods", exist_ok=True)
-    output_dir = "mods/patched"
+    output_dir = OUTPUT_DIR
     os.makedirs(output_dir, exist_ok=True)
+    if not clean:
+        return [f for f in os.listdir("mods") if os.path.isfile(os.path.join("mods", f))]
     import shutil
     for entry in os.listdir(output_dir):
         path = os.path.join(output_dir, entry)
@@ -18,46 +45,443 @@ def get_all_mod_sources() -> list:
     files = [f for f in os.listdir("mods") if os.path.isfile(os.path.join("mods", f))]
     return files
 
-def main():
-    mods = get_all_mod_sources()
+def make_settings(args, compression: str, dry_run: bool = False) -> BuildSettings:
+    """
+    The BuildSettings for the command line: compression is a compression
+    policy spec (see compression_policy), and patch_data bundles are kept
+    in the output folder unless --no-bundles.
+    """
+    return BuildSettings(
+        policy=CompressionPolicy.parse(compression) if compression else None,
+        deterministic=args.deterministic,
+        dry_run=dry_run,
+        pipeline_workers=args.pipeline,
+        compress_workers=args.compress_threads,
+        memory_ceiling=args.memory_ceiling * 1024 * 1024 if args.memory_ceiling else None,
+        bundle_dir=None if args.no_bundles else os.path.join(OUTPUT_DIR, patch_bundle.BUNDLE_DIR_NAME),
+        workspace_backend=args.workspace,
+    )
+
+def run_patch(patch_fn, mod_path: str, settings: BuildSettings, profile: bool = False) -> dict:
+    """
+    Run a single patch function with settings active and report how it
+    went. Exceptions are captured so one broken mod does not stop the rest
+    of the build. With profile, the per-stage instrumentation snapshot is
+    attached. Peak RSS while patching is always reported.
+    """
+    if profile:
+        instrumentation.enable()
+        instrumentation.reset()
+    start = time.perf_counter()
+    result = {"mod": os.path.basename(mod_path), "ok": True, "error": None}
+    with instrumentation.track_peak_rss() as memory, build_settings.use(settings):
+        try:
+            patch_fn(mod_path)
+        except Exception as e:
+            result["ok"] = False
+            result["error"] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+    result["seconds"] = time.perf_counter() - start
+    result["peak_rss"] = memory["peak_rss"]
+    if profile:
+        result["profile"] = instrumentation.snapshot()
+        instrumentation.disable()
+    return result
+
+def patched_outputs(spec, mod_path: str) -> list:
+    """
+    Return the names of the files in the output directory produced for
+    mod_path by its patch.
+    """
+    out_path = spec.output_path(mod_path)
+    if os.path.isfile(out_path):
+        return [os.path.basename(out_path)]
+    return []
+
+def remove_unowned_outputs(output_dir: str, owned: set):
+    """
+    Delete anything in the output directory that no current mod produced.
+    """
+    import shutil
+    for entry in os.listdir(output_dir):
+        if entry in owned or entry in (CACHE_FILE_NAME, CHECKSUMS_FILE_NAME, patch_bundle.BUNDLE_DIR_NAME) \
+                or entry.startswith(CATALOG_FILE_NAME):
+            continue
+        path = os.path.join(output_dir, entry)
+        try:
+            if os.path.isfile(path) or os.path.islink(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+        except Exception:
+            pass
+
+def write_checksums(output_dir: str, names) -> str:
+    """
+    Write a sha256sum-compatible listing of the given outputs so downstream
+    sync can tell which patched mods actually changed.
+    """
+    path = os.path.join(output_dir, CHECKSUMS_FILE_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for name in sorted(names):
+            f.write(f"{hash_file(os.path.join(output_dir, name)).hexdigest()}  {name}\n")
+    os.replace(tmp_path, path)
+    return path
+
+def print_summary(results: list, wall_seconds: float):
+    if not results:
+        return
+    print("\n[SUMMARY]")
+    width = max(len(r["mod"]) for r in results)
+    for r in results:
+        status = "CACHED" if r.get("cached") else ("OK" if r["ok"] else "FAILED")
+        peak = f"{r['peak_rss'] / (1024 * 1024):.0f} MB peak" if r.get("peak_rss") else ""
+        line = f"  {r['mod']:<{width}}  {status:<6}  {r['seconds']:.2f}s  {peak:>12}".rstrip()
+        if r["error"]:
+            line += f"  ({r['error']})"
+        print(line)
+    failed = sum(1 for r in results if not r["ok"])
+    cached = sum(1 for r in results if r.get("cached"))
+    print(f"  {len(results) - failed - cached} patched, {cached} cached, {failed} failed in {wall_seconds:.2f}s")
+
+def print_profile(results: list):
+    for r in results:
+        if not r.get("profile"):
+            continue
+        print(f"\n[PROFILE] {r['mod']} ({r['seconds']:.3f}s)")
+        for line in instrumentation.format_profile(r["profile"]):
+            print(line)
+
+def write_profile_json(results: list, path: str):
+    report = {
+        "created": time.time(),
+        "mods": [{k: r.get(k) for k in ("mod", "ok", "cached", "seconds", "peak_rss", "error", "profile")} for r in results],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+def identify_mod(catalog: ModCatalog, mod_file_name: str):
+    """
+    Find the patch for a mod file: a patch declaring its manifest.json id
+    first, then the file name rules, then the id -> patch fingerprint
+    learned from an earlier build (so renamed downloads still match).
+    Returns (spec, how, mod_id, version); spec is None if unrecognized.
+    """
+    mod_id, version = catalog.identity(mod_file_name)
+    if mod_id:
+        spec = REGISTRY.match_id(mod_id)
+        if spec is not None:
+            return spec, "manifest id", mod_id, version
+    spec = REGISTRY.match(mod_file_name)
+    if spec is not None:
+        return spec, "file name", mod_id, version
+    # Only trust a learned id when no other mod file carries it, since
+    # copies and forks sometimes keep the original manifest
+    if mod_id and catalog.archives_with_id(mod_id) == [mod_file_name]:
+        learned = catalog.fingerprint(mod_id)
+        if learned is not None and REGISTRY.get(learned[0]) is not None:
+            return REGISTRY.get(learned[0]), "learned id", mod_id, version
+    return None, None, mod_id, version
+
+def version_problem(catalog: ModCatalog, spec, mod_id: str, version: str):
+    """
+    Return (error, warning) about the mod's version: an error if the patch
+    declares versions and this is not one of them, a warning if it differs
+    from the version the patch was last built against.
+    """
+    if not spec.supports_version(version):
+        return f"version {version or 'unknown'} not supported, expected {' or '.join(spec.versions)}", None
+    learned = catalog.fingerprint(mod_id) if mod_id else None
+    if learned is not None and learned[0] == spec.name and learned[1] != version:
+        return None, f"{mod_id} changed from version {learned[1] or 'unknown'} to {version or 'unknown'} since the last build"
+    return None, None
+
+def print_patch_listing(mods: list):
+    """
+    Show the registered patches and which mod files each one would handle.
+    """
+    print("[REGISTRY]")
+    for spec in REGISTRY:
+        data = spec.patch_data_dir or "-"
+        print(f"  {spec.name:<22} {spec.describe():<40} patch_data: {data:<30} output: *-trw{spec.output_ext}")
+    if mods:
+        print("[MODS]")
+        with ModCatalog(os.path.join(OUTPUT_DIR, CATALOG_FILE_NAME)) as catalog:
+            catalog.refresh("mods", [m for m in mods if m.lower().endswith(MOD_EXTENSIONS)])
+            for mod_file_name in mods:
+                if "trw" in mod_file_name:
+                    print(f"  {mod_file_name} -> not recognized")
+                    continue
+                spec, how, mod_id, version = identify_mod(catalog, mod_file_name)
+                ident = f" [{mod_id} {version or ''}]".replace(" ]", "]") if mod_id else ""
+                if spec is None:
+                    print(f"  {mod_file_name}{ident} -> not recognized")
+                    continue
+                error, warning = version_problem(catalog, spec, mod_id, version)
+                note = f" ({error or warning})" if error or warning else ""
+                print(f"  {mod_file_name}{ident} -> {spec.name} by {how}{note}")
+
+def _mb(n: int) -> str:
+    if n < 1024 * 1024:
+        return f"{n / 1024:.1f} KB"
+    return f"{n / (1024 * 1024):.2f} MB"
+
+def print_plan(mod_file_name: str, spec, plans: list):
+    for p in plans:
+        print(f"[PLAN] {mod_file_name} -> {os.path.basename(p['output'])} ({spec.name})")
+        notes = ""
+        if p["bulk_candidates"]:
+            notes += f", {p['bulk_candidates']} bulk transform candidates"
+        print(f"    members: {p['kept']} kept ({p['replaced']} replaced, {p['modified']} modified, {p['renamed']} renamed), "
+              f"{p['added']} added, {p['dropped']} dropped{notes}")
+        print(f"    size: {_mb(os.path.getsize(p['source']))} -> ~{_mb(p['output_size'])}, "
+              f"inflate {_mb(p['inflate_bytes'])}, deflate {_mb(p['deflate_bytes'])}")
+
+def plan(args, compression: str) -> int:
+    """
+    Dry run: run each recognized mod's patch with archive writes resolved
+    against the central directory only, and print what the build would
+    keep, drop and replace and roughly what it would cost. Nothing is
+    extracted or written and the build cache is left alone.
+    """
+    mods = get_all_mod_sources(clean=False)
+    totals = {"output_size": 0, "inflate_bytes": 0, "deflate_bytes": 0}
+    failed = 0
+    with ModCatalog(os.path.join(OUTPUT_DIR, CATALOG_FILE_NAME)) as catalog:
+        catalog.refresh("mods", [m for m in mods if m.lower().endswith(MOD_EXTENSIONS)])
+        for mod_file_name in mods:
+            if "trw" in mod_file_name:
+                continue
+            spec, how, mod_id, version = identify_mod(catalog, mod_file_name)
+            if spec is None:
+                print(f"[WARNING] {mod_file_name} not recognized")
+                continue
+            error, warning = version_problem(catalog, spec, mod_id, version)
+            if error or warning:
+                print(f"[WARNING] {mod_file_name}: {error or warning}")
+            settings = make_settings(args, compression, dry_run=True)
+            try:
+                with build_settings.use(settings):
+                    spec.fn(f"mods/{mod_file_name}")
+            except Exception as e:
+                failed += 1
+                print(f"[PLAN] {mod_file_name}: could not plan ({type(e).__name__}: {e})")
+            plans = settings.plans
+            print_plan(mod_file_name, spec, plans)
+            for p in plans:
+                for k in totals:
+                    totals[k] += p[k]
+    print(f"\n[PLAN] Total: ~{_mb(totals['output_size'])} output, inflate {_mb(totals['inflate_bytes'])}, "
+          f"deflate {_mb(totals['deflate_bytes'])}")
+    return 1 if failed else 0
+
+def build(args, compression: str, build_options: str, only=None, clean: bool = False) -> int:
+    """
+    One build pass over mods/. With `only`, just those mod file names are
+    considered for rebuilding; the cache still covers every mod so outputs
+    of the others are kept.
+    """
+    profile = args.profile or bool(args.profile_json)
+    settings = make_settings(args, compression)
+    start = time.perf_counter()
+    mods = get_all_mod_sources(clean=clean)
+    cache = BuildCache(OUTPUT_DIR)
+    catalog = ModCatalog(os.path.join(OUTPUT_DIR, CATALOG_FILE_NAME))
+    catalog.refresh("mods", [m for m in mods if m.lower().endswith(MOD_EXTENSIONS)])
+    results = []
+    jobs = []
     for mod_file_name in mods:
         mod_path = f"mods/{mod_file_name}"
         if "trw" in mod_file_name:
             continue
-        if "ymmersive-melodies" in mod_file_name:
-            print("[PATCHER] Found ymmersive-melodies mod -> Swapping default songs")
-            patches.ymmersive_melodies_patch_new_default_songs(mod_path)
-        elif "SNIP3_FoodPack" in mod_file_name and mod_file_name.endswith(".zip"):
-            print("Found SNIP3'S Food Pack -> Cleaning + Generating Spaghetti")
-            patches.snip3_foodpack_apply_patch(mod_path)
-        elif "EpicsLabubuPets" in mod_file_name:
-            print("Found Labubu Mod, Making it expensive like the real stuff")
-            patches.epics_labubu_patch(mod_path)
-        elif mod_file_name.startswith("GAMBLING"):
-            print("Found Gambling -> Adjusting loot table and coin ingredients")
-            patches.patch_gambling(mod_path)
-        elif mod_file_name.startswith("Teto_Plush"):
-            print("TETO -> Removing Crafting Recipe")
-            patches.patch_teto_plush(mod_path)
-        elif mod_file_name.startswith("Violets_Plushies"):
-            print("VIOLET -> Removing Crafting Recipe")
-            patches.patch_violet_plushie(mod_path)
-        elif mod_file_name.startswith("Dungeon.Khaos"):
-            print("KHAOS DUNGEON -> Making it more expensive")
-            patches.patch_khaos(mod_path)
-        elif mod_file_name.startswith("Lucky-Blocks"):
-            print("LUCKY BLOCK -> REMOVING CRAFTING")
-            patches.patch_lucky_block(mod_path)
-        elif mod_file_name.startswith("WalterWhite"):
-            print("Adjusting Walter White Shops")
-            patches.patch_walter_white(mod_path)
-        elif mod_file_name.startswith("Resurrectable"):
-            print("Resurrectable Dinos -> REMOVING CRAFTING")
-            patches.patch_ressurectable_dinos(mod_path)
-        elif mod_file_name.startswith("Stray123.TheOverworld"):
-            patches.patch_overworld(mod_path)
-        else:
+        if only is not None and mod_file_name not in only:
+            continue
+        spec, how, mod_id, version = identify_mod(catalog, mod_file_name)
+        if spec is None:
             print(f"[WARNING] {mod_file_name} not recognized")
+            continue
+        error, warning = version_problem(catalog, spec, mod_id, version)
+        if error and not args.ignore_versions:
+            print(f"[WARNING] {mod_file_name}: {error}, skipping (use --ignore-versions to patch anyway)")
+            results.append({"mod": mod_file_name, "ok": False, "cached": False, "error": error, "seconds": 0.0})
+            cache.forget(mod_file_name)
+            continue
+        if error or warning:
+            print(f"[WARNING] {mod_file_name}: {error or warning}")
+        key = cache_key(mod_path, spec.patch_data_dir, spec.fn, options=build_options,
+                        source_sha256=catalog.archive_sha256("mods", mod_file_name))
+        if cache.lookup(mod_file_name, key) is not None:
+            cache.hits += 1
+            print(f"[CACHE] {mod_file_name} unchanged, reusing previous output")
+            results.append({"mod": mod_file_name, "ok": True, "cached": True, "error": None, "seconds": 0.0})
+            continue
+        cache.misses += 1
+        if spec.message:
+            print(spec.message)
+        results.append(None)
+        jobs.append((len(results) - 1, spec, mod_path, key, mod_id, version))
+
+    if args.jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(run_patch, spec.fn, mod_path, settings, profile) for _, spec, mod_path, *_ in jobs]
+            job_results = [f.result() for f in futures]
+    else:
+        job_results = [run_patch(spec.fn, mod_path, settings, profile) for _, spec, mod_path, *_ in jobs]
+
+    for (slot, spec, mod_path, key, mod_id, version), result in zip(jobs, job_results):
+        results[slot] = result
+        mod_file_name = os.path.basename(mod_path)
+        if result["ok"]:
+            cache.record(mod_file_name, key, patched_outputs(spec, mod_path))
+            if mod_id:
+                catalog.learn(mod_id, spec.name, version)
+        else:
+            cache.forget(mod_file_name)
+    catalog.close()
+
+    cache.prune(mods)
+    remove_unowned_outputs(OUTPUT_DIR, cache.owned_outputs())
+    cache.save()
+    checksums_path = os.path.join(OUTPUT_DIR, CHECKSUMS_FILE_NAME)
+    if args.deterministic:
+        write_checksums(OUTPUT_DIR, cache.owned_outputs())
+    elif os.path.exists(checksums_path):
+        # Outputs are no longer reproducible, a stale listing would mislead sync
+        os.remove(checksums_path)
+
+    print_summary(results, time.perf_counter() - start)
+    print(cache.stats_line())
+    if profile:
+        print_profile(results)
+    if args.profile_json:
+        write_profile_json(results, args.profile_json)
+    return 1 if any(not r["ok"] for r in results) else 0
+
+def affected_mods(changed, mods: list):
+    """
+    Map changed paths under mods/ and patch_data/ to the mod files whose
+    output depends on them. Returns None when a full pass is needed (a mod
+    was removed, so its output and cache entry must be pruned).
+    """
+    names = set()
+    by_patch_data = None
+    for path in changed:
+        parts = os.path.relpath(path).replace(os.path.sep, "/").split("/")
+        if parts[0] == "mods" and len(parts) == 2:
+            if not os.path.exists(path):
+                return None
+            names.add(parts[1])
+        elif parts[0] == PATCH_DATA_ROOT and len(parts) > 2:
+            if by_patch_data is None:
+                by_patch_data = mods_by_patch_data(mods)
+            names.update(by_patch_data.get(parts[1], ()))
+        elif path.endswith(".py"):
+            print(f"[WATCH] {path} changed, restart the watcher to pick up code changes")
+    return names
+
+def mods_by_patch_data(mods: list) -> dict:
+    """
+    {patch_data folder: [mod file names]} for the recognized mods.
+    """
+    by_patch_data = {}
+    with ModCatalog(os.path.join(OUTPUT_DIR, CATALOG_FILE_NAME)) as catalog:
+        catalog.refresh("mods", [m for m in mods if m.lower().endswith(MOD_EXTENSIONS)])
+        for mod_file_name in mods:
+            spec = identify_mod(catalog, mod_file_name)[0]
+            if spec is not None and spec.patch_data:
+                by_patch_data.setdefault(spec.patch_data, []).append(mod_file_name)
+    return by_patch_data
+
+def _watch_ignored(path: str) -> bool:
+    rel = os.path.relpath(path).replace(os.path.sep, "/")
+    return rel == OUTPUT_DIR or rel.startswith(OUTPUT_DIR + "/") or rel.endswith(".tmp")
+
+def watch(args, compression: str, build_options: str) -> int:
+    """
+    Build once, then rebuild only the mods affected by each debounced batch
+    of changes in mods/ and patch_data/ until interrupted.
+    """
+    build(args, compression, build_options, clean=args.force)
+    watcher = ChangeWatcher(["mods", PATCH_DATA_ROOT], ignore=_watch_ignored).start()
+    print(f"[WATCH] Watching mods/ and {PATCH_DATA_ROOT}/ ({watcher.backend}), Ctrl+C to stop")
+    try:
+        while True:
+            changed = watcher.wait()
+            mods = get_all_mod_sources(clean=False)
+            only = affected_mods(changed, mods)
+            if only is not None and not only:
+                continue
+            print(f"\n[WATCH] {len(changed)} change(s) -> rebuilding {', '.join(sorted(only)) if only is not None else 'all mods'}")
+            build(args, compression, build_options, only=only)
+    except KeyboardInterrupt:
+        print("\n[WATCH] Stopped")
+    finally:
+        watcher.stop()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Patch every recognized mod in mods/ into mods/patched")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of mods to patch in parallel worker processes (default: 1)")
+    parser.add_argument("--force", action="store_true", help="Ignore the build cache, wipe mods/patched and rebuild every mod")
+    parser.add_argument("--profile", action="store_true", help="Print a per-mod, per-stage timing and I/O breakdown")
+    parser.add_argument("--profile-json", metavar="PATH", help="Write the --profile breakdown as JSON to PATH (implies --profile)")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="N",
+                        help="Write each archive as a read -> transform (N threads) -> compress/write pipeline, "
+                             "overlapping I/O and compression within one mod (default: 0, off)")
+    parser.add_argument("--compress-threads", type=int, default=0, metavar="N",
+                        help="Compress the members of each archive on N threads and append them in order, "
+                             "instead of one by one (default: 0, off; takes precedence over --pipeline)")
+    parser.add_argument("--memory-ceiling", type=int, metavar="MB",
+                        help="Stream members larger than MB in chunks instead of reading them whole, bounding memory for huge asset packs "
+                             "(members that need a transform are still read whole)")
+    parser.add_argument("--compression", metavar="SPEC",
+                        help="Per-extension compression for written members, e.g. 'png=store,ogg=store,json=deflate:9,*=deflate:6' "
+                             "or the preset 'assets'. Methods: store, deflate, bzip2, lzma (zstd on Python 3.14+)")
+    parser.add_argument("--no-bundles", action="store_true",
+                        help=f"Compress patch_data files on every build instead of splicing them from the precompressed bundles "
+                             f"kept in {OUTPUT_DIR}/{patch_bundle.BUNDLE_DIR_NAME}")
+    parser.add_argument("--workspace", choices=workspace.BACKENDS, default="memory",
+                        help="Where workspace-based patches keep the mod's files while editing them: in memory, untouched members copied "
+                             "raw (default), or extracted to a temp dir (under TMPDIR, e.g. a tmpfs)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Reproducible outputs: sorted members, fixed timestamps (SOURCE_DATE_EPOCH or 1980-01-01) and permissions "
+                             f"(member contents are untouched), plus a {CHECKSUMS_FILE_NAME} file in {OUTPUT_DIR}")
+    parser.add_argument("--watch", action="store_true",
+                        help=f"After building, watch mods/ and {PATCH_DATA_ROOT}/ and rebuild only the affected mods on every change "
+                             "(uses watchdog if installed, polling otherwise)")
+    parser.add_argument("--ignore-versions", action="store_true",
+                        help="Patch mods whose manifest.json version is not one the patch declares support for, instead of skipping them")
+    parser.add_argument("--plan", action="store_true",
+                        help="Dry run: show per mod the members kept, dropped and replaced, the estimated output size and "
+                             "inflate/deflate work, without extracting or writing anything")
+    parser.add_argument("--list", action="store_true", help="List registered patches and the mods they match, then exit without building")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        mods = sorted(f for f in os.listdir("mods") if os.path.isfile(os.path.join("mods", f))) if os.path.isdir("mods") else []
+        print_patch_listing(mods)
+        return 0
+
+    compression = None
+    if args.compression:
+        try:
+            policy = CompressionPolicy.parse(args.compression)
+        except CompressionPolicyError as e:
+            parser.error(str(e))
+        compression = policy.spec()
+        if policy.unsafe_methods():
+            print(f"[WARNING] {', '.join(policy.unsafe_methods())} compressed members may not load in the game")
+
+    build_options = f"compression={compression or ''};workspace={args.workspace}"
+    if args.deterministic:
+        build_options += f";deterministic={reproducible.fixed_date_time()}"
+
+    if args.plan:
+        return plan(args, compression)
+    if args.watch:
+        return watch(args, compression, build_options)
+    return build(args, compression, build_options, clean=args.force)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
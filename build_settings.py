@@ -0,0 +1,67 @@
+import contextlib
+
+
+class BuildSettings:
+    """
+    How a build writes archives: the compression policy, deterministic
+    output, dry run, pipeline and compress worker counts, the memory
+    ceiling, the patch_data bundle folder and the workspace backend.
+    ZipOverlay.write, open_workspace and zip_directory take one explicitly,
+    or use the one activated with use() (defaults when none is).
+    """
+
+    def __init__(self, policy=None, deterministic: bool = False, dry_run: bool = False,
+                 pipeline_workers: int = 0, compress_workers: int = 0, memory_ceiling: int = None,
+                 bundle_dir: str = None, workspace_backend: str = 'memory'):
+        # A CompressionPolicy, or None to use what each writer asks for
+        self.policy = policy
+        # Sorted members and fixed timestamps and permissions, so identical
+        # inputs give byte-identical outputs
+        self.deterministic = deterministic
+        # Writers resolve their member decisions against the central
+        # directory, record an estimate and write nothing
+        self.dry_run = dry_run
+        self.pipeline_workers = pipeline_workers or 0
+        self.compress_workers = compress_workers or 0
+        # Members above this many bytes that need no transform are streamed
+        # in chunks instead of being read whole. None = off
+        self.memory_ceiling = memory_ceiling or None
+        # None writes patch_data files the normal way
+        self.bundle_dir = bundle_dir
+        self.workspace_backend = workspace_backend
+        # Estimates recorded by writers in dry-run mode
+        self.plans = []
+
+    def resolve(self, name: str, compression: int):
+        """
+        (compress_type, compresslevel) for a written member: the policy's
+        choice, or `compression` at the default level without a policy.
+        """
+        if self.policy is None:
+            return compression, None
+        return self.policy.resolve(name, compression)
+
+    def record(self, plan: dict):
+        self.plans.append(plan)
+
+
+_current = BuildSettings()
+
+
+def current() -> BuildSettings:
+    return _current
+
+
+@contextlib.contextmanager
+def use(settings: BuildSettings):
+    """
+    Make settings the ones current() returns for the duration of the block,
+    e.g. while a patch function runs.
+    """
+    global _current
+    previous = _current
+    _current = settings
+    try:
+        yield settings
+    finally:
+        _current = previous
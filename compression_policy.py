@@ -0,0 +1,128 @@
+import os
+import zipfile
+
+METHODS = {
+    'store': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+# Accepted compresslevel range per method; None means the method takes no
+# level (lzma always uses its preset, store does not compress)
+LEVELS = {
+    'store': None,
+    'deflate': (-1, 9),
+    'bzip2': (1, 9),
+    'lzma': None,
+}
+if hasattr(zipfile, 'ZIP_ZSTANDARD'):
+    from compression.zstd import CompressionParameter
+    METHODS['zstd'] = zipfile.ZIP_ZSTANDARD
+    LEVELS['zstd'] = CompressionParameter.compression_level.bounds()
+
+# Named policies usable in a --compression spec. 'assets' stops spending CPU
+# on textures and audio that are already compressed
+PRESETS = {
+    'assets': 'png=store,ogg=store,midi=store,json=deflate:9',
+}
+
+# Only store and deflate are guaranteed to load in the game; the others are
+# for tooling and size experiments
+GAME_SAFE_METHODS = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+
+class CompressionPolicyError(ValueError):
+    pass
+
+
+class CompressionPolicy:
+    """
+    Chooses the compression method and level for each member written to a
+    patched archive by file extension, e.g. parsed from
+    "png=store,json=deflate:9,*=deflate:6". Extensions without a rule use
+    the default rule ("*"), or the compression the patch asked for.
+    """
+
+    def __init__(self, rules: dict = None, default: tuple = None):
+        self.rules = dict(rules or {})
+        self.default = default
+
+    @classmethod
+    def parse(cls, spec: str) -> 'CompressionPolicy':
+        policy = cls()
+        for item in (spec or '').split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if item in PRESETS:
+                preset = cls.parse(PRESETS[item])
+                policy.rules.update(preset.rules)
+                if preset.default is not None:
+                    policy.default = preset.default
+                continue
+            if '=' not in item:
+                raise CompressionPolicyError(f"Expected ext=method[:level] or a preset ({', '.join(PRESETS)}), got {item!r}")
+            ext, rule = item.split('=', 1)
+            rule = _parse_rule(rule.strip())
+            ext = ext.strip().lower().lstrip('.')
+            if ext == '*':
+                policy.default = rule
+            else:
+                policy.rules[ext] = rule
+        return policy
+
+    def resolve(self, name: str, compression: int):
+        """
+        Return (compress_type, compresslevel) for an archive member; a level
+        of None means the zipfile default.
+        """
+        ext = os.path.splitext(name)[1].lower().lstrip('.')
+        if ext in self.rules:
+            return self.rules[ext]
+        if self.default is not None:
+            return self.default
+        return compression, None
+
+    def spec(self) -> str:
+        """
+        Canonical text form, stable for equal policies (used in cache keys).
+        """
+        items = [f"{ext}={_format_rule(rule)}" for ext, rule in sorted(self.rules.items())]
+        if self.default is not None:
+            items.append(f"*={_format_rule(self.default)}")
+        return ','.join(items)
+
+    def unsafe_methods(self) -> list:
+        rules = list(self.rules.values()) + ([self.default] if self.default else [])
+        return sorted({_method_name(method) for method, _ in rules if method not in GAME_SAFE_METHODS})
+
+
+def _parse_rule(rule: str):
+    method, _, level = rule.partition(':')
+    method = method.strip().lower()
+    if method not in METHODS:
+        raise CompressionPolicyError(f"Unknown compression method {method!r}, expected one of {', '.join(METHODS)}")
+    if not level:
+        return METHODS[method], None
+    if LEVELS[method] is None:
+        raise CompressionPolicyError(f"{method} does not take a compression level, got {method}:{level}")
+    try:
+        level = int(level)
+    except ValueError:
+        raise CompressionPolicyError(f"Compression level must be a number, got {level!r}")
+    low, high = LEVELS[method]
+    if not low <= level <= high:
+        raise CompressionPolicyError(f"{method} compression level must be between {low} and {high}, got {level}")
+    return METHODS[method], level
+
+
+def _method_name(method: int) -> str:
+    for name, value in METHODS.items():
+        if value == method:
+            return name
+    return str(method)
+
+
+def _format_rule(rule: tuple) -> str:
+    method, level = rule
+    return _method_name(method) if level is None else f"{_method_name(method)}:{level}"
@@ -0,0 +1,48 @@
+import zlib
+import zipfile
+
+# Zip record sizes without the file name: local file header, central
+# directory header and end of central directory record
+LOCAL_HEADER_SIZE = 30
+CENTRAL_HEADER_SIZE = 46
+END_RECORD_SIZE = 22
+# Replacement content is deflated up to this many bytes to guess its ratio
+SAMPLE_BYTES = 64 * 1024
+
+def new_plan(source: str, output: str) -> dict:
+    return {"source": source, "output": output, "kept": 0, "dropped": 0, "replaced": 0, "added": 0,
+            "modified": 0, "renamed": 0, "bulk_candidates": 0, "output_size": END_RECORD_SIZE,
+            "inflate_bytes": 0, "deflate_bytes": 0}
+
+
+def add_member(plan: dict, name: str, compress_size: int):
+    """
+    Count a member's compressed bytes plus its local and central headers
+    towards the estimated output size.
+    """
+    plan["output_size"] += compress_size + LOCAL_HEADER_SIZE + CENTRAL_HEADER_SIZE + 2 * len(name.encode('utf-8'))
+
+
+def deflate_ratio(infos) -> float:
+    """
+    compress_size / file_size over the compressed members of an archive,
+    used to guess how well new content will compress. 1.0 if none are.
+    """
+    packed = sum(i.compress_size for i in infos if i.compress_type != zipfile.ZIP_STORED)
+    unpacked = sum(i.file_size for i in infos if i.compress_type != zipfile.ZIP_STORED)
+    return min(1.0, packed / unpacked) if unpacked else 1.0
+
+
+def sample_ratio(source) -> float:
+    """
+    Deflated / raw size of the start of a replacement (bytes or a path).
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            sample = f.read(SAMPLE_BYTES)
+    else:
+        sample = bytes(source[:SAMPLE_BYTES])
+    if not sample:
+        return 1.0
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return min(1.0, len(compressor.compress(sample) + compressor.flush()) / len(sample))
@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Instrumentation is opt-in and per process; when disabled span() and count()
+# return immediately so the patch pipeline pays next to nothing for them
+_enabled = False
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time the enclosed block under `name`. Spans with the same name add up,
+    nested spans are each timed inclusively.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            entry = _spans.setdefault(name, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += 1
+
+
+def count(name: str, n: int = 1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot() -> dict:
+    """
+    Return the collected spans and counters as plain (picklable, JSON-able)
+    data: {"spans": {name: {"seconds", "calls"}}, "counters": {name: n}}.
+    """
+    with _lock:
+        return {
+            "spans": {name: {"seconds": s, "calls": c} for name, (s, c) in _spans.items()},
+            "counters": dict(_counters),
+        }
+
+
+def format_profile(profile: dict, indent: str = "    ") -> list:
+    """
+    Render a snapshot as text lines, slowest span first.
+    """
+    lines = []
+    spans = sorted(profile.get("spans", {}).items(), key=lambda kv: kv[1]["seconds"], reverse=True)
+    for name, s in spans:
+        lines.append(f"{indent}{name:<26} {s['seconds']:>8.3f}s  x{s['calls']}")
+    for name, n in sorted(profile.get("counters", {}).items()):
+        value = f"{n / (1024 * 1024):.2f} MB" if name.startswith("bytes_") else str(n)
+        lines.append(f"{indent}{name:<26} {value:>9}")
+    return lines
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, or None where /proc is not
+    available.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def max_rss():
+    """
+    Highest resident set size of this process so far in bytes, or None
+    where the resource module is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@contextmanager
+def track_peak_rss(interval: float = RSS_SAMPLE_INTERVAL):
+    """
+    Sample RSS on a background thread while the block runs and store the
+    highest value in the yielded dict as "peak_rss" (bytes). Without /proc
+    the process-lifetime maximum is reported instead.
+    """
+    result = {"peak_rss": None}
+    if current_rss() is None:
+        try:
+            yield result
+        finally:
+            result["peak_rss"] = max_rss()
+        return
+    stop = threading.Event()
+    peak = [current_rss()]
+
+    def sample():
+        while not stop.wait(interval):
+            rss = current_rss()
+            if rss is not None and rss > peak[0]:
+                peak[0] = rss
+    thread = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+    thread.start()
+    try:
+        yield result
+    finally:
+        stop.set()
+        thread.join()
+        rss = current_rss()
+        result["peak_rss"] = max(peak[0], rss or 0)
@@ -0,0 +1,173 @@
+import copy
+import json
+
+
+class JsonPatchError(ValueError):
+    pass
+
+
+def loads_json_bytes(data: bytes):
+    return json.loads(data.decode('utf-8'))
+
+
+def dumps_json_bytes(doc) -> bytes:
+    """
+    Serialize a document the same way patches.dump_json_file writes it.
+    """
+    return json.dumps(doc, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def parse_pointer(pointer) -> list:
+    """
+    Split an RFC 6901 JSON pointer ('/AnimationSets/Idle/Animations') into
+    its reference tokens. A list of keys is accepted as-is.
+    """
+    if isinstance(pointer, list):
+        return [str(t) for t in pointer]
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError(f"JSON pointer must start with '/': {pointer!r}")
+    return [t.replace('~1', '/').replace('~0', '~') for t in pointer[1:].split('/')]
+
+
+def _child(node, token: str, pointer):
+    if isinstance(node, dict):
+        if token not in node:
+            raise JsonPatchError(f"Path not found: {pointer!r}")
+        return node[token]
+    if isinstance(node, list):
+        return node[_list_index(node, token, pointer)]
+    raise JsonPatchError(f"Cannot descend into {type(node).__name__} at {pointer!r}")
+
+
+def _list_index(node: list, token: str, pointer, allow_end: bool = False) -> int:
+    if token == '-' and allow_end:
+        return len(node)
+    if not token.isdigit():
+        raise JsonPatchError(f"Invalid list index {token!r} in {pointer!r}")
+    index = int(token)
+    limit = len(node) if allow_end else len(node) - 1
+    if index > limit:
+        raise JsonPatchError(f"List index out of range in {pointer!r}")
+    return index
+
+
+def _resolve_parent(doc, tokens: list, pointer):
+    node = doc
+    for token in tokens[:-1]:
+        node = _child(node, token, pointer)
+    return node
+
+
+def get_path(doc, pointer):
+    tokens = parse_pointer(pointer)
+    node = doc
+    for token in tokens:
+        node = _child(node, token, pointer)
+    return node
+
+
+def _add(doc, tokens: list, value, pointer):
+    if not tokens:
+        return value
+    parent = _resolve_parent(doc, tokens, pointer)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        parent[last] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, last, pointer, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add to {type(parent).__name__} at {pointer!r}")
+    return doc
+
+
+def _remove(doc, tokens: list, pointer):
+    if not tokens:
+        raise JsonPatchError("Cannot remove the document root")
+    parent = _resolve_parent(doc, tokens, pointer)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise JsonPatchError(f"Path not found: {pointer!r}")
+        return parent.pop(last)
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, last, pointer))
+    raise JsonPatchError(f"Cannot remove from {type(parent).__name__} at {pointer!r}")
+
+
+def merge_patch(target, patch):
+    """
+    RFC 7386 merge patch: objects merge recursively, null deletes a key and
+    anything else replaces the target value.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+    return target
+
+
+def apply_operation(doc, op: dict):
+    """
+    Apply one operation and return the (possibly new) document. Supports the
+    RFC 6902 ops add, remove, replace, move, copy and test, plus 'merge'
+    which applies an RFC 7386 merge patch at `path`. Any op with
+    "optional": true is skipped instead of failing when its path is missing,
+    and ZipOverlay.json_patch leaves a member that is not JSON alone when
+    all of its ops are optional.
+    """
+    kind = op.get('op')
+    pointer = op.get('path', '')
+    try:
+        tokens = parse_pointer(pointer)
+        if kind == 'add':
+            return _add(doc, tokens, copy.deepcopy(op['value']), pointer)
+        if kind == 'remove':
+            _remove(doc, tokens, pointer)
+            return doc
+        if kind == 'replace':
+            get_path(doc, pointer)
+            if not tokens:
+                return copy.deepcopy(op['value'])
+            _remove(doc, tokens, pointer)
+            return _add(doc, tokens, copy.deepcopy(op['value']), pointer)
+        if kind == 'move':
+            # Check the destination before mutating so a failed move leaves doc intact
+            if tokens:
+                _resolve_parent(doc, tokens, pointer)
+            value = _remove(doc, parse_pointer(op['from']), op['from'])
+            return _add(doc, tokens, value, pointer)
+        if kind == 'copy':
+            value = copy.deepcopy(get_path(doc, op['from']))
+            return _add(doc, tokens, value, pointer)
+        if kind == 'test':
+            if get_path(doc, pointer) != op['value']:
+                raise JsonPatchError(f"Test failed at {pointer!r}")
+            return doc
+        if kind == 'merge':
+            if not tokens:
+                return merge_patch(doc, op['value'])
+            merged = merge_patch(get_path(doc, pointer), op['value'])
+            parent = _resolve_parent(doc, tokens, pointer)
+            if isinstance(parent, list):
+                parent[_list_index(parent, tokens[-1], pointer)] = merged
+            else:
+                parent[tokens[-1]] = merged
+            return doc
+    except (JsonPatchError, KeyError, TypeError):
+        if op.get('optional'):
+            return doc
+        raise
+    raise JsonPatchError(f"Unknown JSON patch op: {kind!r}")
+
+
+def apply_json_patch(doc, ops: list):
+    for op in ops:
+        doc = apply_operation(doc, op)
+    return doc
@@ -1,7 +1,220 @@
 import argparse
+import bz2
+import hashlib
+import io
+import json
+import mmap
 import os
+import shutil
 import sys
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
 import bsdiff4
+import bsdiff4.core
+
+import instrumentation
+
+BSDIFF_MAGIC = b'BSDIFF40'
+BSDIFF_HEADER_SIZE = 32
+# Targets at least this large are patched through mmap windows instead of
+# being read fully into memory
+MMAP_THRESHOLD = 16 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Written by create-tree into the output folder, lists what each patch targets
+BIN_PATCH_INDEX = 'bin_patches.json'
+# Sidecar written next to each patch with the hashes of the file it expects
+# and the file it produces, e.g. CarbonaraToSpaghetti.patch.hashes.json
+PATCH_HASHES_SUFFIX = '.hashes.json'
+PATCH_SOURCE = 'source'
+ALREADY_PATCHED = 'patched'
+
+class PatchMismatchError(ValueError):
+    pass
+
+def _as_bytes(buf) -> bytes:
+    """
+    bsdiff4 only accepts real bytes objects. Convert memoryviews, bytearrays,
+    mmaps and file-like objects (e.g. ZipFile.open streams) in one copy.
+    """
+    if isinstance(buf, bytes):
+        return buf
+    if hasattr(buf, 'read') and not isinstance(buf, mmap.mmap):
+        return buf.read()
+    return bytes(buf)
+
+def patch_bytes(old, patch) -> bytes:
+    """
+    Apply a bsdiff4 patch to an in-memory buffer. Both arguments may be
+    bytes, bytearray, memoryview, mmap or a readable stream such as an open
+    zip member.
+    """
+    old = _as_bytes(old)
+    patch = _as_bytes(patch)
+    with instrumentation.span("bsdiff_apply"):
+        patched = bsdiff4.patch(old, patch)
+    instrumentation.count("bytes_read", len(old) + len(patch))
+    return patched
+
+def diff_bytes(old, new) -> bytes:
+    """
+    Create a bsdiff4 patch between two in-memory buffers.
+    """
+    old = _as_bytes(old)
+    new = _as_bytes(new)
+    with instrumentation.span("bsdiff_create"):
+        patch = bsdiff4.diff(old, new)
+    instrumentation.count("bytes_read", len(old) + len(new))
+    return patch
+
+@contextmanager
+def open_mmap(path: str):
+    """
+    Map a file read-only. Empty files cannot be mapped, they yield b''.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+def _read_patch_header(patch):
+    if bytes(patch[:8]) != BSDIFF_MAGIC:
+        raise ValueError("incorrect magic bsdiff4 header")
+    len_control = bsdiff4.core.decode_int64(bytes(patch[8:16]))
+    len_diff = bsdiff4.core.decode_int64(bytes(patch[16:24]))
+    len_dst = bsdiff4.core.decode_int64(bytes(patch[24:32]))
+    return len_control, len_diff, len_dst
+
+def patch_stream(old, patch, out_fp, chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Apply a bsdiff4 patch without holding the old file, the decompressed
+    diff/extra blocks or the result in memory at once. `old` and `patch`
+    only need to support slicing and len() (bytes, memoryview or mmap) and
+    the result is written to out_fp in chunks of at most chunk_size.
+    Returns the number of bytes written.
+    """
+    len_control, len_diff, len_dst = _read_patch_header(patch)
+    diff_start = BSDIFF_HEADER_SIZE + len_control
+    extra_start = diff_start + len_diff
+    control = bz2.decompress(bytes(patch[BSDIFF_HEADER_SIZE:diff_start]))
+    diff_stream = bz2.BZ2File(io.BytesIO(bytes(patch[diff_start:extra_start])))
+    extra_stream = bz2.BZ2File(io.BytesIO(bytes(patch[extra_start:])))
+
+    old_size = len(old)
+    old_pos = 0
+    written = 0
+    decode = bsdiff4.core.decode_int64
+    for i in range(0, len(control), 24):
+        x = decode(control[i:i + 8])
+        y = decode(control[i + 8:i + 16])
+        z = decode(control[i + 16:i + 24])
+        if written + x + y > len_dst:
+            raise ValueError("corrupt patch: output exceeds declared size")
+        # Diff block: new = old + diff bytewise, done by bsdiff4's core on
+        # bounded windows. Bytes outside the old file count as zero.
+        done = 0
+        while done < x:
+            n = min(chunk_size, x - done)
+            start = old_pos + done
+            lo = max(start, 0)
+            hi = min(start + n, old_size)
+            if lo < hi:
+                window = bytes(old[lo:hi])
+                window = b'\0' * (lo - start) + window + b'\0' * (start + n - hi)
+            else:
+                window = bytes(n)
+            diff_chunk = diff_stream.read(n)
+            if len(diff_chunk) != n:
+                raise ValueError("corrupt patch: diff block truncated")
+            out_fp.write(bsdiff4.core.patch(window, n, [(n, 0, 0)], diff_chunk, b''))
+            done += n
+        written += x
+        old_pos += x
+        # Extra block is copied verbatim
+        remaining = y
+        while remaining > 0:
+            chunk = extra_stream.read(min(chunk_size, remaining))
+            if not chunk:
+                raise ValueError("corrupt patch: extra block truncated")
+            out_fp.write(chunk)
+            remaining -= len(chunk)
+        written += y
+        old_pos += z
+    if written != len_dst:
+        raise ValueError("corrupt patch: output shorter than declared size")
+    instrumentation.count("bytes_read", len(patch))
+    return written
+
+def sha256_stream(fp, chunk_size: int = STREAM_CHUNK_SIZE) -> str:
+    """
+    Hash a readable stream (e.g. ZipFile.open) without holding it in memory.
+    """
+    h = hashlib.sha256()
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        h.update(chunk)
+    return h.hexdigest()
+
+def patch_hashes_path(patch_path: str) -> str:
+    return patch_path + PATCH_HASHES_SUFFIX
+
+def write_patch_hashes(patch_path: str, source_sha256: str, source_size: int, target_sha256: str, target_size: int):
+    with open(patch_hashes_path(patch_path), "w", encoding="utf-8") as f:
+        json.dump({"source_sha256": source_sha256, "source_size": source_size,
+                   "target_sha256": target_sha256, "target_size": target_size}, f, indent=2)
+        f.write("\n")
+
+def load_patch_hashes(patch_path: str):
+    """
+    Return the recorded hashes for a patch, or None for patches made before
+    hashes were recorded.
+    """
+    try:
+        with open(patch_hashes_path(patch_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def check_source(size: int, digest_fn, hashes: dict, name: str = "input") -> str:
+    """
+    Classify an input against recorded patch hashes before applying anything.
+    Returns PATCH_SOURCE for the expected upstream file or ALREADY_PATCHED if
+    it is already the patch result, and raises PatchMismatchError otherwise.
+    digest_fn is only called when the size matches, so a changed upstream
+    file is usually rejected without reading it.
+    """
+    check_size(size, hashes, name)
+    digest = digest_fn()
+    if digest == hashes["source_sha256"]:
+        return PATCH_SOURCE
+    if digest == hashes["target_sha256"]:
+        return ALREADY_PATCHED
+    _source_mismatch(hashes, name)
+
+def check_size(size: int, hashes: dict, name: str = "input"):
+    """
+    Raise PatchMismatchError unless size is that of the patch source or
+    result, the part of check_source that needs no read.
+    """
+    if size != hashes["source_size"] and size != hashes["target_size"]:
+        _source_mismatch(hashes, name)
+
+def _source_mismatch(hashes: dict, name: str):
+    raise PatchMismatchError(f"{name} does not match the file this patch was made for "
+                             f"(expected sha256 {hashes['source_sha256']}, {hashes['source_size']} bytes)")
+
+def verify_target(digest: str, hashes: dict, name: str = "output"):
+    if digest != hashes["target_sha256"]:
+        raise PatchMismatchError(f"{name} does not match the expected patch result (sha256 {digest})")
 
 def create_patch(old_path, new_path, out_path):
     old_path = os.path.expanduser(old_path)
@@ -16,15 +229,16 @@ def create_patch(old_path, new_path, out_path):
         return 2
 
     try:
-        with open(old_path, "rb") as f:
-            old_bytes = f.read()
-        with open(new_path, "rb") as f:
-            new_bytes = f.read()
-
-        patch = bsdiff4.diff(old_bytes, new_bytes)
+        # bsdiff needs both files whole for suffix sorting; mmap avoids an
+        # extra buffered copy while converting them
+        with open_mmap(old_path) as old, open_mmap(new_path) as new:
+            patch = diff_bytes(old, new)
+            hashes = (_sha256(old), len(old), _sha256(new), len(new))
+        instrumentation.count("bytes_written", len(patch))
 
         with open(out_path, "wb") as f:
             f.write(patch)
+        write_patch_hashes(out_path, *hashes)
 
         print(f"Patch created successfully: {out_path}")
         return 0
@@ -44,22 +258,159 @@ def apply_patch(patch_path, target_path, out_path):
         print(f"Error: target file not found: {target_path}", file=sys.stderr)
         return 2
 
+    tmp_path = out_path + ".tmp"
     try:
-        with open(patch_path, "rb") as f:
-            patch_bytes = f.read()
-        with open(target_path, "rb") as f:
-            old_bytes = f.read()
+        hashes = load_patch_hashes(patch_path)
+        if hashes is not None:
+            try:
+                status = check_source(os.path.getsize(target_path), lambda: _file_sha256(target_path),
+                                      hashes, name=target_path)
+            except PatchMismatchError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 3
+            if status == ALREADY_PATCHED:
+                if os.path.abspath(target_path) != os.path.abspath(out_path):
+                    shutil.copyfile(target_path, out_path)
+                print(f"Target is already patched, nothing to do. Wrote: {out_path}")
+                return 0
 
-        patched = bsdiff4.patch(old_bytes, patch_bytes)
-
-        with open(out_path, "wb") as f:
-            f.write(patched)
+        # Write next to out_path first so patching a file onto itself works
+        with open_mmap(patch_path) as patch, open_mmap(target_path) as old, open(tmp_path, "wb") as out:
+            if len(old) >= MMAP_THRESHOLD:
+                with instrumentation.span("bsdiff_apply"):
+                    written = patch_stream(old, patch, out)
+                instrumentation.count("bytes_read", len(old))
+                digest = None
+            else:
+                patched = patch_bytes(old, patch)
+                out.write(patched)
+                written = len(patched)
+                digest = _sha256(patched) if hashes is not None else None
+        instrumentation.count("bytes_written", written)
+        if hashes is not None:
+            verify_target(digest or _file_sha256(tmp_path), hashes, name=out_path)
+        os.replace(tmp_path, out_path)
 
         print(f"Patch applied successfully. Wrote: {out_path}")
         return 0
     except Exception as e:
         print(f"Failed to apply patch: {e}", file=sys.stderr)
         return 1
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _sha256(buf) -> str:
+    return hashlib.sha256(buf).hexdigest()
+
+def _file_sha256(path: str) -> str:
+    with open_mmap(path) as mm:
+        return _sha256(mm)
+
+def _diff_tree_job(old, new_path: str) -> bytes:
+    """
+    Worker for create_tree_patches. `old` is either the original bytes (from
+    an archive) or a path to the original file.
+    """
+    with open_mmap(new_path) as new:
+        if isinstance(old, str):
+            with open_mmap(old) as old_mm:
+                return diff_bytes(old_mm, new)
+        return diff_bytes(old, new)
+
+def _walk_files(root_dir: str):
+    for root, dirs, files in os.walk(root_dir):
+        dirs.sort()
+        for fname in sorted(files):
+            full_path = os.path.join(root, fname)
+            yield os.path.relpath(full_path, root_dir).replace(os.path.sep, '/'), full_path
+
+def create_tree_patches(original, edited_dir, out_dir, jobs=None):
+    """
+    Diff an edited directory against an original mod (archive or directory),
+    matching files by relative path. Identical files are skipped by hash,
+    changed files get a bsdiff patch under <out_dir>/patches/ (generated in
+    parallel) and files that only exist in the edit are copied to
+    <out_dir>/files/. <out_dir>/bin_patches.json records which archive
+    member each entry targets.
+    """
+    original = os.path.expanduser(original)
+    edited_dir = os.path.expanduser(edited_dir)
+    out_dir = os.path.expanduser(out_dir)
+
+    if not os.path.exists(original):
+        print(f"Error: original not found: {original}", file=sys.stderr)
+        return 2
+    if not os.path.isdir(edited_dir):
+        print(f"Error: edited directory not found: {edited_dir}", file=sys.stderr)
+        return 2
+
+    try:
+        src_zip = None
+        if os.path.isdir(original):
+            original_files = dict(_walk_files(original))
+        else:
+            src_zip = zipfile.ZipFile(original, 'r')
+            original_files = {info.filename: info for info in src_zip.infolist() if not info.is_dir()}
+
+        index = {"original": os.path.basename(original.rstrip(os.path.sep)), "patches": [], "files": []}
+        workers = jobs or os.cpu_count() or 1
+        # Submitted while walking, at most this many at once, so only their
+        # original bytes are held in memory rather than every changed file's
+        max_in_flight = 2 * workers
+        in_flight = deque()
+        skipped = 0
+
+        def finish_oldest():
+            member, hashes, future = in_flight.popleft()
+            rel = os.path.join("patches", *member.split('/')) + ".patch"
+            out_path = os.path.join(out_dir, rel)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "wb") as f:
+                f.write(future.result())
+            write_patch_hashes(out_path, *hashes)
+            index["patches"].append({"member": member, "patch": rel.replace(os.path.sep, '/')})
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for member, new_path in _walk_files(edited_dir):
+                    if member not in original_files:
+                        rel = os.path.join("files", *member.split('/'))
+                        os.makedirs(os.path.dirname(os.path.join(out_dir, rel)), exist_ok=True)
+                        shutil.copyfile(new_path, os.path.join(out_dir, rel))
+                        index["files"].append({"member": member, "source": rel.replace(os.path.sep, '/')})
+                        continue
+                    new_hash = _file_sha256(new_path)
+                    if src_zip is not None:
+                        old = src_zip.read(original_files[member])
+                        old_hash, old_size = _sha256(old), len(old)
+                    else:
+                        old = original_files[member]
+                        old_hash, old_size = _file_sha256(old), os.path.getsize(old)
+                    if old_hash == new_hash:
+                        skipped += 1
+                        continue
+                    hashes = (old_hash, old_size, new_hash, os.path.getsize(new_path))
+                    in_flight.append((member, hashes, pool.submit(_diff_tree_job, old, new_path)))
+                    if len(in_flight) >= max_in_flight:
+                        finish_oldest()
+                while in_flight:
+                    finish_oldest()
+        finally:
+            if src_zip is not None:
+                src_zip.close()
+
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, BIN_PATCH_INDEX), "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+            f.write("\n")
+
+        print(f"Created {len(index['patches'])} patches and copied {len(index['files'])} new files "
+              f"({skipped} unchanged skipped) into {out_dir}")
+        return 0
+    except Exception as e:
+        print(f"Failed to create tree patches: {e}", file=sys.stderr)
+        return 1
 
 def main():
     parser = argparse.ArgumentParser(description="Create or apply bsdiff4 patches for files.")
@@ -75,6 +426,12 @@ def main():
     p_apply.add_argument("target", help="Path to the target (old) file to patch")
     p_apply.add_argument("-o", "--out", default="patched_output", help="Output file path for patched result (default: patched_output)")
 
+    p_tree = subparsers.add_parser("create-tree", help="Create patches for every changed file between an original mod and an edited directory")
+    p_tree.add_argument("original", help="Original mod archive (.zip/.jar) or extracted directory")
+    p_tree.add_argument("edited", help="Directory holding the edited files, laid out like the archive")
+    p_tree.add_argument("-o", "--out", required=True, help="Output folder, e.g. patch_data/<mod>")
+    p_tree.add_argument("-j", "--jobs", type=int, default=None, help="Parallel diff workers (default: number of CPUs)")
+
     args = parser.parse_args()
 
     if args.command == "create":
@@ -83,6 +440,9 @@ def main():
     elif args.command == "apply":
         rc = apply_patch(args.patch, args.target, args.out)
         sys.exit(rc)
+    elif args.command == "create-tree":
+        rc = create_tree_patches(args.original, args.edited, args.out, args.jobs)
+        sys.exit(rc)
 
 if __name__ == "__main__":
     main()
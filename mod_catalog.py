@@ -0,0 +1,242 @@
+import json
+import os
+import sqlite3
+import time
+import zipfile
+
+from build_cache import hash_file
+
+CATALOG_FILE_NAME = '.trw_catalog.sqlite'
+MOD_EXTENSIONS = ('.zip', '.jar')
+MOD_MANIFEST = 'manifest.json'
+# Bump when the schema changes; older catalogs are rebuilt from scratch
+SCHEMA_VERSION = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    sha256 TEXT,
+    mod_id TEXT,
+    mod_version TEXT
+);
+CREATE TABLE IF NOT EXISTS members (
+    archive TEXT NOT NULL REFERENCES archives(name) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    compress_size INTEGER NOT NULL,
+    crc INTEGER NOT NULL,
+    header_offset INTEGER NOT NULL,
+    compress_type INTEGER NOT NULL,
+    PRIMARY KEY (archive, path)
+);
+CREATE INDEX IF NOT EXISTS members_by_path ON members(path);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    mod_id TEXT PRIMARY KEY,
+    patch TEXT NOT NULL,
+    version TEXT,
+    learned REAL NOT NULL
+);
+"""
+
+
+def read_mod_identity(z: zipfile.ZipFile):
+    """
+    (mod id, version) from an archive's manifest.json, where the id is
+    "Group:Name" (or just Name). (None, None) if there is no usable manifest.
+    """
+    try:
+        info = z.getinfo(MOD_MANIFEST)
+    except KeyError:
+        return None, None
+    try:
+        manifest = json.loads(z.read(info).decode('utf-8-sig'))
+    except (ValueError, UnicodeDecodeError):
+        return None, None
+    if not isinstance(manifest, dict) or not manifest.get('Name'):
+        return None, None
+    name = str(manifest['Name'])
+    mod_id = f"{manifest['Group']}:{name}" if manifest.get('Group') else name
+    version = manifest.get('Version')
+    return mod_id, str(version) if version is not None else None
+
+
+class ModCatalog:
+    """
+    Persistent SQLite index of every archive in a mods folder: the member
+    list from each central directory (path, sizes, CRC, local header offset),
+    the mod id and version from its manifest.json and a lazily computed
+    sha256 of the archive. An archive is only read again when its size or
+    mtime changes. Also keeps the mod id -> patch fingerprints learned by
+    the build.
+    """
+
+    def __init__(self, db_path: str):
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS members; DROP TABLE IF EXISTS archives; "
+                                    "DROP TABLE IF EXISTS fingerprints;")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(_SCHEMA)
+        self.scanned = 0
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self, mods_dir: str, names=None) -> list:
+        """
+        Bring the catalog in line with mods_dir (or just `names` in it):
+        re-read the central directory of new or changed archives and drop
+        archives whose file is gone. Names may be paths relative to
+        mods_dir, e.g. 'patched/Foo-trw.zip'. Returns the names that were
+        (re)scanned.
+        """
+        if names is None:
+            names = [f for f in os.listdir(mods_dir)
+                     if f.lower().endswith(MOD_EXTENSIONS) and os.path.isfile(os.path.join(mods_dir, f))]
+        known = {row[0]: (row[1], row[2]) for row in self.conn.execute("SELECT name, size, mtime_ns FROM archives")}
+        scanned = []
+        with self.conn:
+            for name in sorted(names):
+                st = os.stat(os.path.join(mods_dir, name))
+                if known.get(name) == (st.st_size, st.st_mtime_ns):
+                    continue
+                self._scan(os.path.join(mods_dir, name), name, st)
+                scanned.append(name)
+            for name in set(known) - set(names):
+                if not os.path.isfile(os.path.join(mods_dir, name)):
+                    self.conn.execute("DELETE FROM archives WHERE name = ?", (name,))
+        self.scanned += len(scanned)
+        return scanned
+
+    def _scan(self, path: str, name: str, st):
+        self.conn.execute("DELETE FROM archives WHERE name = ?", (name,))
+        mod_id = mod_version = None
+        try:
+            with zipfile.ZipFile(path, 'r') as z:
+                infos = [i for i in z.infolist() if not i.is_dir()]
+                mod_id, mod_version = read_mod_identity(z)
+            valid = 1
+        except zipfile.BadZipFile:
+            infos = []
+            valid = 0
+        self.conn.execute("INSERT INTO archives (name, size, mtime_ns, valid, sha256, mod_id, mod_version) "
+                          "VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                          (name, st.st_size, st.st_mtime_ns, valid, mod_id, mod_version))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(name, i.filename, i.file_size, i.compress_size, i.CRC, i.header_offset, i.compress_type) for i in infos])
+
+    def archives(self) -> list:
+        return [row[0] for row in self.conn.execute("SELECT name FROM archives WHERE valid = 1 ORDER BY name")]
+
+    def members(self, archive: str, prefix: str = '') -> list:
+        """
+        Member rows (path, file_size, compress_size, crc, header_offset,
+        compress_type) of an archive, optionally only those under prefix.
+        """
+        query = "SELECT path, file_size, compress_size, crc, header_offset, compress_type FROM members WHERE archive = ?"
+        args = [archive]
+        if prefix:
+            # Range scan instead of LIKE so '_' and '%' in paths need no escaping
+            query += " AND path >= ? AND path < ?"
+            args += [prefix, prefix + '\U0010ffff']
+        return self.conn.execute(query + " ORDER BY path", args).fetchall()
+
+    def has_member(self, archive: str, path: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM members WHERE archive = ? AND path = ?", (archive, path)).fetchone()
+        return row is not None
+
+    def archives_with(self, path: str) -> list:
+        """
+        Names of every archive containing path.
+        """
+        return [row[0] for row in self.conn.execute("SELECT archive FROM members WHERE path = ? ORDER BY archive", (path,))]
+
+    def shared_paths(self, archives=None) -> list:
+        """
+        (path, [archives]) for every path present in more than one archive,
+        counting only `archives` if given.
+        """
+        query = "SELECT path, group_concat(archive, char(0)) FROM members"
+        args = []
+        if archives is not None:
+            archives = list(archives)
+            query += f" WHERE archive IN ({', '.join('?' * len(archives))})"
+            args = archives
+        rows = self.conn.execute(query + " GROUP BY path HAVING count(*) > 1 ORDER BY path", args).fetchall()
+        return [(path, sorted(archives.split('\0'))) for path, archives in rows]
+
+    def identity(self, archive: str):
+        """
+        (mod id, version) read from the archive's manifest.json at scan time.
+        """
+        row = self.conn.execute("SELECT mod_id, mod_version FROM archives WHERE name = ?", (archive,)).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def archives_with_id(self, mod_id: str) -> list:
+        """
+        Archives directly in the mods folder carrying mod_id; patched outputs
+        (under patched/) keep their source's id and are left out.
+        """
+        return [row[0] for row in self.conn.execute(
+            "SELECT name FROM archives WHERE mod_id = ? AND instr(name, '/') = 0 ORDER BY name", (mod_id,))]
+
+    def learn(self, mod_id: str, patch: str, version: str):
+        """
+        Remember that mod_id is handled by patch, last built at version, so
+        renamed downloads of the same mod are still recognized.
+        """
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                              (mod_id, patch, version, time.time()))
+
+    def fingerprint(self, mod_id: str):
+        """
+        (patch name, last built version) learned for mod_id, or None.
+        """
+        row = self.conn.execute("SELECT patch, version FROM fingerprints WHERE mod_id = ?", (mod_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def archive_sha256(self, mods_dir: str, name: str) -> str:
+        """
+        sha256 of an archive's bytes, computed once per size/mtime and then
+        served from the catalog. Call refresh() first.
+        """
+        row = self.conn.execute("SELECT sha256 FROM archives WHERE name = ?", (name,)).fetchone()
+        if row is not None and row[0]:
+            return row[0]
+        digest = hash_file(os.path.join(mods_dir, name)).hexdigest()
+        with self.conn:
+            self.conn.execute("UPDATE archives SET sha256 = ? WHERE name = ?", (digest, name))
+        return digest
+
+
+def catalog_for(mod_path: str) -> ModCatalog:
+    """
+    The catalog kept with mod_path's patched outputs
+    (<mods>/patched/.trw_catalog.sqlite), refreshed for mod_path, so patch
+    functions can look members up by its base name without reading the
+    central directory again.
+    """
+    mods_dir, name = os.path.split(mod_path)
+    catalog = ModCatalog(os.path.join(mods_dir, 'patched', CATALOG_FILE_NAME))
+    try:
+        catalog.refresh(mods_dir, [name])
+    except BaseException:
+        catalog.close()
+        raise
+    return catalog
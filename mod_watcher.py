@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+POLL_INTERVAL = 0.2
+# Editors save in bursts (temp file, rename, touch); wait this long without
+# new events before reporting a batch
+DEBOUNCE_SECONDS = 0.25
+
+
+def scan_tree(roots, ignore=None) -> dict:
+    """
+    {path: (size, mtime_ns)} for every file under roots.
+    """
+    state = {}
+    for root_dir in roots:
+        if not os.path.isdir(root_dir):
+            continue
+        for root, dirs, files in os.walk(root_dir):
+            if ignore:
+                dirs[:] = [d for d in dirs if not ignore(os.path.join(root, d))]
+            for fname in files:
+                path = os.path.join(root, fname)
+                if ignore and ignore(path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                state[path] = (st.st_size, st.st_mtime_ns)
+    return state
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', None)]
+        self.watcher.notify([os.path.relpath(p) for p in paths if p])
+
+
+class ChangeWatcher:
+    """
+    Collects changed file paths under a set of folders, through watchdog
+    (inotify/FSEvents/ReadDirectoryChangesW) when it is installed and by
+    polling size/mtime otherwise. wait() returns debounced batches.
+    """
+
+    def __init__(self, roots, ignore=None, poll_interval: float = POLL_INTERVAL, use_watchdog: bool = None):
+        self.roots = list(roots)
+        self.ignore = ignore
+        self.poll_interval = poll_interval
+        self.use_watchdog = Observer is not None if use_watchdog is None else use_watchdog and Observer is not None
+        self._pending = set()
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    @property
+    def backend(self) -> str:
+        return "watchdog" if self.use_watchdog else "polling"
+
+    def notify(self, paths):
+        paths = [p for p in paths if not (self.ignore and self.ignore(p))]
+        if not paths:
+            return
+        with self._cond:
+            self._pending.update(paths)
+            self._last_event = time.monotonic()
+            self._cond.notify_all()
+
+    def start(self):
+        if self.use_watchdog:
+            self._observer = Observer()
+            handler = _EventHandler(self)
+            for root in self.roots:
+                os.makedirs(root, exist_ok=True)
+                self._observer.schedule(handler, root, recursive=True)
+            self._observer.start()
+        else:
+            self._thread = threading.Thread(target=self._poll, name="mod-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _poll(self):
+        previous = scan_tree(self.roots, self.ignore)
+        while not self._stop.wait(self.poll_interval):
+            current = scan_tree(self.roots, self.ignore)
+            changed = [p for p in current.keys() | previous.keys() if current.get(p) != previous.get(p)]
+            previous = current
+            self.notify(changed)
+
+    def wait(self, debounce: float = DEBOUNCE_SECONDS, timeout: float = None) -> set:
+        """
+        Block until something changed and then stayed quiet for `debounce`
+        seconds, and return the changed paths. Returns an empty set on
+        timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return set()
+                self._cond.wait(remaining)
+            while True:
+                quiet = time.monotonic() - self._last_event
+                if quiet >= debounce:
+                    break
+                self._cond.wait(debounce - quiet)
+            changed = self._pending
+            self._pending = set()
+            return changed
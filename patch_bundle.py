@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import zipfile
+
+from patch_registry import PATCH_DATA_ROOT
+
+BUNDLE_DIR_NAME = '.trw_bundles'
+BUNDLE_INDEX = '.bundle_index.json'
+
+# Loaded bundles by path, reloaded when the file changes on disk
+_bundles = {}
+_lock = threading.Lock()
+
+
+def bundle_path(bundle_dir: str, folder: str, compress_type: int, level) -> str:
+    return os.path.join(bundle_dir, f"{folder}-{compress_type}-{'default' if level is None else level}.zip")
+
+
+def _walk_files(folder_dir: str) -> list:
+    files = []
+    for root, dirs, names in os.walk(folder_dir):
+        dirs.sort()
+        for fname in sorted(names):
+            full_path = os.path.join(root, fname)
+            files.append((os.path.relpath(full_path, folder_dir).replace(os.path.sep, '/'), full_path))
+    return files
+
+
+def compile_bundle(folder_dir: str, out_path: str, compress_type: int, level=None) -> dict:
+    """
+    Compress every file of a patch_data/<mod> folder once into a zip at
+    out_path, members named by their path in the folder, and return the
+    {path: [size, mtime_ns]} index stored with it. Writers splice these
+    members raw instead of compressing the files again on every build.
+    """
+    index = {}
+    parent = os.path.dirname(out_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, 'w') as z:
+            for rel_path, full_path in _walk_files(folder_dir):
+                st = os.stat(full_path)
+                info = zipfile.ZipInfo(rel_path)
+                info.compress_type = compress_type
+                with open(full_path, 'rb') as f:
+                    z.writestr(info, f.read(), compresslevel=level)
+                index[rel_path] = [st.st_size, st.st_mtime_ns]
+            z.writestr(BUNDLE_INDEX, json.dumps(index, sort_keys=True))
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return index
+
+
+class PatchBundle:
+    """
+    A compiled patch_data folder: the member infos (CRC, sizes, offsets)
+    of its bundle zip and the source stats they were compiled from.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stat = _file_stat(path)
+        with zipfile.ZipFile(path, 'r') as z:
+            self.index = json.loads(z.read(BUNDLE_INDEX))
+            self.infos = {i.filename: i for i in z.infolist() if i.filename != BUNDLE_INDEX}
+
+    def is_current(self, rel_path: str, source: str) -> bool:
+        entry = self.index.get(rel_path)
+        if entry is None:
+            return False
+        st = os.stat(source)
+        return entry == [st.st_size, st.st_mtime_ns]
+
+
+def _file_stat(path: str) -> tuple:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _split_source(source: str):
+    rel = os.path.relpath(os.path.abspath(source), os.path.abspath(PATCH_DATA_ROOT))
+    parts = rel.replace(os.path.sep, '/').split('/', 1)
+    if len(parts) != 2 or parts[0] in ('', '..', '.'):
+        return None
+    return parts[0], parts[1]
+
+
+def lookup(source, compress_type: int, level, bundle_dir: str, compile: bool = True):
+    """
+    (bundle path, ZipInfo) holding source, a file under patch_data/<mod>,
+    compressed with compress_type and level, from the bundles kept in
+    bundle_dir; or None if bundle_dir is None or source is not a patch_data
+    file. The bundle is (re)compiled when any of its files changed since,
+    unless compile is False.
+    """
+    if bundle_dir is None or not isinstance(source, str):
+        return None
+    split = _split_source(source)
+    if split is None or not os.path.isfile(source):
+        return None
+    folder, rel_path = split
+    path = bundle_path(bundle_dir, folder, compress_type, level)
+    with _lock:
+        bundle = _bundles.get(path)
+        if bundle is not None and (not os.path.exists(path) or _file_stat(path) != bundle.stat):
+            # Recompiled or removed by another build since it was loaded
+            del _bundles[path]
+            bundle = None
+        if bundle is None and os.path.exists(path):
+            try:
+                bundle = _bundles[path] = PatchBundle(path)
+            except (zipfile.BadZipFile, KeyError, ValueError):
+                bundle = None
+        if bundle is None or not bundle.is_current(rel_path, source):
+            if not compile:
+                return None
+            compile_bundle(os.path.join(PATCH_DATA_ROOT, folder), path, compress_type, level)
+            bundle = _bundles[path] = PatchBundle(path)
+            if not bundle.is_current(rel_path, source):
+                return None
+    return bundle.path, bundle.infos[rel_path]
@@ -0,0 +1,144 @@
+import os
+import json
+import functools
+
+from zip_overlay import ZipOverlay
+from patch_registry import PATCH_DATA_ROOT, patched_output_path
+from make_bin_diff import BIN_PATCH_INDEX
+
+MANIFEST_FILE_NAME = 'patch_manifest.json'
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def load_manifest(patch_data_dir: str):
+    """
+    Load patch_data/<mod>/patch_manifest.json, or return None if the folder
+    has no manifest.
+    """
+    path = os.path.join(patch_data_dir, MANIFEST_FILE_NAME)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('operations'), list):
+        raise ManifestError(f"{path}: expected an object with an 'operations' list")
+    return manifest
+
+
+def _key_pointer(op: dict) -> list:
+    key = op.get('key')
+    if isinstance(key, str):
+        return [key]
+    if isinstance(key, list) and key and all(isinstance(k, str) for k in key):
+        return key
+    raise ManifestError(f"{op['op']} needs 'key' as a string or a list of strings")
+
+
+def apply_bin_patch_index(overlay: ZipOverlay, patch_data_dir: str, index_name: str = BIN_PATCH_INDEX) -> ZipOverlay:
+    """
+    Register every patch and new file listed in a create-tree index.
+    """
+    with open(os.path.join(patch_data_dir, index_name), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    for entry in index.get('patches', []):
+        overlay.apply_bsdiff(entry['member'], os.path.join(patch_data_dir, entry['patch']))
+    for entry in index.get('files', []):
+        overlay.replace(entry['member'], os.path.join(patch_data_dir, entry['source']))
+    return overlay
+
+
+def apply_manifest(overlay: ZipOverlay, manifest: dict, patch_data_dir: str) -> ZipOverlay:
+    """
+    Translate manifest operations into ZipOverlay operations. Supported ops:
+
+        {"op": "replace", "path": "<member>", "source": "<file in patch_data dir>"}
+        {"op": "delete", "path": "<member>" or "<prefix>/"}
+        {"op": "keep", "paths": ["<member>", ...]}
+        {"op": "rename", "from": "<member or prefix/>", "to": "<member or prefix/>"}
+        {"op": "drop_key", "path": "<json member>", "key": "Key" or ["Nested", "Key"]}
+        {"op": "set_key", "path": "<json member>", "key": ..., "value": <any>}
+        {"op": "json_patch", "path": "<json member>", "ops": [<RFC 6902 operations>], "optional": false}
+        {"op": "bsdiff", "path": "<member>", "patch": "<file in patch_data dir>", "out": "<member>"}
+        {"op": "bsdiff_index", "index": "bin_patches.json"}  (written by make_bin_diff.py create-tree)
+
+    Replacement sources and patches that do not exist are skipped, as are
+    drop_key/set_key whose parent object is missing or whose member is not
+    JSON. json_patch with "optional": true makes every one of its ops
+    optional the same way; single ops can also set it themselves.
+    """
+    for op in manifest['operations']:
+        kind = op.get('op')
+        if kind == 'replace':
+            src = os.path.join(patch_data_dir, op['source'])
+            if os.path.exists(src):
+                overlay.replace(op['path'], src)
+        elif kind == 'delete':
+            if op['path'].endswith('/'):
+                overlay.drop_prefix(op['path'])
+            else:
+                overlay.drop(op['path'])
+        elif kind == 'keep':
+            overlay.keep(op['paths'])
+        elif kind == 'rename':
+            if op['from'].endswith('/'):
+                overlay.rename_prefix(op['from'], op['to'])
+            else:
+                overlay.rename(op['from'], op['to'])
+        elif kind == 'drop_key':
+            overlay.json_patch(op['path'], [{'op': 'remove', 'path': _key_pointer(op), 'optional': True}])
+        elif kind == 'set_key':
+            overlay.json_patch(op['path'], [{'op': 'add', 'path': _key_pointer(op), 'value': op.get('value'), 'optional': True}])
+        elif kind == 'json_patch':
+            ops = op['ops']
+            if op.get('optional'):
+                ops = [dict(o, optional=True) for o in ops]
+            overlay.json_patch(op['path'], ops)
+        elif kind == 'bsdiff':
+            patch_path = os.path.join(patch_data_dir, op['patch'])
+            if os.path.exists(patch_path):
+                overlay.apply_bsdiff(op['path'], patch_path, out_name=op.get('out'))
+        elif kind == 'bsdiff_index':
+            apply_bin_patch_index(overlay, patch_data_dir, op.get('index', BIN_PATCH_INDEX))
+        else:
+            raise ManifestError(f"Unknown manifest operation: {kind!r}")
+    return overlay
+
+
+def apply_manifest_patch(mod_path: str, patch_data: str):
+    """
+    Patch function for mods described entirely by a patch manifest.
+    """
+    patch_data_dir = os.path.join(PATCH_DATA_ROOT, patch_data)
+    manifest = load_manifest(patch_data_dir)
+    if manifest is None:
+        raise ManifestError(f"No {MANIFEST_FILE_NAME} in {patch_data_dir}")
+    overlay = apply_manifest(ZipOverlay(mod_path), manifest, patch_data_dir)
+    overlay.write(patched_output_path(mod_path, manifest.get('output_ext', '.zip')))
+
+
+def register_manifest_patches(registry, root: str = PATCH_DATA_ROOT):
+    """
+    Register every patch_data/<mod>/patch_manifest.json with the registry.
+    The manifest's "match" object takes the same prefix/contains/suffix keys
+    as register_patch, plus "mod_id" and "versions" from the mod's own
+    manifest.json.
+    """
+    if not os.path.isdir(root):
+        return
+    for patch_data in sorted(os.listdir(root)):
+        patch_data_dir = os.path.join(root, patch_data)
+        if not os.path.isdir(patch_data_dir):
+            continue
+        manifest = load_manifest(patch_data_dir)
+        if manifest is None:
+            continue
+        match = manifest.get('match') or {}
+        fn = functools.partial(apply_manifest_patch, patch_data=patch_data)
+        registry.register(manifest.get('name', patch_data),
+                          prefix=match.get('prefix'), contains=match.get('contains'), suffix=match.get('suffix'),
+                          mod_ids=match.get('mod_id'), versions=match.get('versions'),
+                          patch_data=patch_data, output_ext=manifest.get('output_ext', '.zip'),
+                          message=manifest.get('message'))(fn)
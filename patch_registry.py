@@ -0,0 +1,150 @@
+import os
+import re
+
+PATCH_DATA_ROOT = 'patch_data'
+
+
+def patched_output_path(orig_zip_path: str, ext: str = '.zip') -> str:
+    """
+    Return the path a patched mod is written to, e.g. mods/Foo.zip ->
+    mods/patched/Foo-trw.zip
+    """
+    dirn = os.path.dirname(orig_zip_path)
+    base = os.path.splitext(os.path.basename(orig_zip_path))[0]
+    if dirn:
+        return os.path.join(dirn, 'patched', f"{base}-trw{ext}")
+    return os.path.join('patched', f"{base}-trw{ext}")
+
+
+class PatchSpec:
+    """
+    Everything the build needs to know about one patch: which mod files it
+    applies to, where its patch_data lives and what it writes.
+    """
+
+    def __init__(self, name: str, fn, prefix: str = None, contains: str = None, suffix: str = None,
+                 patch_data: str = None, output_ext: str = '.zip', message: str = None,
+                 mod_ids=None, versions=None):
+        if not (prefix or contains or suffix or mod_ids):
+            raise ValueError(f"Patch {name} needs at least one of prefix, contains, suffix or mod_ids")
+        self.name = name
+        self.fn = fn
+        self.prefix = prefix
+        self.contains = contains
+        self.suffix = suffix
+        # manifest.json ids ("Group:Name") and versions this patch was written for
+        self.mod_ids = [mod_ids] if isinstance(mod_ids, str) else list(mod_ids or [])
+        self.versions = [versions] if isinstance(versions, str) else list(versions or [])
+        self.patch_data = patch_data
+        self.output_ext = output_ext
+        self.message = message
+
+    @property
+    def patch_data_dir(self):
+        if not self.patch_data:
+            return None
+        return os.path.join(PATCH_DATA_ROOT, self.patch_data)
+
+    def output_path(self, mod_path: str) -> str:
+        return patched_output_path(mod_path, self.output_ext)
+
+    def pattern(self) -> str:
+        """
+        Regex source matching the whole file name, used to build the
+        registry's combined matcher, or None for patches matched by
+        manifest id only.
+        """
+        if not (self.prefix or self.contains or self.suffix):
+            return None
+        pattern = re.escape(self.prefix) if self.prefix else ''
+        if self.contains:
+            pattern += '.*?' + re.escape(self.contains)
+        pattern += '.*'
+        if self.suffix:
+            pattern += re.escape(self.suffix)
+        return pattern + r'\Z'
+
+    def describe(self) -> str:
+        parts = []
+        if self.prefix:
+            parts.append(f"starts with {self.prefix!r}")
+        if self.contains:
+            parts.append(f"contains {self.contains!r}")
+        if self.suffix:
+            parts.append(f"ends with {self.suffix!r}")
+        if self.mod_ids:
+            parts.append(f"manifest id {' or '.join(self.mod_ids)}")
+        return ', '.join(parts)
+
+    def supports_version(self, version) -> bool:
+        return not self.versions or version in self.versions
+
+
+class PatchRegistry:
+    """
+    Ordered collection of PatchSpecs. Earlier registrations win when more
+    than one spec matches a file name, like the old if/elif chain did.
+    """
+
+    def __init__(self):
+        self.specs = []
+        self._by_name = {}
+        self._matcher = None
+
+    def register(self, name: str, **kwargs):
+        """
+        Decorator registering a patch function, e.g.
+
+            @register_patch('gambling', prefix='GAMBLING', patch_data='gambling')
+            def patch_gambling(zip_path): ...
+        """
+        def decorator(fn):
+            if name in self._by_name:
+                raise ValueError(f"Patch {name} is already registered")
+            spec = PatchSpec(name, fn, **kwargs)
+            self.specs.append(spec)
+            self._by_name[name] = spec
+            self._matcher = None
+            return fn
+        return decorator
+
+    def _compile(self):
+        # One alternation, tried left to right, so each file name is matched
+        # by a single regex call no matter how many patches are registered
+        groups = [f"(?P<p{i}>{spec.pattern()})" for i, spec in enumerate(self.specs) if spec.pattern()]
+        self._matcher = re.compile('|'.join(groups), re.DOTALL) if groups else None
+
+    def match(self, mod_file_name: str):
+        """
+        Return the PatchSpec for a mod file name, or None if none applies.
+        """
+        if self._matcher is None:
+            self._compile()
+            if self._matcher is None:
+                return None
+        m = self._matcher.match(mod_file_name)
+        if m is None:
+            return None
+        return self.specs[int(m.lastgroup[1:])]
+
+    def match_id(self, mod_id: str):
+        """
+        Return the PatchSpec declaring a manifest id, or None.
+        """
+        for spec in self.specs:
+            if mod_id in spec.mod_ids:
+                return spec
+        return None
+
+    def get(self, name: str):
+        return self._by_name.get(name)
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def __len__(self):
+        return len(self.specs)
+
+
+REGISTRY = PatchRegistry()
+register_patch = REGISTRY.register
@@ -1,12 +1,18 @@
 import zipfile
 import os
 import tempfile
-import shutil
 
-from make_bin_diff import apply_patch
+from zip_overlay import ZipOverlay, copy_member_raw, copy_member_stream, can_copy_raw
+from workspace import open_workspace, include_member, zip_directory
+from patch_registry import REGISTRY, register_patch, patched_output_path
+from patch_manifest import register_manifest_patches
+from json_patch import loads_json_bytes, dumps_json_bytes
+from mod_catalog import catalog_for
 
 import json
 
+import instrumentation
+
 def load_json_file(path: str):
     """
     Load and return JSON data from the given file path.
@@ -37,79 +43,52 @@ def create_temp_dir_for_modification(src_zip_path: str, paths: set = None, mode:
             if np.startswith('./'):
                 np = np[2:]
             norm_paths.add(np)
-    with zipfile.ZipFile(src_zip_path, 'r') as src_zip:
+    with catalog_for(src_zip_path) as catalog:
+        archive = os.path.basename(src_zip_path)
+        if mode == 'keep' and norm_paths:
+            members = sorted(p for p in norm_paths if catalog.has_member(archive, p))
+        else:
+            members = [row[0] for row in catalog.members(archive)
+                       if include_member(row[0], norm_paths, mode)]
+    with instrumentation.span("temp_zip_filter"), zipfile.ZipFile(src_zip_path, 'r') as src_zip:
         with zipfile.ZipFile(temp_zip_path, 'w') as dst_zip:
-            for member in src_zip.namelist():
-                if member.endswith('/'):
-                    continue
-                include = True
-                if mode == 'keep':
-                    if norm_paths:
-                        include = member in norm_paths
-                elif mode == 'remove':
-                    if norm_paths and member in norm_paths:
-                        include = False
+            for member in members:
+                info = src_zip.getinfo(member)
+                instrumentation.count("members_processed")
+                instrumentation.count("bytes_read", info.compress_size)
+                if can_copy_raw(info):
+                    copy_member_raw(src_zip, dst_zip, info)
                 else:
-                    include = True
-
-                if not include:
-                    continue
-                try:
-                    info = src_zip.getinfo(member)
-                    data = src_zip.read(member)
-                    info.filename = member
-                    dst_zip.writestr(info, data)
-                except KeyError:
-                    dst_zip.writestr(member, src_zip.read(member))
+                    copy_member_stream(src_zip, dst_zip, info)
 
     temp_dir = tempfile.mkdtemp()
-    with zipfile.ZipFile(temp_zip_path, 'r') as z:
+    with instrumentation.span("extractall"), zipfile.ZipFile(temp_zip_path, 'r') as z:
         z.extractall(temp_dir)
+        instrumentation.count("files_touched", len(z.namelist()))
     return temp_dir, temp_zip_path
 
 def rezip_temp_dir_into_patched(orig_zip_path: str, temp_dir_path: str):
-    dirn = os.path.dirname(orig_zip_path)
-    base = os.path.splitext(os.path.basename(orig_zip_path))[0]
-    if dirn:
-        new_path = os.path.join(dirn, 'patched', f"{base}-trw.zip")
-    else:
-        new_path = os.path.join('patched', f"{base}-trw.zip")
-    parent = os.path.dirname(new_path)
-    if parent and not os.path.exists(parent):
-        os.makedirs(parent, exist_ok=True)
-    with zipfile.ZipFile(new_path, 'w', compression=zipfile.ZIP_DEFLATED) as out_zip:
-        for root, _, files in os.walk(temp_dir_path):
-            for fname in files:
-                full_path = os.path.join(root, fname)
-                rel_path = os.path.relpath(full_path, temp_dir_path)
-                arcname = rel_path.replace(os.path.sep, '/')
-                out_zip.write(full_path, arcname)
-    return new_path
+    return zip_directory(temp_dir_path, patched_output_path(orig_zip_path))
 
 
+@register_patch('ymmersive_melodies', contains='ymmersive-melodies', patch_data='ymmersive_melodies', output_ext='.jar',
+                message="[PATCHER] Found ymmersive-melodies mod -> Swapping default songs")
 def ymmersive_melodies_patch_new_default_songs(jar_path: str):
     src_dir = os.path.join('patch_data', 'ymmersive_melodies')
-    with zipfile.ZipFile(jar_path, 'r') as jar:
-        temp_path = jar_path + '.tmp'
-        with zipfile.ZipFile(temp_path, 'w') as temp_jar:
-            for item in jar.namelist():
-                if not item.startswith('Server/YmmersiveMelodies/'):
-                    temp_jar.writestr(item, jar.read(item))
-            if os.path.isdir(src_dir):
-                for root, _, files in os.walk(src_dir):
-                    for fname in files:
-                        full_path = os.path.join(root, fname)
-                        rel_path = os.path.relpath(full_path, src_dir)
-                        arcname = os.path.join('Server', 'YmmersiveMelodies', rel_path).replace(os.path.sep, '/')
-                        with open(full_path, 'rb') as f:
-                            data = f.read()
-                        temp_jar.writestr(arcname, data)
-    dirn = os.path.dirname(jar_path)
-    base = os.path.splitext(os.path.basename(jar_path))[0]
-    new_name = "patched/" + base + '-trw.jar'
-    new_path = os.path.join(dirn, new_name) if dirn else new_name
-    os.replace(temp_path, new_path)
+    overlay = ZipOverlay(jar_path)
+    with catalog_for(jar_path) as catalog:
+        for name, *_ in catalog.members(os.path.basename(jar_path), 'Server/YmmersiveMelodies/'):
+            overlay.drop(name)
+    if os.path.isdir(src_dir):
+        for root, _, files in os.walk(src_dir):
+            for fname in files:
+                full_path = os.path.join(root, fname)
+                rel_path = os.path.relpath(full_path, src_dir)
+                overlay.replace(os.path.join('Server', 'YmmersiveMelodies', rel_path), full_path)
+    overlay.write(patched_output_path(jar_path, '.jar'), compression=zipfile.ZIP_STORED)
 
+@register_patch('snip3s_foodpack', contains='SNIP3_FoodPack', suffix='.zip', patch_data='snip3s_foodpack',
+                message="Found SNIP3'S Food Pack -> Cleaning + Generating Spaghetti")
 def snip3_foodpack_apply_patch(zip_path: str):
     kept_icons = ["Food_Fried_Potato.png", "Food_Pasta.png", "Food_Pizza_Cheese.png", "Food_Raw_Pasta.png", "Ingredient_Raw_Fries_Potato.png", "Ingredient_Raw_Pasta.png"]
     kept_item_data = ["Food_Fried_Potato.json", "Food_Pizza_Cheese.json", "Ingredient_Raw_Fries_Potato.json", "Ingredient_Raw_Pasta.json"]
@@ -128,521 +107,89 @@ def snip3_foodpack_apply_patch(zip_path: str):
         for name in names:
             keep_paths.add(prefix + name)
 
-    temp_dir = None
-    temp_zip_path = None
-    try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(zip_path, keep_paths, mode="keep")
+    overlay = ZipOverlay(zip_path).keep(keep_paths)
 
-        carbonara_path = os.path.join(temp_dir, "Common", "Items", "Consumables", "Food", "Carbonara.png")
-        spaghetti_path = os.path.join(temp_dir, "Common", "Items", "Consumables", "Food", "Spaghetti.png")
-        languages_dir = os.path.join(temp_dir, "Server", "Languages")
-
-        if os.path.exists(carbonara_path):
-            apply_patch("patch_data/snip3s_foodpack/CarbonaraToSpaghetti.patch", carbonara_path, spaghetti_path)
-            try:
-                if os.path.exists(carbonara_path):
-                    os.remove(carbonara_path)
-            except OSError:
-                pass
+    spaghetti_patch = os.path.join('patch_data', 'snip3s_foodpack', 'CarbonaraToSpaghetti.patch')
+    if os.path.exists(spaghetti_patch):
+        overlay.apply_bsdiff("Common/Items/Consumables/Food/Carbonara.png", spaghetti_patch,
+                             out_name="Common/Items/Consumables/Food/Spaghetti.png")
+    else:
+        overlay.drop("Common/Items/Consumables/Food/Carbonara.png")
 
-        pasta_json_src = os.path.join('patch_data', 'snip3s_foodpack', 'Food_Pasta_Spaghetti.json')
-        dest_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items')
-        dest_path = os.path.join(dest_dir, 'Food_Pasta_Spaghetti.json')
-        manifest_json = load_json_file(os.path.join(temp_dir, 'manifest.json'))
-        manifest_json["IncludesAssetPack"] = True
-        dump_json_file(manifest_json, os.path.join(temp_dir, 'manifest.json'))
-        t4_heal_file = os.path.join(temp_dir, 'Server', 'Entity', 'Effects', "Food_Instant_Heal_T4.json")
-        t4_insta_heal_json = load_json_file(t4_heal_file)
-        t4_insta_heal_json["StatModifiers"]["Health"] = 30
-        dump_json_file(t4_insta_heal_json, t4_heal_file)
+    overlay.json_patch('manifest.json', [{"op": "add", "path": "/IncludesAssetPack", "value": True}])
+    overlay.json_patch('Server/Entity/Effects/Food_Instant_Heal_T4.json', [{"op": "add", "path": "/StatModifiers/Health", "value": 30}])
 
-        try:
-            if os.path.exists(pasta_json_src):
-                os.makedirs(dest_dir, exist_ok=True)
-                shutil.copyfile(pasta_json_src, dest_path)
-        except OSError:
-            pass
+    pasta_json_src = os.path.join('patch_data', 'snip3s_foodpack', 'Food_Pasta_Spaghetti.json')
+    if os.path.exists(pasta_json_src):
+        overlay.replace('Server/Item/Items/Food_Pasta_Spaghetti.json', pasta_json_src)
 
-        if os.path.exists(languages_dir):
-            try:
-                shutil.rmtree(languages_dir)
-            except OSError:
-                try:
-                    os.rmdir(languages_dir)
-                except OSError:
-                    pass
-
-        rezip_temp_dir_into_patched(zip_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
+    overlay.drop_prefix('Server/Languages/')
+    overlay.write(patched_output_path(zip_path))
 
+@register_patch('labubu_pets', contains='EpicsLabubuPets', patch_data='labubu_pets',
+                message="Found Labubu Mod, Making it expensive like the real stuff")
 def epics_labubu_patch(zip_path: str):
-    temp_dir, temp_zip_path = create_temp_dir_for_modification(zip_path)
-    labubu_recepie_path = os.path.join(temp_dir, "Server","Item","Items","EggSpawner")
-    shutil.copyfile("patch_data/labubu_pets/Epics_LabubuEgg_Basic.json", os.path.join(labubu_recepie_path, "Epics_LabubuEgg_Basic.json"))
-    shutil.copyfile("patch_data/labubu_pets/Epics_LabubuEgg_Ears.json", os.path.join(labubu_recepie_path, "Epics_LabubuEgg_Ears.json"))
-    shutil.copyfile("patch_data/labubu_pets/Epics_LabubuEgg_NoEars.json", os.path.join(labubu_recepie_path, "Epics_LabubuEgg_NoEars.json"))
-    labubu_basic = load_json_file(os.path.join(temp_dir, 'Server', "Models", "Intelligent", "Kweebec", "LabubuBasic.json"))
-    labubu_basic["AnimationSets"]["Idle"]["Animations"] = [{"Animation": "NPC/Intelligent/Kweebec_Sapling/Animations/LabubuIdle.blockyanim","Speed": 0.5, "SoundEventId": "SFX_Labubu_Alerted"}]
-    dump_json_file(labubu_basic, os.path.join(temp_dir, 'Server', "Models", "Intelligent", "Kweebec", "LabubuBasic.json"))
-    labubu_no_ears = load_json_file(os.path.join(temp_dir, 'Server', "Models", "Intelligent", "Kweebec", "LabubuNoEars.json"))
-    labubu_no_ears["AnimationSets"]["Idle"]["Animations"] = [{"Animation": "NPC/Intelligent/Kweebec_Sapling/Animations/LabubuIdle.blockyanim","Speed": 0.5, "SoundEventId": "SFX_Labubu_Alerted"}]
-    dump_json_file(labubu_no_ears, os.path.join(temp_dir, 'Server', "Models", "Intelligent", "Kweebec", "LabubuNoEars.json"))
-    rezip_temp_dir_into_patched(zip_path, temp_dir)
-    try:
-        if temp_zip_path and os.path.exists(temp_zip_path):
-            os.remove(temp_zip_path)
-    except OSError:
-        pass
-    try:
-        if temp_dir:
-            shutil.rmtree(temp_dir)
-    except OSError:
-        pass
-
-
-def patch_gambling(zip_path: str):
-    temp_dir, temp_zip_path = create_temp_dir_for_modification(zip_path)
-    npcs_dir = os.path.join(temp_dir, 'Server', 'Drops', 'NPCs')
-    if os.path.exists(npcs_dir):
-        try:
-            shutil.rmtree(npcs_dir)
-        except OSError:
-            try:
-                for root, dirs, files in os.walk(npcs_dir, topdown=False):
-                    for fname in files:
-                        try:
-                            os.remove(os.path.join(root, fname))
-                        except OSError:
-                            pass
-                    for dname in dirs:
-                        try:
-                            os.rmdir(os.path.join(root, dname))
-                        except OSError:
-                            pass
-                try:
-                    os.rmdir(npcs_dir)
-                except OSError:
-                    pass
-            except Exception:
-                pass
-
-    slot_src = os.path.join('patch_data', 'gambling', 'SlotMachine_Droplist.json')
-    slot_dest_dir = os.path.join(temp_dir, 'Server', 'Drops', 'Items')
-    slot_dest = os.path.join(slot_dest_dir, 'SlotMachine_Droplist.json')
-    try:
-        if os.path.exists(slot_src):
-            os.makedirs(slot_dest_dir, exist_ok=True)
-            shutil.copyfile(slot_src, slot_dest)
-    except OSError:
-        pass
-
-    claw_machine_src = os.path.join('patch_data', 'gambling', 'ClawMachine_Droplist.json')
-    claw_machine_dest = os.path.join(slot_dest_dir, 'ClawMachine_Droplist.json')
-    try:
-        if os.path.exists(claw_machine_src):
-            os.makedirs(slot_dest_dir, exist_ok=True)
-            shutil.copyfile(claw_machine_src, claw_machine_dest)
-    except OSError:
-        pass
-
-    token_src = os.path.join('patch_data', 'gambling', 'SlotToken.json')
-    token_dest_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items', 'Ingredient')
-    token_dest = os.path.join(token_dest_dir, 'SlotToken.json')
-    try:
-        if os.path.exists(token_src):
-            os.makedirs(token_dest_dir, exist_ok=True)
-            shutil.copyfile(token_src, token_dest)
-    except OSError:
-        pass
-
-    claw_src = os.path.join('patch_data', 'gambling', 'ClawTicket.json')
-    claw_dest = os.path.join(token_dest_dir, 'ClawTicket.json')
-    try:
-        if os.path.exists(claw_src):
-            os.makedirs(token_dest_dir, exist_ok=True)
-            shutil.copyfile(claw_src, claw_dest)
-    except OSError:
-        pass
-
-    rezip_temp_dir_into_patched(zip_path, temp_dir)
-    try:
-        if temp_zip_path and os.path.exists(temp_zip_path):
-            os.remove(temp_zip_path)
-    except OSError:
-        pass
-    try:
-        if temp_dir:
-            shutil.rmtree(temp_dir)
-    except OSError:
-        pass
-
+    overlay = ZipOverlay(zip_path)
+    for name in ("Epics_LabubuEgg_Basic.json", "Epics_LabubuEgg_Ears.json", "Epics_LabubuEgg_NoEars.json"):
+        overlay.replace("Server/Item/Items/EggSpawner/" + name, os.path.join("patch_data", "labubu_pets", name))
 
-def patch_violet_plushie(mod_path):
-    temp_dir = None
-    temp_zip_path = None
-    try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(mod_path)
-        src = os.path.join('patch_data', 'violet_plush', 'Bench_Violet_Plushie.json')
-        dest_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items', 'Bench')
-        dest = os.path.join(dest_dir, 'Bench_Violet_Plushie.json')
-        try:
-            if os.path.exists(src):
-                os.makedirs(dest_dir, exist_ok=True)
-                shutil.copyfile(src, dest)
-        except OSError:
-            pass
-
-        rezip_temp_dir_into_patched(mod_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
-
-
-def patch_teto_plush(mod_path):
-    temp_dir = None
-    temp_zip_path = None
-    try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(mod_path)
-        src = os.path.join('patch_data', 'teto_plush', 'Deco_Teto_Plush.json')
-        dest_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items', 'Deco')
-        dest = os.path.join(dest_dir, 'Deco_Teto_Plush.json')
-        try:
-            if os.path.exists(src):
-                os.makedirs(dest_dir, exist_ok=True)
-                shutil.copyfile(src, dest)
-        except OSError:
-            pass
-
-        rezip_temp_dir_into_patched(mod_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
-
-def patch_khaos(mod_path):
-    temp_dir = None
-    temp_zip_path = None
-    try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(mod_path)
-        src = os.path.join('patch_data', 'khaos_dungeon', 'PortalKey_Template.json')
-        dest_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items', 'Portal')
-        dest = os.path.join(dest_dir, 'PortalKey_Template.json')
-        try:
-            if os.path.exists(src):
-                os.makedirs(dest_dir, exist_ok=True)
-                shutil.copyfile(src, dest)
-        except OSError:
-            pass
-
-        rezip_temp_dir_into_patched(mod_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
-
-
-def patch_lucky_block(mod_path):
-    temp_dir = None
-    temp_zip_path = None
-    try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(mod_path)
-        src_lucky = os.path.join('patch_data', 'keke_lucky_block', 'lucky_block.json')
-        src_unlucky = os.path.join('patch_data', 'keke_lucky_block', 'Unlucky_Block.json')
-        src_loot_drop = os.path.join('patch_data', 'keke_lucky_block', 'Lucky_Block_Loot_Drop.json')
-        dest_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items')
-        dest_lucky = os.path.join(dest_dir, 'lucky_block.json')
-        dest_unlucky = os.path.join(dest_dir, 'Unlucky_Block.json')
-        dest_drops_dir = os.path.join(temp_dir, 'Server', 'Drops')
-        dest_loot_drop = os.path.join(dest_drops_dir, 'Lucky_Block_Loot_Drop.json')
-        try:
-            if os.path.exists(src_lucky):
-                os.makedirs(dest_dir, exist_ok=True)
-                shutil.copyfile(src_lucky, dest_lucky)
-            if os.path.exists(src_unlucky):
-                os.makedirs(dest_dir, exist_ok=True)
-                shutil.copyfile(src_unlucky, dest_unlucky)
-            # Replace the drops loot drop file if a patched version exists
-            if os.path.exists(src_loot_drop):
-                os.makedirs(dest_drops_dir, exist_ok=True)
-                shutil.copyfile(src_loot_drop, dest_loot_drop)
-        except OSError:
-            pass
+    use_labubu_idle = [{"op": "add", "path": "/AnimationSets/Idle/Animations",
+                        "value": [{"Animation": "NPC/Intelligent/Kweebec_Sapling/Animations/LabubuIdle.blockyanim","Speed": 0.5, "SoundEventId": "SFX_Labubu_Alerted"}]}]
+    overlay.json_patch("Server/Models/Intelligent/Kweebec/LabubuBasic.json", use_labubu_idle)
+    overlay.json_patch("Server/Models/Intelligent/Kweebec/LabubuNoEars.json", use_labubu_idle)
+    overlay.write(patched_output_path(zip_path))
 
-        rezip_temp_dir_into_patched(mod_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
 
-
-def patch_walter_white(mod_path):
-    temp_dir = None
-    temp_zip_path = None
+def _strip_recipe(data: bytes):
+    """
+    Bulk transform for patch_ressurectable_dinos: drop the "Recipe" key from
+    an item definition, or return None to leave the member untouched.
+    """
     try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(mod_path)
-        src = os.path.join('patch_data', 'walter_white', 'WalterWhite_Merchant_Shop.json')
-        dest_dir = os.path.join(temp_dir, 'Server', 'BarterShops')
-        dest = os.path.join(dest_dir, 'WalterWhite_Merchant_Shop.json')
-        try:
-            if os.path.exists(src):
-                os.makedirs(dest_dir, exist_ok=True)
-                shutil.copyfile(src, dest)
-        except OSError:
-            pass
-
-        # Ensure the WalterWhite merchant NPC is marked invulnerable (case-insensitive removal of prior keys)
-        npc_path = os.path.join(temp_dir, 'Server', 'NPC', 'Roles', 'Intelligent', 'Neutral', 'Kweebec', 'WalterWhite_Merchant.json')
-        try:
-            if os.path.exists(npc_path):
-                try:
-                    npc_data = load_json_file(npc_path)
-                    if isinstance(npc_data, dict):
-                        # Remove any existing invulnerable-style keys, then set canonical key
-                        npc_data.pop('Invulnerable', None)
-                        npc_data.pop('invulnerable', None)
-                        npc_data['Invulnerable'] = True
-                        dump_json_file(npc_data, npc_path)
-                except Exception:
-                    # If loading or writing fails, skip modification
-                    pass
-        except Exception:
-            pass
-
-        rezip_temp_dir_into_patched(mod_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
+        item = loads_json_bytes(data)
+    except Exception:
+        # If loading/parsing fails, keep this file as-is
+        return None
+    if isinstance(item, dict) and "Recipe" in item:
+        item.pop("Recipe", None)
+        return dumps_json_bytes(item)
+    return None
 
 
+@register_patch('resurrectable_dinos', prefix='Resurrectable',
+                message="Resurrectable Dinos -> REMOVING CRAFTING")
 def patch_ressurectable_dinos(mod_path):
-    temp_dir = None
-    temp_zip_path = None
-    try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(mod_path)
-        items_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items')
-        if os.path.exists(items_dir):
-            for root, _, files in os.walk(items_dir):
-                for fname in files:
-                    if not fname.lower().endswith('.json'):
-                        continue
-                    full_path = os.path.join(root, fname)
-                    try:
-                        data = load_json_file(full_path)
-                        if isinstance(data, dict) and "Recipe" in data:
-                            try:
-                                data.pop("Recipe", None)
-                                dump_json_file(data, full_path)
-                            except OSError:
-                                # If writing fails, skip this file
-                                pass
-                    except Exception:
-                        # If loading/parsing fails, skip this file
-                        pass
-
-        rezip_temp_dir_into_patched(mod_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
+    overlay = ZipOverlay(mod_path)
+    overlay.transform_matching('server/item/items/*.json', _strip_recipe, needle=b'"Recipe"', ignore_case=True)
+    overlay.write(patched_output_path(mod_path))
 
+@register_patch('overworld', prefix='Stray123.TheOverworld', patch_data='overworld')
 def patch_overworld(mod_path):
-    temp_dir = None
-    temp_zip_path = None
-    try:
-        temp_dir, temp_zip_path = create_temp_dir_for_modification(mod_path)
-
-        server_dir = os.path.join(temp_dir, 'Server')
-        src_instances = os.path.join(server_dir, 'instances')
-        dst_instances = os.path.join(server_dir, 'Instances')
+    with open_workspace(mod_path) as ws:
+        # The mod ships Server/instances, the game expects Server/Instances;
+        # merge into the correct-cased folder if both exist
+        ws.move('Server/instances', 'Server/Instances')
+
+        # Replace Ore_Diamond_Overworld.json and Overworld_Soil_Dirt.json with the patched versions if available
+        for name in ('Ore_Diamond_Overworld.json', 'Overworld_Soil_Dirt.json'):
+            src = os.path.join('patch_data', 'overworld', name)
+            if os.path.exists(src):
+                ws.copy_in(src, 'Server/Item/Items/' + name)
 
-        if os.path.exists(src_instances):
+        # Remove the "Recipe" key from Server/Item/Items/Overworld_Portal_Key.json if it exists
+        portal_path = 'Server/Item/Items/Overworld_Portal_Key.json'
+        if ws.isfile(portal_path):
             try:
-                # If the correct-cased target doesn't exist, a simple rename is fine.
-                if not os.path.exists(dst_instances):
-                    os.makedirs(os.path.dirname(dst_instances), exist_ok=True)
-                    os.rename(src_instances, dst_instances)
-                else:
-                    # Merge contents from 'instances' into 'Instances'
-                    for name in os.listdir(src_instances):
-                        s = os.path.join(src_instances, name)
-                        d = os.path.join(dst_instances, name)
-                        try:
-                            if os.path.exists(d):
-                                # If destination exists, attempt to merge/replace sensibly.
-                                if os.path.isdir(s) and os.path.isdir(d):
-                                    # Move contents of directory s into directory d
-                                    for root, dirs, files in os.walk(s):
-                                        rel = os.path.relpath(root, s)
-                                        target_root = os.path.join(d, rel) if rel != '.' else d
-                                        os.makedirs(target_root, exist_ok=True)
-                                        for f in files:
-                                            try:
-                                                shutil.move(os.path.join(root, f), os.path.join(target_root, f))
-                                            except OSError:
-                                                try:
-                                                    shutil.copy2(os.path.join(root, f), os.path.join(target_root, f))
-                                                except Exception:
-                                                    pass
-                                    # remove the source subtree
-                                    try:
-                                        shutil.rmtree(s)
-                                    except OSError:
-                                        pass
-                                else:
-                                    # For files or mismatched types, try to replace destination
-                                    try:
-                                        if os.path.isdir(d):
-                                            shutil.rmtree(d)
-                                        else:
-                                            os.remove(d)
-                                    except OSError:
-                                        pass
-                                    try:
-                                        shutil.move(s, d)
-                                    except OSError:
-                                        try:
-                                            if os.path.isdir(s):
-                                                shutil.copytree(s, d)
-                                                shutil.rmtree(s, ignore_errors=True)
-                                            else:
-                                                shutil.copy2(s, d)
-                                                os.remove(s)
-                                        except Exception:
-                                            pass
-                            else:
-                                shutil.move(s, d)
-                        except OSError:
-                            # Best-effort fallback: try copying then removing source
-                            try:
-                                if os.path.isdir(s):
-                                    shutil.copytree(s, d)
-                                    shutil.rmtree(s, ignore_errors=True)
-                                else:
-                                    shutil.copy2(s, d)
-                                    try:
-                                        os.remove(s)
-                                    except OSError:
-                                        pass
-                            except Exception:
-                                pass
-                    # finally, ensure the original folder is removed if empty
-                    try:
-                        if os.path.exists(src_instances):
-                            shutil.rmtree(src_instances)
-                    except OSError:
-                        pass
-            except OSError:
-                pass
-
-        # Replace Ore_Diamond_Overworld.json with the patched version if available
-        src_ore = os.path.join('patch_data', 'overworld', 'Ore_Diamond_Overworld.json')
-        dest_dir = os.path.join(temp_dir, 'Server', 'Item', 'Items')
-        dest_ore = os.path.join(dest_dir, 'Ore_Diamond_Overworld.json')
-        try:
-            if os.path.exists(src_ore):
-                os.makedirs(dest_dir, exist_ok=True)
-                try:
-                    if os.path.exists(dest_ore):
-                        os.remove(dest_ore)
-                except OSError:
-                    pass
-                shutil.copyfile(src_ore, dest_ore)
-        except OSError:
-            pass
+                portal_json = ws.read_json(portal_path)
+            except ValueError:
+                # If loading fails, keep the file as-is
+                portal_json = None
+            if isinstance(portal_json, dict) and "Recipe" in portal_json:
+                portal_json.pop("Recipe", None)
+                ws.write_json(portal_path, portal_json)
 
-        # Replace Server/Item/ItemsOverworld_Soil_Dirt.json with patched version if available
-        src_soil = os.path.join('patch_data', 'overworld', 'Overworld_Soil_Dirt.json')
-        dest_soil = os.path.join(temp_dir, 'Server', 'Item', 'Items','Overworld_Soil_Dirt.json')
-        try:
-            if os.path.exists(src_soil):
-                os.makedirs(os.path.dirname(dest_soil), exist_ok=True)
-                try:
-                    if os.path.exists(dest_soil):
-                        os.remove(dest_soil)
-                except OSError:
-                    pass
-                shutil.copyfile(src_soil, dest_soil)
-        except OSError:
-            pass
+        ws.write_zip(patched_output_path(mod_path))
 
-        # Remove the "Recipe" key from Server/Item/Items/Overworld_Portal_Key.json if it exists
-        portal_path = os.path.join(temp_dir, 'Server', 'Item', 'Items', 'Overworld_Portal_Key.json')
-        try:
-            if os.path.exists(portal_path):
-                try:
-                    portal_json = load_json_file(portal_path)
-                    if isinstance(portal_json, dict) and "Recipe" in portal_json:
-                        portal_json.pop("Recipe", None)
-                        dump_json_file(portal_json, portal_path)
-                except Exception:
-                    # If loading or writing fails, skip modification
-                    pass
-        except Exception:
-            pass
 
-        rezip_temp_dir_into_patched(mod_path, temp_dir)
-    finally:
-        try:
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        except OSError:
-            pass
-        try:
-            if temp_dir:
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
+# Mods described by patch_data/<mod>/patch_manifest.json need no Python of their own
+register_manifest_patches(REGISTRY)
@@ -0,0 +1,28 @@
+import os
+import time
+
+# Zip timestamps cannot go before 1980
+DEFAULT_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+FILE_MODE = 0o644
+CREATE_SYSTEM_UNIX = 3
+
+
+def fixed_date_time() -> tuple:
+    """
+    The timestamp every member gets: SOURCE_DATE_EPOCH if set (UTC, clamped
+    to 1980), otherwise 1980-01-01 00:00:00.
+    """
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if not epoch:
+        return DEFAULT_DATE_TIME
+    return max(time.gmtime(int(epoch))[:6], DEFAULT_DATE_TIME)
+
+
+def stamp(info):
+    """
+    Give a ZipInfo the fixed timestamp and permissions.
+    """
+    info.date_time = fixed_date_time()
+    info.external_attr = FILE_MODE << 16
+    info.create_system = CREATE_SYSTEM_UNIX
+    return info
@@ -0,0 +1,46 @@
+import zipfile
+
+import pytest
+
+from build_settings import BuildSettings
+from compression_policy import CompressionPolicy, CompressionPolicyError
+from zip_overlay import ZipOverlay
+
+
+def test_resolve_by_extension():
+    policy = CompressionPolicy.parse('png=store,json=deflate:9')
+    assert policy.resolve('Common/Icon.PNG', zipfile.ZIP_DEFLATED) == (zipfile.ZIP_STORED, None)
+    assert policy.resolve('Server/Item.json', zipfile.ZIP_STORED) == (zipfile.ZIP_DEFLATED, 9)
+    # No rule and no default: what the writer asked for
+    assert policy.resolve('Common/Sound.ogg', zipfile.ZIP_BZIP2) == (zipfile.ZIP_BZIP2, None)
+    assert CompressionPolicy.parse('*=deflate:1').resolve('a.ogg', zipfile.ZIP_STORED) == (zipfile.ZIP_DEFLATED, 1)
+
+
+def test_preset_and_spec():
+    policy = CompressionPolicy.parse('assets,*=deflate:6')
+    assert policy.resolve('a.png', zipfile.ZIP_DEFLATED) == (zipfile.ZIP_STORED, None)
+    assert policy.spec() == 'json=deflate:9,midi=store,ogg=store,png=store,*=deflate:6'
+    assert CompressionPolicy.parse(policy.spec()).spec() == policy.spec()
+
+
+@pytest.mark.parametrize('spec', ['png', 'png=zip', 'json=deflate:10', 'png=store:1', 'json=deflate:x'])
+def test_bad_specs(spec):
+    with pytest.raises(CompressionPolicyError):
+        CompressionPolicy.parse(spec)
+
+
+def test_written_members_follow_policy(tmp_path):
+    src = tmp_path / 'mod.zip'
+    with zipfile.ZipFile(src, 'w') as z:
+        z.writestr('Common/Kept.png', b'kept' * 100, compress_type=zipfile.ZIP_DEFLATED)
+    out_path = tmp_path / 'out.zip'
+    settings = BuildSettings(policy=CompressionPolicy.parse('png=store,json=deflate:9'))
+    (ZipOverlay(str(src))
+     .replace('Common/Icon.png', b'\x89PNG' * 100)
+     .replace('Server/Item.json', b'{"Name": "Item"}' * 100)
+     .write(str(out_path), settings=settings))
+    with zipfile.ZipFile(out_path) as out:
+        assert out.getinfo('Common/Icon.png').compress_type == zipfile.ZIP_STORED
+        assert out.getinfo('Server/Item.json').compress_type == zipfile.ZIP_DEFLATED
+        # Passthrough members keep their bytes whatever the policy says
+        assert out.getinfo('Common/Kept.png').compress_type == zipfile.ZIP_DEFLATED
@@ -0,0 +1,79 @@
+import pytest
+
+from json_patch import JsonPatchError, apply_json_patch, apply_operation, get_path, merge_patch, parse_pointer
+
+
+def test_parse_pointer_unescapes_tokens():
+    assert parse_pointer('/a~1b/c~0d/0') == ['a/b', 'c~d', '0']
+    assert parse_pointer('') == []
+    with pytest.raises(JsonPatchError):
+        parse_pointer('no/slash')
+
+
+def test_add_sets_missing_leaf_key():
+    doc = {'AnimationSets': {'Idle': {}}}
+    doc = apply_operation(doc, {'op': 'add', 'path': '/AnimationSets/Idle/Animations', 'value': [1]})
+    assert doc == {'AnimationSets': {'Idle': {'Animations': [1]}}}
+
+
+def test_add_replaces_existing_leaf_key():
+    doc = {'StatModifiers': {'Health': 10}}
+    doc = apply_operation(doc, {'op': 'add', 'path': '/StatModifiers/Health', 'value': 30})
+    assert doc == {'StatModifiers': {'Health': 30}}
+
+
+def test_add_needs_the_parent():
+    with pytest.raises(JsonPatchError):
+        apply_operation({}, {'op': 'add', 'path': '/StatModifiers/Health', 'value': 30})
+
+
+def test_replace_missing_leaf_key_fails():
+    with pytest.raises(JsonPatchError):
+        apply_operation({'StatModifiers': {}}, {'op': 'replace', 'path': '/StatModifiers/Health', 'value': 30})
+
+
+def test_replace_missing_leaf_key_optional_is_skipped():
+    doc = {'StatModifiers': {}}
+    op = {'op': 'replace', 'path': '/StatModifiers/Health', 'value': 30, 'optional': True}
+    assert apply_operation(doc, op) == {'StatModifiers': {}}
+
+
+def test_list_ops():
+    doc = {'Items': ['a', 'c']}
+    doc = apply_json_patch(doc, [
+        {'op': 'add', 'path': '/Items/1', 'value': 'b'},
+        {'op': 'add', 'path': '/Items/-', 'value': 'd'},
+        {'op': 'remove', 'path': '/Items/0'},
+        {'op': 'replace', 'path': '/Items/0', 'value': 'B'},
+    ])
+    assert doc == {'Items': ['B', 'c', 'd']}
+
+
+def test_move_copy_and_test():
+    doc = {'a': {'x': 1}, 'b': {}}
+    doc = apply_json_patch(doc, [
+        {'op': 'move', 'from': '/a/x', 'path': '/b/x'},
+        {'op': 'copy', 'from': '/b/x', 'path': '/b/y'},
+        {'op': 'test', 'path': '/b/y', 'value': 1},
+    ])
+    assert doc == {'a': {}, 'b': {'x': 1, 'y': 1}}
+    with pytest.raises(JsonPatchError):
+        apply_operation(doc, {'op': 'test', 'path': '/b/y', 'value': 2})
+
+
+def test_failed_move_leaves_document_intact():
+    doc = {'a': {'x': 1}}
+    with pytest.raises(JsonPatchError):
+        apply_operation(doc, {'op': 'move', 'from': '/a/x', 'path': '/missing/x'})
+    assert doc == {'a': {'x': 1}}
+
+
+def test_merge_patch():
+    assert merge_patch({'a': 1, 'b': {'c': 2, 'd': 3}}, {'a': None, 'b': {'c': 4}}) == {'b': {'c': 4, 'd': 3}}
+    doc = apply_operation({'Shop': {'Price': 1, 'Stock': 2}}, {'op': 'merge', 'path': '/Shop', 'value': {'Price': 5}})
+    assert get_path(doc, '/Shop') == {'Price': 5, 'Stock': 2}
+
+
+def test_unknown_op():
+    with pytest.raises(JsonPatchError):
+        apply_operation({}, {'op': 'frobnicate', 'path': ''})
@@ -0,0 +1,97 @@
+import io
+import json
+import random
+import zipfile
+
+import bsdiff4
+import pytest
+
+from make_bin_diff import BIN_PATCH_INDEX, create_tree_patches, load_patch_hashes, patch_stream
+from patch_manifest import apply_bin_patch_index
+from zip_overlay import ZipOverlay
+
+
+def make_pair(seed: int, size: int):
+    rng = random.Random(seed)
+    old = bytes(rng.randrange(256) for _ in range(size))
+    new = bytearray(old)
+    for _ in range(size // 200 + 1):
+        pos = rng.randrange(len(new))
+        new[pos:pos + rng.randrange(1, 40)] = bytes(rng.randrange(256) for _ in range(rng.randrange(0, 60)))
+    return old, bytes(new) + b'appended tail'
+
+
+@pytest.mark.parametrize('chunk_size', [7, 256, 1024 * 1024])
+@pytest.mark.parametrize('seed,size', [(1, 5000), (2, 20000), (3, 64)])
+def test_patch_stream_matches_bsdiff4(seed, size, chunk_size):
+    old, new = make_pair(seed, size)
+    patch = bsdiff4.diff(old, new)
+    out = io.BytesIO()
+    written = patch_stream(memoryview(old), patch, out, chunk_size=chunk_size)
+    assert out.getvalue() == bsdiff4.patch(old, patch) == new
+    assert written == len(new)
+
+
+def test_patch_stream_checks_declared_size():
+    old, new = make_pair(4, 5000)
+    patch = bsdiff4.diff(old, new)
+    for len_dst in (len(new) + 5, len(new) - 5):
+        bad = patch[:24] + bsdiff4.core.encode_int64(len_dst) + patch[32:]
+        with pytest.raises(ValueError, match='corrupt patch'):
+            patch_stream(old, bad, io.BytesIO())
+
+
+@pytest.fixture
+def tree(tmp_path):
+    old, new = make_pair(5, 8000)
+    original = tmp_path / 'mod.zip'
+    with zipfile.ZipFile(original, 'w') as z:
+        z.writestr('Common/Texture.png', old)
+        z.writestr('Server/Same.json', '{"Same": true}')
+    edited = tmp_path / 'edited'
+    (edited / 'Common').mkdir(parents=True)
+    (edited / 'Server' / 'New').mkdir(parents=True)
+    (edited / 'Common' / 'Texture.png').write_bytes(new)
+    (edited / 'Server' / 'Same.json').write_text('{"Same": true}')
+    (edited / 'Server' / 'New' / 'Added.json').write_text('{"Added": true}')
+    return str(original), str(edited), new
+
+
+def test_create_tree_indexes_changed_and_new_files(tmp_path, tree):
+    original, edited, new = tree
+    out_dir = tmp_path / 'patch_data'
+    assert create_tree_patches(original, edited, str(out_dir), jobs=2) == 0
+    index = json.loads((out_dir / BIN_PATCH_INDEX).read_text())
+    assert index == {
+        'original': 'mod.zip',
+        'patches': [{'member': 'Common/Texture.png', 'patch': 'patches/Common/Texture.png.patch'}],
+        'files': [{'member': 'Server/New/Added.json', 'source': 'files/Server/New/Added.json'}],
+    }
+    hashes = load_patch_hashes(str(out_dir / 'patches' / 'Common' / 'Texture.png.patch'))
+    assert hashes['target_size'] == len(new)
+
+    out_path = tmp_path / 'out.zip'
+    apply_bin_patch_index(ZipOverlay(original), str(out_dir)).write(str(out_path))
+    with zipfile.ZipFile(out_path) as out:
+        assert out.read('Common/Texture.png') == new
+        assert out.read('Server/Same.json') == b'{"Same": true}'
+        assert out.read('Server/New/Added.json') == b'{"Added": true}'
+
+
+def test_create_tree_from_directory(tmp_path, tree):
+    original, edited, new = tree
+    original_dir = tmp_path / 'original'
+    with zipfile.ZipFile(original) as z:
+        z.extractall(original_dir)
+    out_dir = tmp_path / 'patch_data'
+    assert create_tree_patches(str(original_dir), edited, str(out_dir), jobs=1) == 0
+    index = json.loads((out_dir / BIN_PATCH_INDEX).read_text())
+    assert [p['member'] for p in index['patches']] == ['Common/Texture.png']
+    assert [f['member'] for f in index['files']] == ['Server/New/Added.json']
+    patch = (out_dir / 'patches' / 'Common' / 'Texture.png.patch').read_bytes()
+    assert bsdiff4.patch((original_dir / 'Common' / 'Texture.png').read_bytes(), patch) == new
+
+
+def test_create_tree_missing_original(tmp_path):
+    (tmp_path / 'edited').mkdir()
+    assert create_tree_patches(str(tmp_path / 'missing.zip'), str(tmp_path / 'edited'), str(tmp_path / 'out')) == 2
@@ -0,0 +1,75 @@
+import json
+import os
+import zipfile
+
+from mod_catalog import CATALOG_FILE_NAME, ModCatalog, catalog_for
+
+
+def make_mod(path, members, manifest=None):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        if manifest is not None:
+            z.writestr('manifest.json', json.dumps(manifest))
+        for name, data in members.items():
+            z.writestr(name, data)
+
+
+def test_member_queries(tmp_path):
+    mods = tmp_path / 'mods'
+    (mods / 'patched').mkdir(parents=True)
+    make_mod(mods / 'A.zip', {'Server/Item/Items/Sword.json': '{}', 'Server/Song/a.midi': 'aa'},
+             manifest={'Group': 'Test', 'Name': 'A', 'Version': '1.0'})
+    make_mod(mods / 'B.zip', {'Server/Item/Items/Sword.json': '{"x": 1}', 'Server/Item/Items_Extra.json': '{}'})
+    make_mod(mods / 'patched' / 'A-trw.zip', {'Server/Item/Items/Sword.json': '{}'},
+             manifest={'Group': 'Test', 'Name': 'A', 'Version': '1.0'})
+    with ModCatalog(str(mods / 'patched' / CATALOG_FILE_NAME)) as catalog:
+        assert catalog.refresh(str(mods)) == ['A.zip', 'B.zip']
+        catalog.refresh(str(mods), ['patched/A-trw.zip'])
+        assert catalog.archives() == ['A.zip', 'B.zip', 'patched/A-trw.zip']
+
+        rows = catalog.members('B.zip', 'Server/Item/Items/')
+        assert [row[0] for row in rows] == ['Server/Item/Items/Sword.json']
+        path, file_size, compress_size, crc, offset, compress_type = rows[0]
+        with zipfile.ZipFile(mods / 'B.zip') as z:
+            info = z.getinfo(path)
+        assert (file_size, compress_size, crc, offset, compress_type) == \
+            (info.file_size, info.compress_size, info.CRC, info.header_offset, info.compress_type)
+
+        assert catalog.has_member('A.zip', 'Server/Song/a.midi')
+        assert not catalog.has_member('B.zip', 'Server/Song/a.midi')
+        assert catalog.archives_with('Server/Item/Items/Sword.json') == ['A.zip', 'B.zip', 'patched/A-trw.zip']
+        assert catalog.shared_paths(['A.zip', 'B.zip']) == [('Server/Item/Items/Sword.json', ['A.zip', 'B.zip'])]
+
+        assert catalog.identity('A.zip') == ('Test:A', '1.0')
+        # Patched outputs keep the source's id but are not separate mods
+        assert catalog.archives_with_id('Test:A') == ['A.zip']
+
+
+def test_refresh_rescans_only_changed_archives(tmp_path):
+    mods = tmp_path / 'mods'
+    mods.mkdir()
+    make_mod(mods / 'A.zip', {'a.json': '{}'})
+    make_mod(mods / 'B.zip', {'b.json': '{}'})
+    with ModCatalog(str(tmp_path / CATALOG_FILE_NAME)) as catalog:
+        catalog.refresh(str(mods))
+        assert catalog.refresh(str(mods)) == []
+        make_mod(mods / 'B.zip', {'b.json': '{}', 'c.json': '[]'})
+        os.utime(mods / 'B.zip', ns=(1, 1))
+        assert catalog.refresh(str(mods)) == ['B.zip']
+        assert [row[0] for row in catalog.members('B.zip')] == ['b.json', 'c.json']
+        # Refreshing a subset keeps the others; deleted files are dropped
+        catalog.refresh(str(mods), ['A.zip'])
+        assert catalog.archives() == ['A.zip', 'B.zip']
+        os.remove(mods / 'B.zip')
+        catalog.refresh(str(mods))
+        assert catalog.archives() == ['A.zip']
+        assert catalog.members('B.zip') == []
+
+
+def test_catalog_for_mod_path(tmp_path):
+    mods = tmp_path / 'mods'
+    mods.mkdir()
+    make_mod(mods / 'A.jar', {'Server/YmmersiveMelodies/x.json': '{}', 'Other/y.class': 'y'})
+    with catalog_for(str(mods / 'A.jar')) as catalog:
+        assert [row[0] for row in catalog.members('A.jar', 'Server/YmmersiveMelodies/')] == \
+            ['Server/YmmersiveMelodies/x.json']
+    assert (mods / 'patched' / CATALOG_FILE_NAME).is_file()
@@ -0,0 +1,55 @@
+import json
+import zipfile
+
+import pytest
+
+from patch_manifest import apply_manifest
+from zip_overlay import ZipOverlay
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'mod.zip'
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('Server/Item.json', '{"Name": "Item", "Old": 1}')
+        z.writestr('Server/Broken.json', b'\xff\xfe not json {')
+    return str(path)
+
+
+def test_optional_key_ops_skip_non_json_member(tmp_path, source):
+    manifest = {'operations': [
+        {'op': 'drop_key', 'path': 'Server/Broken.json', 'key': 'Old'},
+        {'op': 'set_key', 'path': 'Server/Broken.json', 'key': 'New', 'value': 2},
+        {'op': 'drop_key', 'path': 'Server/Item.json', 'key': 'Old'},
+        {'op': 'set_key', 'path': 'Server/Item.json', 'key': 'New', 'value': 2},
+    ]}
+    out_path = tmp_path / 'out.zip'
+    apply_manifest(ZipOverlay(source), manifest, str(tmp_path)).write(str(out_path))
+    with zipfile.ZipFile(out_path) as out:
+        assert out.read('Server/Broken.json') == b'\xff\xfe not json {'
+        assert json.loads(out.read('Server/Item.json')) == {'Name': 'Item', 'New': 2}
+
+
+def test_json_patch_on_non_json_member_fails(tmp_path, source):
+    manifest = {'operations': [
+        {'op': 'json_patch', 'path': 'Server/Broken.json', 'ops': [{'op': 'add', 'path': '/New', 'value': 2}]},
+    ]}
+    with pytest.raises(ValueError):
+        apply_manifest(ZipOverlay(source), manifest, str(tmp_path)).write(str(tmp_path / 'out.zip'))
+    assert not (tmp_path / 'out.zip').exists()
+
+
+def test_json_patch_step_applies_ops(tmp_path, source):
+    manifest = {'operations': [
+        {'op': 'json_patch', 'path': 'Server/Item.json', 'ops': [
+            {'op': 'replace', 'path': '/Name', 'value': 'Renamed'},
+            {'op': 'add', 'path': '/Tags', 'value': ['a']},
+        ]},
+        {'op': 'json_patch', 'path': 'Server/Item.json', 'optional': True, 'ops': [
+            {'op': 'remove', 'path': '/Missing'},
+        ]},
+    ]}
+    out_path = tmp_path / 'out.zip'
+    apply_manifest(ZipOverlay(source), manifest, str(tmp_path)).write(str(out_path))
+    with zipfile.ZipFile(out_path) as out:
+        assert json.loads(out.read('Server/Item.json')) == {'Name': 'Renamed', 'Old': 1, 'Tags': ['a']}
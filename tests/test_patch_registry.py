@@ -0,0 +1,62 @@
+import pytest
+
+from patch_registry import PatchRegistry
+
+
+def noop(mod_path):
+    pass
+
+
+@pytest.fixture
+def registry():
+    registry = PatchRegistry()
+    registry.register('gambling', prefix='GAMBLING')(noop)
+    registry.register('walter', prefix='Walter', contains='White', suffix='.zip')(noop)
+    registry.register('plush', contains='Plush')(noop)
+    registry.register('teto', prefix='Teto_Plush')(noop)
+    registry.register('dotted', prefix='a.b+c', suffix='.jar')(noop)
+    registry.register('by_id', mod_ids='Group:Name')(noop)
+    return registry
+
+
+def name_of(spec):
+    return spec.name if spec is not None else None
+
+
+@pytest.mark.parametrize('file_name,expected', [
+    ('GAMBLING-1.0.zip', 'gambling'),
+    ('gambling-1.0.zip', None),
+    ('WalterWhite-1.zip', 'walter'),
+    ('Walter_and_White.zip', 'walter'),
+    ('WalterWhite-1.jar', None),
+    ('White-Walter.zip', None),
+    ('Violets_Plushies-1.zip', 'plush'),
+    # Earlier registrations win, like the old if/elif chain
+    ('Teto_Plush-1.zip', 'plush'),
+    ('a.b+c-2.jar', 'dotted'),
+    ('aXb+c-2.jar', None),
+    ('a.bbc-2.jar', None),
+    ('Group:Name', None),
+    ('Multi\nLine Plush.zip', 'plush'),
+])
+def test_match_routes_file_names(registry, file_name, expected):
+    assert name_of(registry.match(file_name)) == expected
+
+
+def test_match_recompiles_after_register(registry):
+    assert registry.match('Later-1.zip') is None
+    registry.register('later', prefix='Later')(noop)
+    assert name_of(registry.match('Later-1.zip')) == 'later'
+
+
+def test_match_id_and_duplicates(registry):
+    assert name_of(registry.match_id('Group:Name')) == 'by_id'
+    assert registry.match_id('Other:Name') is None
+    with pytest.raises(ValueError):
+        registry.register('gambling', prefix='Other')(noop)
+    with pytest.raises(ValueError):
+        registry.register('nothing')(noop)
+
+
+def test_empty_registry_matches_nothing():
+    assert PatchRegistry().match('GAMBLING.zip') is None
@@ -0,0 +1,34 @@
+import json
+import os
+import zipfile
+
+import patches
+from patch_registry import patched_output_path
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_mod(path, members):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, doc in members.items():
+            z.writestr(name, doc if isinstance(doc, bytes) else json.dumps(doc))
+
+
+def test_labubu_idle_animation_is_set_when_missing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.symlink(os.path.join(REPO_ROOT, 'patch_data'), 'patch_data')
+    mod_path = os.path.join('mods', 'EpicsLabubuPets-1.zip')
+    make_mod(mod_path, {
+        'manifest.json': {'Name': 'Labubu'},
+        'Server/Models/Intelligent/Kweebec/LabubuBasic.json': {'AnimationSets': {'Idle': {}}},
+        'Server/Models/Intelligent/Kweebec/LabubuNoEars.json': {'AnimationSets': {'Idle': {'Animations': []}}},
+    })
+    patches.epics_labubu_patch(mod_path)
+    with zipfile.ZipFile(patched_output_path(mod_path)) as z:
+        assert z.testzip() is None
+        for name in ('LabubuBasic.json', 'LabubuNoEars.json'):
+            model = json.loads(z.read('Server/Models/Intelligent/Kweebec/' + name))
+            animations = model['AnimationSets']['Idle']['Animations']
+            assert animations[0]['Animation'].endswith('LabubuIdle.blockyanim')
+        assert 'Server/Item/Items/EggSpawner/Epics_LabubuEgg_Basic.json' in z.namelist()
@@ -0,0 +1,73 @@
+import json
+import zipfile
+
+import pytest
+
+import build_settings
+from build_settings import BuildSettings
+from workspace import BACKENDS, open_workspace
+
+
+@pytest.fixture
+def deterministic():
+    with build_settings.use(BuildSettings(deterministic=True)):
+        yield
+
+
+def make_source(path):
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('manifest.json', '{"Name": "Test"}', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Server/instances/a.json', '{"b": 1, "a": 2}', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Server/instances/sub/c.json', '[]', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Server/Item/Items/Portal.json', '{"Name": "Portal"}', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Server/Item/Items/Old.json', '{}', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Common/Icon.png', b'\x89PNG' + bytes(range(256)) * 8, compress_type=zipfile.ZIP_STORED)
+        z.writestr('Other/Skip.txt', 'not loaded')
+    return str(path)
+
+
+def edit(ws, extra_file):
+    ws.move('Server/instances', 'Server/Instances')
+    portal = ws.read_json('Server/Item/Items/Portal.json')
+    portal['Keys'] = {'z': 1, 'a': 2}
+    ws.write_json('Server/Item/Items/Portal.json', portal)
+    ws.copy_in(extra_file, 'Server/Item/Items/Extra.json')
+    ws.copy('Common/Icon.png', 'Common/IconCopy.png')
+    ws.remove('Server/Item/Items/Old.json')
+
+
+def test_backends_write_identical_bytes(tmp_path, deterministic):
+    src = make_source(tmp_path / 'mod.zip')
+    extra = tmp_path / 'Extra.json'
+    extra.write_text(json.dumps({'Extra': True}))
+    outputs = {}
+    for backend in BACKENDS:
+        out_path = tmp_path / f'{backend}.zip'
+        with open_workspace(src, ['Other/Skip.txt'], 'remove', backend=backend) as ws:
+            edit(ws, str(extra))
+            ws.write_zip(str(out_path))
+        outputs[backend] = out_path.read_bytes()
+        with zipfile.ZipFile(out_path) as z:
+            assert z.testzip() is None
+            assert z.namelist() == sorted(z.namelist())
+            assert 'Server/Instances/sub/c.json' in z.namelist()
+            assert 'Server/Item/Items/Old.json' not in z.namelist()
+            assert 'Other/Skip.txt' not in z.namelist()
+            assert z.read('Server/Instances/a.json') == b'{"b": 1, "a": 2}'
+    assert outputs['memory'] == outputs['disk']
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_untouched_members_are_copied_raw(tmp_path, backend):
+    src = make_source(tmp_path / 'mod.zip')
+    out_path = tmp_path / 'out.zip'
+    with open_workspace(src, backend=backend) as ws:
+        ws.move('Server/instances/a.json', 'Server/Moved.json')
+        ws.write_zip(str(out_path))
+    with zipfile.ZipFile(src) as source, zipfile.ZipFile(out_path) as out:
+        assert out.testzip() is None
+        moved = out.getinfo('Server/Moved.json')
+        original = source.getinfo('Server/instances/a.json')
+        assert (moved.CRC, moved.compress_size, moved.date_time) == \
+            (original.CRC, original.compress_size, original.date_time)
+        assert out.getinfo('Common/Icon.png').compress_type == zipfile.ZIP_STORED
@@ -0,0 +1,156 @@
+import json
+import zipfile
+
+import pytest
+
+import instrumentation
+import patch_bundle
+from build_settings import BuildSettings
+from make_bin_diff import PatchMismatchError, create_patch
+from zip_overlay import ZipOverlay
+
+WRITERS = {
+    'sequential': {},
+    'parallel': {'compress_workers': 3},
+    'pipelined': {'pipeline_workers': 3},
+}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'mod.zip'
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('manifest.json', '{"Name": "Test"}', compress_type=zipfile.ZIP_DEFLATED)
+        for i in range(80):
+            z.writestr(f'Server/Item/Items/Item{i}.json', json.dumps({'Id': i, 'Pad': 'x' * i}),
+                       compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Server/Drops/NPCs/Goblin.json', '{}', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Server/Drops/NPCs/Trork.json', '{}', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Server/Effects/Heal.json', '{"StatModifiers": {}}', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Common/Icon.png', bytes(range(256)) * 16, compress_type=zipfile.ZIP_STORED)
+        z.writestr('Common/Sound.ogg', bytes(range(256)) * 64, compress_type=zipfile.ZIP_BZIP2)
+    return str(path)
+
+
+@pytest.fixture
+def counters():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def check_output(source, out_path):
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(out_path) as out:
+        assert out.testzip() is None
+        names = out.namelist()
+        assert len(names) == len(set(names))
+        assert 'Server/Drops/NPCs/Goblin.json' not in names
+        assert 'Server/Drops/NPCs/Trork.json' not in names
+        assert 'Server/Item/Items/Item3.json' not in names
+        assert out.read('Server/Items/Item5.json') == src.read('Server/Item/Items/Item5.json')
+        assert out.read('Common/Icon.png') == src.read('Common/Icon.png')
+        assert out.read('Common/Sound.ogg') == src.read('Common/Sound.ogg')
+        assert out.getinfo('Common/Sound.ogg').compress_type == zipfile.ZIP_BZIP2
+        assert json.loads(out.read('Server/Effects/Heal.json')) == {'StatModifiers': {'Health': 30}}
+        assert out.read('Server/Added.json') == b'{"Added": true}'
+        return names
+
+
+def overlay_for(source):
+    return (ZipOverlay(source)
+            .drop_prefix('Server/Drops/NPCs/')
+            .drop('Server/Item/Items/Item3.json')
+            .rename_prefix('Server/Item/Items/', 'Server/Items/')
+            .rename('Server/Item/Items/Item7.json', 'Server/Seven.json')
+            .json_patch('Server/Effects/Heal.json', [{"op": "add", "path": "/StatModifiers/Health", "value": 30}])
+            .replace('Server/Added.json', b'{"Added": true}'))
+
+
+@pytest.mark.parametrize('writer', WRITERS)
+def test_round_trip(tmp_path, source, counters, writer):
+    out_path = tmp_path / 'out.zip'
+    overlay_for(source).write(str(out_path), **WRITERS[writer])
+    names = check_output(source, out_path)
+    assert 'Server/Seven.json' in names
+    assert 'Server/Items/Item7.json' not in names
+    counts = instrumentation.snapshot()["counters"]
+    # Everything but the patched JSON and the added member is copied raw
+    assert counts["members_raw_copied"] == len(names) - 2
+
+
+@pytest.mark.parametrize('writer', WRITERS)
+def test_writers_match(tmp_path, source, writer):
+    settings = BuildSettings(deterministic=True)
+    overlay_for(source).write(str(tmp_path / 'sequential.zip'), settings=settings)
+    overlay_for(source).write(str(tmp_path / f'{writer}-2.zip'), settings=settings, **WRITERS[writer])
+    assert (tmp_path / 'sequential.zip').read_bytes() == (tmp_path / f'{writer}-2.zip').read_bytes()
+
+
+def test_raw_copy_keeps_compressed_bytes(tmp_path, source):
+    out_path = tmp_path / 'out.zip'
+    ZipOverlay(source).rename('Common/Sound.ogg', 'Common/Moved.ogg').write(str(out_path))
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(out_path) as out:
+        assert out.testzip() is None
+        for info in src.infolist():
+            copied = out.getinfo('Common/Moved.ogg' if info.filename == 'Common/Sound.ogg' else info.filename)
+            assert (copied.CRC, copied.compress_type, copied.compress_size, copied.date_time) == \
+                (info.CRC, info.compress_type, info.compress_size, info.date_time)
+
+
+@pytest.mark.parametrize('writer', WRITERS)
+def test_precompressed_splice(tmp_path, source, monkeypatch, counters, writer):
+    data_root = tmp_path / 'patch_data'
+    (data_root / 'test' / 'Server').mkdir(parents=True)
+    replacement = data_root / 'test' / 'Server' / 'New.json'
+    replacement.write_text(json.dumps({'New': list(range(100))}))
+    monkeypatch.setattr(patch_bundle, 'PATCH_DATA_ROOT', str(data_root))
+    out_path = tmp_path / 'out.zip'
+    plain_path = tmp_path / 'plain.zip'
+    ZipOverlay(source).replace('Server/New.json', str(replacement)).write(
+        str(out_path), settings=BuildSettings(bundle_dir=str(tmp_path / 'bundles')), **WRITERS[writer])
+    assert instrumentation.snapshot()["counters"]["members_spliced"] == 1
+    ZipOverlay(source).replace('Server/New.json', str(replacement)).write(str(plain_path), **WRITERS[writer])
+    with zipfile.ZipFile(out_path) as out, zipfile.ZipFile(plain_path) as plain:
+        assert out.testzip() is None
+        assert out.read('Server/New.json') == replacement.read_bytes()
+        spliced, written = out.getinfo('Server/New.json'), plain.getinfo('Server/New.json')
+        assert (spliced.CRC, spliced.compress_size) == (written.CRC, written.compress_size)
+
+
+@pytest.fixture
+def bsdiff_patch(tmp_path, source):
+    with zipfile.ZipFile(source) as src:
+        old = src.read('Common/Icon.png')
+    new = old[::-1] + b'patched'
+    (tmp_path / 'old.bin').write_bytes(old)
+    (tmp_path / 'new.bin').write_bytes(new)
+    patch_path = str(tmp_path / 'Icon.png.patch')
+    assert create_patch(str(tmp_path / 'old.bin'), str(tmp_path / 'new.bin'), patch_path) == 0
+    return patch_path, old, new
+
+
+def test_bsdiff_checks_recorded_hashes(tmp_path, source, bsdiff_patch):
+    patch_path, old, new = bsdiff_patch
+    out_path = tmp_path / 'out.zip'
+    ZipOverlay(source).apply_bsdiff('Common/Icon.png', patch_path).write(str(out_path))
+    with zipfile.ZipFile(out_path) as out:
+        assert out.read('Common/Icon.png') == new
+    # Already patched: passed through unchanged
+    again_path = tmp_path / 'again.zip'
+    ZipOverlay(str(out_path)).apply_bsdiff('Common/Icon.png', patch_path).write(str(again_path))
+    with zipfile.ZipFile(again_path) as again:
+        assert again.read('Common/Icon.png') == new
+
+
+@pytest.mark.parametrize('content', [b'x' * 10, None], ids=['size', 'sha256'])
+def test_bsdiff_rejects_changed_upstream(tmp_path, source, bsdiff_patch, content):
+    patch_path, old, new = bsdiff_patch
+    changed = tmp_path / 'changed.zip'
+    with zipfile.ZipFile(changed, 'w') as z:
+        z.writestr('Common/Icon.png', content if content is not None else bytes(len(old)))
+    out_path = tmp_path / 'out.zip'
+    with pytest.raises(PatchMismatchError):
+        ZipOverlay(str(changed)).apply_bsdiff('Common/Icon.png', patch_path).write(str(out_path))
+    assert not out_path.exists()
@@ -0,0 +1,463 @@
+import contextlib
+import functools
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from zip_overlay import ParallelZipWriter, ZipOverlay, copy_stream, compress_member, normalize_arcname
+import build_settings
+import instrumentation
+import reproducible
+
+# 'disk' extracts under tempfile's folder (TMPDIR, so it can point at a tmpfs)
+BACKENDS = ('memory', 'disk')
+
+
+def include_member(member: str, paths, mode: str) -> bool:
+    """
+    Whether a source member is loaded for create_temp_dir_for_modification
+    style `paths`/`mode` ('keep' only those paths, 'remove' all but them).
+    """
+    if mode == 'keep':
+        if paths:
+            return member in paths
+    elif mode == 'remove':
+        if paths and member in paths:
+            return False
+    return True
+
+
+def _norm_paths(paths):
+    if not paths:
+        return None
+    return {normalize_arcname(p) for p in paths}
+
+
+def _under(name: str, path: str) -> bool:
+    return not path or name.startswith(path + '/')
+
+
+class Workspace:
+    """
+    A scratch tree of archive members that patch functions edit in place of
+    a temp dir: exists/isdir/listdir/walk, read/write bytes and JSON, copy,
+    move (merging directories), remove and rmtree. Paths are archive style,
+    '/' separated and relative to the workspace root. write_zip() packs the
+    tree into the patched archive through a ZipOverlay over the source, so
+    every backend writes the same bytes, as `settings` (default:
+    build_settings.current()) say.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = build_settings.current() if settings is None else settings
+        self.closed = False
+        self._src_path = None
+        self._src_names = set()
+        # Bytes inflated reading source members, for dry-run estimates
+        self.inflated = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_json(self, path: str):
+        return json.loads(self.read_bytes(path).decode('utf-8'))
+
+    def write_json(self, path: str, data):
+        """
+        Same formatting as patches.dump_json_file.
+        """
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+        self.write_bytes(path, text.encode('utf-8'))
+
+    def copy(self, src: str, dst: str):
+        self.write_bytes(normalize_arcname(dst), self.read_bytes(normalize_arcname(src)))
+
+    def copy_in(self, disk_path: str, dst: str):
+        """
+        Copy a file from the real filesystem (e.g. patch_data) into the tree.
+        """
+        with open(disk_path, 'rb') as f:
+            self.write_bytes(normalize_arcname(dst), f.read())
+
+    def move(self, src: str, dst: str):
+        """
+        Move a file or directory. A directory moved onto an existing one is
+        merged into it, files already there are replaced.
+        """
+        src = normalize_arcname(src)
+        dst = normalize_arcname(dst)
+        if src == dst or not self.exists(src):
+            return
+        if src.lower() == dst.lower():
+            # Case-only rename: on case-insensitive disks src and dst are the
+            # same folder, so go through a temporary name
+            tmp = src + '.trw-move'
+            self.move(src, tmp)
+            src = tmp
+        if self.isdir(src):
+            if self.exists(dst) and not self.isdir(dst):
+                self.remove(dst)
+            for name in self.files(src):
+                self._move_file(name, dst + name[len(src):])
+            self.rmtree(src)
+        else:
+            if self.isdir(dst):
+                self.rmtree(dst)
+            self._move_file(src, dst)
+
+    def overlay(self) -> ZipOverlay:
+        """
+        A ZipOverlay over the source archive that writes the tree: members
+        still untouched from the source are kept (renamed where they were
+        moved) and everything else replaces or adds a member.
+        """
+        if self._src_path is None:
+            raise ValueError("write_zip needs a workspace loaded from an archive")
+        overlay = ZipOverlay(self._src_path)
+        kept = set()
+        written = []
+        for name, src_name, content in self._members():
+            if src_name is None:
+                written.append((name, content))
+                continue
+            kept.add(src_name)
+            if src_name != name:
+                overlay.rename(src_name, name)
+        for name, content in written:
+            if name in self._src_names and name not in kept:
+                # Rewritten in place: keeps the source member's metadata
+                kept.add(name)
+            overlay.replace(name, content)
+        overlay.keep(kept)
+        return overlay
+
+    def write_zip(self, out_path: str) -> str:
+        """
+        Pack the tree into out_path: source members nobody changed keep their
+        compressed bytes, written ones are compressed as the compression
+        policy says. Members are sorted in deterministic mode.
+        """
+        overlay = self.overlay()
+        if self.settings.dry_run:
+            plan = overlay.estimate(out_path, settings=self.settings)
+            plan["inflate_bytes"] += self.inflated
+            self.settings.record(plan)
+            return out_path
+        with instrumentation.span("workspace_write"):
+            return overlay.write(out_path, settings=self.settings)
+
+    def walk(self, top: str = ''):
+        """
+        os.walk-like (root, dirs, files) tuples, sorted, roots relative to
+        the workspace.
+        """
+        top = normalize_arcname(top).rstrip('/')
+        if top and not self.isdir(top):
+            return
+        dirs = []
+        files = []
+        for name in self.listdir(top):
+            path = f"{top}/{name}" if top else name
+            (dirs if self.isdir(path) else files).append(name)
+        yield top, dirs, files
+        for d in dirs:
+            yield from self.walk(f"{top}/{d}" if top else d)
+
+
+class MemoryWorkspace(Workspace):
+    """
+    Workspace held in a dict. Members loaded from the source archive stay
+    references to it until read or replaced, and untouched ones are copied
+    into the output raw, without being inflated or deflated.
+    """
+
+    def __init__(self, settings=None):
+        super().__init__(settings)
+        self._files = {}
+        self._src_zip = None
+
+    def load(self, src_zip_path: str, paths=None, mode: str = 'keep'):
+        paths = _norm_paths(paths)
+        self._src_path = src_zip_path
+        self._src_zip = zipfile.ZipFile(src_zip_path, 'r')
+        for info in self._src_zip.infolist():
+            if info.is_dir():
+                continue
+            self._src_names.add(info.filename)
+            if not include_member(info.filename, paths, mode):
+                continue
+            self._files[info.filename] = info
+            instrumentation.count("members_processed")
+        return self
+
+    def close(self):
+        self._files.clear()
+        if self._src_zip is not None:
+            self._src_zip.close()
+            self._src_zip = None
+        self.closed = True
+
+    def exists(self, path: str) -> bool:
+        path = normalize_arcname(path).rstrip('/')
+        return path in self._files or self.isdir(path)
+
+    def isdir(self, path: str) -> bool:
+        path = normalize_arcname(path).rstrip('/')
+        return any(_under(name, path) for name in self._files)
+
+    def isfile(self, path: str) -> bool:
+        return normalize_arcname(path) in self._files
+
+    def listdir(self, path: str = '') -> list:
+        path = normalize_arcname(path).rstrip('/')
+        start = len(path) + 1 if path else 0
+        return sorted({name[start:].split('/', 1)[0] for name in self._files if _under(name, path)})
+
+    def files(self, path: str = '') -> list:
+        path = normalize_arcname(path).rstrip('/')
+        return [name for name in self._files if _under(name, path)]
+
+    def walk(self, top: str = ''):
+        # One pass over the names instead of an isdir() scan per entry
+        top = normalize_arcname(top).rstrip('/')
+        tree = {}
+        for name in self.files(top):
+            parts = name[len(top) + 1 if top else 0:].split('/')
+            root = top
+            for part in parts[:-1]:
+                tree.setdefault(root, (set(), []))[0].add(part)
+                root = f"{root}/{part}" if root else part
+            tree.setdefault(root, (set(), []))[1].append(parts[-1])
+        if top not in tree:
+            return
+        stack = [top]
+        while stack:
+            root = stack.pop()
+            dirs, files = tree.get(root, (set(), []))
+            dirs = sorted(dirs)
+            yield root, dirs, sorted(files)
+            stack.extend(f"{root}/{d}" if root else d for d in reversed(dirs))
+
+    def read_bytes(self, path: str) -> bytes:
+        value = self._files[normalize_arcname(path)]
+        if isinstance(value, zipfile.ZipInfo):
+            with instrumentation.span("member_read"):
+                data = self._src_zip.read(value)
+            instrumentation.count("bytes_read", len(data))
+            if value.compress_type != zipfile.ZIP_STORED:
+                self.inflated += len(data)
+            return data
+        return value
+
+    def write_bytes(self, path: str, data: bytes):
+        path = normalize_arcname(path)
+        self._files.pop(path, None)
+        self._files[path] = bytes(data)
+
+    def remove(self, path: str):
+        self._files.pop(normalize_arcname(path), None)
+
+    def rmtree(self, path: str):
+        for name in self.files(path):
+            del self._files[name]
+
+    def _move_file(self, src: str, dst: str):
+        value = self._files.pop(src)
+        self._files.pop(dst, None)
+        self._files[dst] = value
+
+    def _members(self):
+        for name, value in self._files.items():
+            if isinstance(value, zipfile.ZipInfo):
+                yield name, value.filename, None
+            else:
+                yield name, None, value
+
+
+class DiskWorkspace(Workspace):
+    """
+    Workspace extracted to a temp dir, created under `base_dir` (tempfile's
+    default, i.e. TMPDIR, if None). Extracted files whose size and mtime are
+    unchanged at write time count as untouched source members.
+    """
+
+    def __init__(self, base_dir: str = None, settings=None):
+        super().__init__(settings)
+        self.root = tempfile.mkdtemp(prefix='trw-ws-', dir=base_dir)
+        # path -> (source member name, size, mtime_ns) as extracted
+        self._extracted = {}
+
+    def _path(self, path: str) -> str:
+        path = normalize_arcname(path).rstrip('/')
+        return os.path.join(self.root, *path.split('/')) if path else self.root
+
+    def load(self, src_zip_path: str, paths=None, mode: str = 'keep'):
+        paths = _norm_paths(paths)
+        self._src_path = src_zip_path
+        with instrumentation.span("extractall"), zipfile.ZipFile(src_zip_path, 'r') as z:
+            for info in z.infolist():
+                if info.is_dir():
+                    continue
+                self._src_names.add(info.filename)
+                if not include_member(info.filename, paths, mode):
+                    continue
+                full_path = z.extract(info, self.root)
+                st = os.stat(full_path)
+                path = os.path.relpath(full_path, self.root).replace(os.path.sep, '/')
+                self._extracted[path] = (info.filename, st.st_size, st.st_mtime_ns)
+                instrumentation.count("members_processed")
+                instrumentation.count("files_touched")
+        return self
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.closed = True
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self._path(path))
+
+    def isdir(self, path: str) -> bool:
+        return os.path.isdir(self._path(path))
+
+    def isfile(self, path: str) -> bool:
+        return os.path.isfile(self._path(path))
+
+    def listdir(self, path: str = '') -> list:
+        return sorted(os.listdir(self._path(path)))
+
+    def files(self, path: str = '') -> list:
+        names = []
+        for root, dirs, files in os.walk(self._path(path)):
+            dirs.sort()
+            for fname in sorted(files):
+                names.append(os.path.relpath(os.path.join(root, fname), self.root).replace(os.path.sep, '/'))
+        return names
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(self._path(path), 'rb') as f:
+            return f.read()
+
+    def write_bytes(self, path: str, data: bytes):
+        self._extracted.pop(normalize_arcname(path), None)
+        full_path = self._path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(data)
+
+    def copy_in(self, disk_path: str, dst: str):
+        self._extracted.pop(normalize_arcname(dst), None)
+        full_path = self._path(dst)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        shutil.copyfile(disk_path, full_path)
+
+    def remove(self, path: str):
+        self._extracted.pop(normalize_arcname(path), None)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(path))
+
+    def rmtree(self, path: str):
+        for name in self.files(path):
+            self._extracted.pop(name, None)
+        shutil.rmtree(self._path(path), ignore_errors=True)
+
+    def _move_file(self, src: str, dst: str):
+        full_dst = self._path(dst)
+        os.makedirs(os.path.dirname(full_dst), exist_ok=True)
+        os.replace(self._path(src), full_dst)
+        extracted = self._extracted.pop(src, None)
+        self._extracted.pop(dst, None)
+        if extracted is not None:
+            self._extracted[dst] = extracted
+
+    def _members(self):
+        for name in self.files():
+            full_path = self._path(name)
+            extracted = self._extracted.get(name)
+            if extracted is not None:
+                st = os.stat(full_path)
+                if extracted[1:] == (st.st_size, st.st_mtime_ns):
+                    yield name, extracted[0], None
+                    continue
+            yield name, None, full_path
+
+
+def open_workspace(src_zip_path: str = None, paths=None, mode: str = 'keep', backend: str = None,
+                   settings=None) -> Workspace:
+    """
+    A workspace of the given backend (default: the settings' one), loaded
+    with the members of src_zip_path selected by paths/mode, that writes as
+    `settings` (default: build_settings.current()) say. Dry runs always use
+    memory so nothing is extracted.
+    """
+    if settings is None:
+        settings = build_settings.current()
+    backend = backend or settings.workspace_backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown workspace backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if settings.dry_run:
+        backend = 'memory'
+    ws = MemoryWorkspace(settings) if backend == 'memory' else DiskWorkspace(settings=settings)
+    if src_zip_path is not None:
+        try:
+            ws.load(src_zip_path, paths, mode)
+        except BaseException:
+            ws.close()
+            raise
+    return ws
+
+
+def _compress(info: zipfile.ZipInfo, data: bytes, level: int):
+    payload = compress_member(info, data, level)
+    instrumentation.count("bytes_written", info.compress_size)
+    return info, payload
+
+
+def _compress_file(full_path: str, info: zipfile.ZipInfo, level: int):
+    with open(full_path, 'rb') as f:
+        return _compress(info, f.read(), level)
+
+
+def zip_directory(root_dir: str, out_path: str, settings=None) -> str:
+    """
+    Zip every file under root_dir into out_path, compressed as the
+    compression policy of `settings` (default: build_settings.current())
+    says, deflate otherwise, on its compress workers when set. Members are
+    sorted and stamped in deterministic mode.
+    """
+    if settings is None:
+        settings = build_settings.current()
+    parent = os.path.dirname(out_path)
+    if parent and not os.path.exists(parent):
+        os.makedirs(parent, exist_ok=True)
+    workers = settings.compress_workers
+    with instrumentation.span("rezip_deflate"), \
+            zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_DEFLATED) as out_zip, \
+            (ParallelZipWriter(out_zip, workers) if workers else contextlib.nullcontext()) as writer:
+        for root, dirs, files in os.walk(root_dir):
+            if settings.deterministic:
+                # os.walk order depends on the filesystem
+                dirs.sort()
+                files.sort()
+            for fname in files:
+                full_path = os.path.join(root, fname)
+                rel_path = os.path.relpath(full_path, root_dir)
+                arcname = rel_path.replace(os.path.sep, '/')
+                compress_type, level = settings.resolve(arcname, zipfile.ZIP_DEFLATED)
+                instrumentation.count("files_touched")
+                if settings.deterministic:
+                    info = reproducible.stamp(zipfile.ZipInfo(arcname))
+                else:
+                    info = zipfile.ZipInfo.from_file(full_path, arcname)
+                info.compress_type = compress_type
+                if writer is not None:
+                    writer.submit(functools.partial(_compress_file, full_path, info, level))
+                    continue
+                with open(full_path, 'rb') as f:
+                    copy_stream(f, out_zip, info, os.path.getsize(full_path), level)
+                instrumentation.count("bytes_written", info.compress_size)
+    return out_path
@@ -0,0 +1,950 @@
+import zipfile
+import os
+import time
+import struct
+import zlib
+import fnmatch
+import shutil
+import hashlib
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+from json_patch import loads_json_bytes, dumps_json_bytes, apply_json_patch
+import instrumentation
+import build_settings
+import reproducible
+import dry_run
+import patch_bundle
+from make_bin_diff import patch_bytes as apply_bsdiff_bytes, ALREADY_PATCHED, check_size, check_source, load_patch_hashes, verify_target
+
+
+COPY_CHUNK_SIZE = 1024 * 1024
+ZIP64_EXTRA_ID = 0x0001
+# Below this many candidate members a bulk transform runs inline, a pool
+# costs more to start than it saves
+PARALLEL_MIN_CANDIDATES = 64
+# Pipelined writes: batches queued ahead of the writer, and when a batch is
+# handed over. Roughly PIPELINE_DEPTH * PIPELINE_BATCH_BYTES is in flight
+PIPELINE_DEPTH = 8
+PIPELINE_BATCH_MEMBERS = 64
+PIPELINE_BATCH_BYTES = 4 * 1024 * 1024
+_PIPELINE_DONE = object()
+
+_STREAM_MEMBER = object()
+_BUNDLED_MEMBER = object()
+
+def normalize_arcname(path: str) -> str:
+    """
+    Normalize a path into the forward-slash form used for zip member names.
+    """
+    name = path.replace(os.path.sep, '/')
+    if name.startswith('./'):
+        name = name[2:]
+    return name
+
+
+def read_source(source) -> bytes:
+    """
+    Resolve a replacement source into bytes. Strings are treated as paths
+    on disk, anything else is assumed to already be bytes-like.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    return bytes(source)
+
+
+def copy_member_raw(src_zip: zipfile.ZipFile, out_zip: zipfile.ZipFile, info: zipfile.ZipInfo, name: str = None,
+                    deterministic: bool = False) -> zipfile.ZipInfo:
+    """
+    Copy a member's already-compressed bytes from src_zip into out_zip without
+    inflating or deflating it. The CRC and sizes come from the source central
+    directory, only the local header is rewritten (with `name` if given, and
+    fixed timestamps and permissions if deterministic).
+    """
+    new_info = _copy_info(info, name or info.filename, deterministic)
+    new_info.compress_type = info.compress_type
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+    new_info.CRC = info.CRC
+    new_info.extra = strip_extra_fields(info.extra, (ZIP64_EXTRA_ID,))
+    # Sizes are known up front so no trailing data descriptor is needed
+    new_info.flag_bits = info.flag_bits & ~0x08
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    out_zip._writecheck(new_info)
+    return _append_member(out_zip, new_info, _raw_chunks(src_zip.fp, info), zip64)
+
+
+def strip_extra_fields(extra: bytes, header_ids) -> bytes:
+    """
+    Drop the extra fields with the given header ids. The zip64 field is
+    rewritten by ZipInfo.FileHeader when needed, so a copied one must go.
+    """
+    kept = []
+    i = 0
+    while i + 4 <= len(extra):
+        header_id, size = struct.unpack('<HH', extra[i:i + 4])
+        end = i + 4 + size
+        if header_id not in header_ids:
+            kept.append(extra[i:end])
+        i = end
+    return b''.join(kept)
+
+
+def _raw_chunks(src_fp, info: zipfile.ZipInfo):
+    """
+    Yield a member's compressed bytes, located through its local header.
+    """
+    src_fp.seek(info.header_offset)
+    fheader = src_fp.read(zipfile.sizeFileHeader)
+    if len(fheader) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipFile("Truncated file header")
+    fheader = struct.unpack(zipfile.structFileHeader, fheader)
+    if fheader[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile("Bad magic number for file header")
+    src_fp.seek(fheader[zipfile._FH_FILENAME_LENGTH] + fheader[zipfile._FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = src_fp.read(min(remaining, COPY_CHUNK_SIZE))
+        if not chunk:
+            raise zipfile.BadZipFile("Truncated member data: " + info.filename)
+        yield chunk
+        remaining -= len(chunk)
+
+
+def splice_bundled(out_zip: zipfile.ZipFile, info: zipfile.ZipInfo, bundle_path: str, bundle_info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """
+    Append a member under `info` (name, date, attributes) whose compressed
+    bytes, CRC and sizes come from a compiled patch_data bundle. The bytes
+    match what writestr would have written for the source file.
+    """
+    info.compress_type = bundle_info.compress_type
+    info.compress_size = bundle_info.compress_size
+    info.file_size = bundle_info.file_size
+    info.CRC = bundle_info.CRC
+    info.flag_bits = bundle_info.flag_bits & ~0x08
+    if not info.external_attr:
+        info.external_attr = 0o600 << 16
+    zip64 = info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    out_zip._writecheck(info)
+    with open(bundle_path, 'rb') as bundle_fp:
+        return _append_member(out_zip, info, _raw_chunks(bundle_fp, bundle_info), zip64)
+
+
+def _append_member(out_zip: zipfile.ZipFile, info: zipfile.ZipInfo, chunks, zip64: bool = False) -> zipfile.ZipInfo:
+    """
+    Append a member whose CRC, sizes and compressed bytes are already known:
+    write its local header followed by the chunks and register it in the
+    central directory.
+    """
+    with out_zip._lock:
+        out_fp = out_zip.fp
+        if out_zip._seekable:
+            out_fp.seek(out_zip.start_dir)
+        info.header_offset = out_fp.tell()
+        out_fp.write(info.FileHeader(zip64))
+        for chunk in chunks:
+            out_fp.write(chunk)
+        out_zip.filelist.append(info)
+        out_zip.NameToInfo[info.filename] = info
+        out_zip.start_dir = out_fp.tell()
+        out_zip._didModify = True
+    return info
+
+
+def compress_member(info: zipfile.ZipInfo, data: bytes, level: int = None) -> bytes:
+    """
+    Compress data with info.compress_type and fill in the CRC, sizes and
+    flags ZipFile.writestr would, so the result can be appended with
+    write_precompressed. Safe to call from worker threads.
+    """
+    compressor = zipfile._get_compressor(info.compress_type, level)
+    payload = compressor.compress(data) + compressor.flush() if compressor else data
+    info.file_size = len(data)
+    info.compress_size = len(payload)
+    info.CRC = zlib.crc32(data)
+    info.flag_bits = 0x00
+    if info.compress_type == zipfile.ZIP_LZMA:
+        # Compressed data includes an end-of-stream marker
+        info.flag_bits |= 0x02
+    if not info.external_attr:
+        info.external_attr = 0o600 << 16
+    return payload
+
+
+def write_precompressed(out_zip: zipfile.ZipFile, info: zipfile.ZipInfo, payload: bytes) -> zipfile.ZipInfo:
+    """
+    Append a member produced by compress_member. The bytes match what
+    writestr would have written for the same data.
+    """
+    zip64 = info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    out_zip._writecheck(info)
+    return _append_member(out_zip, info, (payload,), zip64)
+
+
+class ParallelZipWriter:
+    """
+    Compresses members on a thread pool and appends them to an open ZipFile
+    in submission order, so the output is the same as writing them one by
+    one. zlib, bz2 and lzma release the GIL, so members compress in
+    parallel. At most max_pending members are held in memory.
+    """
+
+    def __init__(self, out_zip: zipfile.ZipFile, workers: int, max_pending: int = None):
+        self.out_zip = out_zip
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending or workers * 4
+        self.pending = deque()
+
+    def submit(self, job):
+        """
+        Queue job() -> (ZipInfo, payload from compress_member), run on the pool.
+        """
+        self.pending.append(self.pool.submit(job))
+        self._drain()
+
+    def call(self, fn):
+        """
+        Queue fn(out_zip) to run on the writing thread once everything
+        submitted before it is written, e.g. a raw member copy.
+        """
+        self.pending.append(fn)
+        self._drain()
+
+    def _drain(self, wait: bool = False):
+        while self.pending:
+            head = self.pending[0]
+            if isinstance(head, Future):
+                if not (wait or head.done() or len(self.pending) > self.max_pending):
+                    return
+                info, payload = head.result()
+                with instrumentation.span("member_append"):
+                    write_precompressed(self.out_zip, info, payload)
+            else:
+                head(self.out_zip)
+            self.pending.popleft()
+
+    def close(self):
+        try:
+            self._drain(wait=True)
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            return
+        self.close()
+
+
+def can_copy_raw(info: zipfile.ZipInfo) -> bool:
+    # Encrypted members cannot be re-headered safely
+    return not (info.flag_bits & 0x01)
+
+
+def copy_stream(src_fp, out_zip: zipfile.ZipFile, info: zipfile.ZipInfo, size: int, level: int = None) -> zipfile.ZipInfo:
+    """
+    Compress a readable stream into out_zip as `info` in COPY_CHUNK_SIZE
+    chunks, so memory use does not grow with the member size.
+    """
+    info.file_size = size
+    if level is not None:
+        info._compresslevel = level
+    with out_zip.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as dst:
+        shutil.copyfileobj(src_fp, dst, COPY_CHUNK_SIZE)
+    return info
+
+
+def copy_member_stream(src_zip: zipfile.ZipFile, out_zip: zipfile.ZipFile, info: zipfile.ZipInfo, name: str = None,
+                       deterministic: bool = False) -> zipfile.ZipInfo:
+    """
+    Inflate and re-deflate a member chunk by chunk, keeping its compression
+    method. For members that cannot be copied raw.
+    """
+    with src_zip.open(info) as src_fp:
+        return copy_stream(src_fp, out_zip, _copy_info(info, name or info.filename, deterministic), info.file_size)
+
+
+class OverlayEntry:
+    """
+    A single member of the output archive as decided by ZipOverlay.plan().
+    Either `info` (a member of the source archive) or `source` (replacement
+    bytes or a path on disk) provides the base content, and `transforms`
+    are applied to it in order before it is written.
+    """
+
+    def __init__(self, name: str, info=None, source=None, transforms=None):
+        self.name = name
+        self.info = info
+        self.source = source
+        self.transforms = transforms or []
+        # (bundle path, ZipInfo) when source is spliced from a patch_data bundle
+        self.bundled = None
+
+    @property
+    def is_passthrough(self) -> bool:
+        return self.source is None and not self.transforms
+
+
+class ZipOverlay:
+    """
+    Describes a set of member operations against a source archive and writes
+    the result to a new archive in a single pass. Untouched members are
+    copied straight across without being extracted to disk.
+
+    Operations are recorded first and only resolved when plan() or write()
+    is called, so the order they are declared in does not matter except for
+    transforms targeting the same member, which run in declaration order.
+    """
+
+    def __init__(self, src_zip_path: str):
+        self.src_zip_path = src_zip_path
+        self._keep = None
+        self._dropped = set()
+        self._dropped_prefixes = []
+        self._renames = {}
+        self._prefix_renames = []
+        self._replacements = {}
+        self._transforms = {}
+        self._json_edits = {}
+        self._bulk_transforms = []
+        self._prechecks = []
+
+    def keep(self, paths):
+        """
+        Restrict the output to the given source members. Can be called more
+        than once, the kept sets are merged.
+        """
+        if self._keep is None:
+            self._keep = set()
+        for p in paths:
+            self._keep.add(normalize_arcname(p))
+        return self
+
+    def drop(self, path: str):
+        self._dropped.add(normalize_arcname(path))
+        return self
+
+    def drop_prefix(self, prefix: str):
+        """
+        Drop every source member under prefix, e.g. 'Server/Drops/NPCs/'.
+        """
+        self._dropped_prefixes.append(normalize_arcname(prefix))
+        return self
+
+    def rename(self, old: str, new: str):
+        self._renames[normalize_arcname(old)] = normalize_arcname(new)
+        return self
+
+    def rename_prefix(self, old_prefix: str, new_prefix: str):
+        """
+        Move every source member under old_prefix to new_prefix. Renamed
+        members win over source members that already had the target name.
+        """
+        self._prefix_renames.append((normalize_arcname(old_prefix), normalize_arcname(new_prefix)))
+        return self
+
+    def replace(self, arcname: str, source):
+        """
+        Write `source` (a path on disk or bytes) as `arcname`, replacing the
+        source member of that name or adding it if it did not exist.
+        """
+        self._replacements[normalize_arcname(arcname)] = source
+        return self
+
+    def transform(self, arcname: str, fn):
+        """
+        Register fn(bytes) -> bytes to run over the final content of arcname.
+        """
+        self._transforms.setdefault(normalize_arcname(arcname), []).append(fn)
+        return self
+
+    def edit_json(self, arcname: str, fn, optional: bool = False):
+        """
+        Register fn(doc) to edit arcname as parsed JSON. If fn returns
+        something other than None it replaces the document. All JSON edits
+        for a member share one parse and one serialization, which happen
+        after any byte-level transforms. A member that is not JSON is left
+        as-is if every edit registered for it is optional, and fails the
+        write otherwise.
+        """
+        self._json_edits.setdefault(normalize_arcname(arcname), []).append((fn, optional))
+        return self
+
+    def json_patch(self, arcname: str, ops: list):
+        """
+        Apply a list of JSON patch operations (see json_patch.apply_operation)
+        to arcname. Optional if every operation is.
+        """
+        ops = list(ops)
+        optional = bool(ops) and all(op.get('optional') for op in ops)
+        return self.edit_json(arcname, lambda doc: apply_json_patch(doc, ops), optional)
+
+    def transform_matching(self, pattern: str, fn, needle: bytes = None, ignore_case: bool = False,
+                           workers: int = None, use_processes: bool = True):
+        """
+        Run fn(bytes) over every source member whose name matches the glob
+        pattern ('*' also matches '/'). fn returns the new content, or None to
+        leave the member untouched so it is still copied raw. Members that do
+        not contain `needle` are skipped without calling fn. Candidates are
+        spread over a process pool (thread pool if use_processes is False),
+        so with processes fn must be a picklable module-level function.
+        """
+        if ignore_case:
+            pattern = pattern.lower()
+        self._bulk_transforms.append((pattern, fn, needle, ignore_case, workers, use_processes))
+        return self
+
+    def _run_bulk_transforms(self, src_zip, entries: list):
+        """
+        Apply transform_matching() registrations to the planned entries,
+        turning members fn changed into entries with in-memory sources.
+        """
+        for pattern, fn, needle, ignore_case, workers, use_processes in self._bulk_transforms:
+            candidates = []
+            with instrumentation.span("bulk_scan"):
+                for entry in entries:
+                    if entry.info is None or entry.source is not None:
+                        continue
+                    name = entry.name.lower() if ignore_case else entry.name
+                    if not fnmatch.fnmatchcase(name, pattern):
+                        continue
+                    data = src_zip.read(entry.info)
+                    instrumentation.count("members_scanned")
+                    if needle is not None and needle not in data:
+                        continue
+                    candidates.append((entry, data))
+            if not candidates:
+                continue
+            instrumentation.count("members_bulk_candidates", len(candidates))
+            datas = [data for _, data in candidates]
+            with instrumentation.span("bulk_transform"):
+                if len(candidates) < PARALLEL_MIN_CANDIDATES or workers == 1:
+                    results = list(map(fn, datas))
+                else:
+                    pool_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+                    max_workers = workers or os.cpu_count() or 1
+                    with pool_cls(max_workers=max_workers) as pool:
+                        chunksize = max(1, len(datas) // (max_workers * 4))
+                        results = list(pool.map(fn, datas, chunksize=chunksize))
+            for (entry, data), result in zip(candidates, results):
+                if result is not None and result != data:
+                    entry.source = result
+
+    def _member_transforms(self, name: str) -> list:
+        transforms = list(self._transforms.get(name, ()))
+        edits = self._json_edits.get(name)
+        if edits:
+            optional = all(opt for _, opt in edits)
+
+            def _edit_json(data: bytes) -> bytes:
+                with instrumentation.span("json_edit"):
+                    try:
+                        doc = loads_json_bytes(data)
+                    except ValueError:
+                        # Not UTF-8 JSON: optional edits have nothing to apply to
+                        if optional:
+                            return data
+                        raise
+                    for fn, _ in edits:
+                        result = fn(doc)
+                        if result is not None:
+                            doc = result
+                    return dumps_json_bytes(doc)
+            transforms.append(_edit_json)
+        return transforms
+
+    def apply_bsdiff(self, arcname: str, patch_path: str, out_name: str = None):
+        """
+        Apply a bsdiff4 patch to arcname. If out_name is given the patched
+        member is written under that name and arcname is dropped.
+
+        When the patch has recorded hashes, write() checks the source
+        member's size against them from the central directory before any
+        output is produced, and its sha256 on the bytes read for patching: a
+        different upstream file raises PatchMismatchError, and a member that
+        already is the patch result is passed through unchanged.
+        """
+        with open(patch_path, 'rb') as f:
+            patch_data = f.read()
+        hashes = load_patch_hashes(patch_path)
+        target = arcname
+        if out_name:
+            self.rename(arcname, out_name)
+            target = out_name
+
+        if hashes is not None:
+            def _precheck(src_zip):
+                try:
+                    info = src_zip.getinfo(arcname)
+                except KeyError:
+                    return
+                check_size(info.file_size, hashes, name=f"{arcname} ({patch_path})")
+            self._prechecks.append(_precheck)
+
+        def _apply(data: bytes) -> bytes:
+            if hashes is None:
+                return apply_bsdiff_bytes(data, patch_data)
+            status = check_source(len(data), lambda: hashlib.sha256(data).hexdigest(), hashes,
+                                  name=f"{arcname} ({patch_path})")
+            if status == ALREADY_PATCHED:
+                instrumentation.count("bsdiff_already_patched")
+                return data
+            patched = apply_bsdiff_bytes(data, patch_data)
+            verify_target(hashlib.sha256(patched).hexdigest(), hashes, name=f"{target} ({patch_path})")
+            return patched
+        return self.transform(target, _apply)
+
+    def _is_kept(self, name: str) -> bool:
+        if self._keep is not None and name not in self._keep:
+            return False
+        if name in self._dropped:
+            return False
+        for prefix in self._dropped_prefixes:
+            if name.startswith(prefix):
+                return False
+        return True
+
+    def _resolve_name(self, name: str):
+        """
+        Return (output name, renamed?) for a source member name.
+        """
+        if name in self._renames:
+            return self._renames[name], True
+        for old_prefix, new_prefix in self._prefix_renames:
+            if name.startswith(old_prefix):
+                return new_prefix + name[len(old_prefix):], True
+        return name, False
+
+    def plan(self, src_zip: zipfile.ZipFile = None) -> list:
+        """
+        Resolve the recorded operations against the source central directory
+        and return the ordered list of OverlayEntry objects to write. Nothing
+        is decompressed here.
+        """
+        if src_zip is None:
+            with zipfile.ZipFile(self.src_zip_path, 'r') as z:
+                return self.plan(z)
+
+        chosen = {}
+        order = []
+        for info in src_zip.infolist():
+            if info.is_dir():
+                continue
+            if not self._is_kept(info.filename):
+                continue
+            out_name, renamed = self._resolve_name(info.filename)
+            if out_name in chosen:
+                # A renamed member replaces a member that already had its name
+                if renamed:
+                    chosen[out_name] = info
+                continue
+            chosen[out_name] = info
+            order.append(out_name)
+
+        entries = []
+        for out_name in order:
+            entries.append(OverlayEntry(out_name, info=chosen[out_name],
+                                        source=self._replacements.get(out_name),
+                                        transforms=self._member_transforms(out_name)))
+        for out_name, source in self._replacements.items():
+            if out_name in chosen:
+                continue
+            entries.append(OverlayEntry(out_name, source=source,
+                                        transforms=self._member_transforms(out_name)))
+        return entries
+
+    def write(self, out_path: str, compression: int = zipfile.ZIP_DEFLATED, raw_copy: bool = True,
+              pipeline_workers: int = None, compress_workers: int = None, settings=None) -> str:
+        """
+        Write the overlaid archive to out_path. Passthrough members keep their
+        original compression, modified or added members use `compression`
+        unless the compression policy of `settings` (a BuildSettings,
+        default: build_settings.current()) picks something else. In
+        deterministic mode members are written sorted by name.
+        With raw_copy, passthrough members are copied as compressed bytes
+        instead of being inflated and deflated again.
+
+        With pipeline_workers (default: the settings'), reading,
+        transforming and writing run as overlapping stages; see
+        _write_pipelined. With compress_workers (default: the settings'),
+        members are read, transformed and compressed on a thread pool
+        instead; see _write_parallel. This takes precedence over
+        pipeline_workers. The output is the same either way.
+
+        In dry-run mode nothing is written, estimate() is recorded in the
+        settings instead.
+        """
+        if settings is None:
+            settings = build_settings.current()
+        if settings.dry_run:
+            settings.record(self.estimate(out_path, compression, raw_copy, settings))
+            return out_path
+        if pipeline_workers is None:
+            pipeline_workers = settings.pipeline_workers
+        if compress_workers is None:
+            compress_workers = settings.compress_workers
+        parent = os.path.dirname(out_path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent, exist_ok=True)
+        tmp_path = out_path + '.tmp'
+        try:
+            with zipfile.ZipFile(self.src_zip_path, 'r') as src_zip:
+                with instrumentation.span("overlay_plan"):
+                    entries = self.plan(src_zip)
+                    if settings.deterministic:
+                        entries.sort(key=lambda entry: entry.name)
+                with instrumentation.span("overlay_verify"):
+                    for precheck in self._prechecks:
+                        precheck(src_zip)
+                with instrumentation.span("overlay_bulk_transforms"):
+                    self._run_bulk_transforms(src_zip, entries)
+                with instrumentation.span("overlay_bundles"):
+                    for entry in entries:
+                        entry.bundled = _find_bundled(entry, compression, settings)
+                with instrumentation.span("overlay_write"), \
+                        zipfile.ZipFile(tmp_path, 'w', compression=compression) as out_zip:
+                    if compress_workers:
+                        self._write_parallel(src_zip, out_zip, entries, compression, raw_copy, compress_workers, settings)
+                    elif pipeline_workers:
+                        self._write_pipelined(src_zip, out_zip, entries, compression, raw_copy, pipeline_workers, settings)
+                    else:
+                        for entry in entries:
+                            if raw_copy and entry.is_passthrough and can_copy_raw(entry.info):
+                                _copy_raw(src_zip, out_zip, entry, settings)
+                            elif entry.bundled is not None:
+                                _splice_entry(out_zip, entry, compression, settings)
+                            elif _should_stream(entry, settings):
+                                _stream_entry(src_zip, out_zip, entry, compression, settings)
+                            else:
+                                data = _transform_entry(entry, _read_entry(src_zip, entry))
+                                _store_entry(out_zip, entry, data, compression, settings)
+            os.replace(tmp_path, out_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return out_path
+
+    def estimate(self, out_path: str, compression: int = zipfile.ZIP_DEFLATED, raw_copy: bool = True, settings=None) -> dict:
+        """
+        What write() would do, from the central directory alone: members
+        kept, dropped, replaced, added, modified and renamed, the output size
+        and the bytes inflated and deflated on the way. Replacement ratios
+        come from deflating a sample, transforms are assumed to keep sizes
+        and ratios, and bulk transform candidates are counted by name and
+        assumed unchanged.
+        """
+        if settings is None:
+            settings = build_settings.current()
+        with zipfile.ZipFile(self.src_zip_path, 'r') as src_zip:
+            infos = [i for i in src_zip.infolist() if not i.is_dir()]
+            entries = self.plan(src_zip)
+        plan = dry_run.new_plan(self.src_zip_path, out_path)
+        ratio = dry_run.deflate_ratio(infos)
+        used = {id(entry.info) for entry in entries if entry.info is not None}
+        plan["dropped"] = sum(1 for info in infos if id(info) not in used)
+        bulk = set()
+        for pattern, _, _, ignore_case, _, _ in self._bulk_transforms:
+            for entry in entries:
+                name = entry.name.lower() if ignore_case else entry.name
+                if entry.info is not None and entry.source is None and fnmatch.fnmatchcase(name, pattern):
+                    bulk.add(id(entry))
+        plan["bulk_candidates"] = len(bulk)
+
+        for entry in entries:
+            info = entry.info
+            if info is not None:
+                plan["kept"] += 1
+                if entry.name != info.filename:
+                    plan["renamed"] += 1
+            if entry.source is not None:
+                plan["replaced" if info is not None else "added"] += 1
+            elif entry.transforms:
+                plan["modified"] += 1
+            inflated = info is not None and entry.source is None and info.compress_type != zipfile.ZIP_STORED
+            if entry.is_passthrough:
+                if id(entry) in bulk and inflated:
+                    # Scanned for the needle, then copied raw if fn leaves it alone
+                    plan["inflate_bytes"] += info.file_size
+                if not (raw_copy and can_copy_raw(info)) and inflated:
+                    # Recompressed with its original method
+                    plan["inflate_bytes"] += info.file_size
+                    plan["deflate_bytes"] += info.file_size
+                dry_run.add_member(plan, entry.name, info.compress_size)
+                continue
+            bundled = _find_bundled(entry, compression, settings, compile=False)
+            if bundled is not None:
+                # Spliced from an up to date patch_data bundle
+                dry_run.add_member(plan, entry.name, bundled[1].compress_size)
+                continue
+            size = _entry_size(entry)
+            if inflated:
+                plan["inflate_bytes"] += info.file_size
+            compress_type, _ = settings.resolve(entry.name, compression)
+            if compress_type == zipfile.ZIP_STORED:
+                dry_run.add_member(plan, entry.name, size)
+                continue
+            plan["deflate_bytes"] += size
+            if entry.source is not None:
+                member_ratio = dry_run.sample_ratio(entry.source)
+            elif info.compress_type != zipfile.ZIP_STORED and info.file_size:
+                member_ratio = min(1.0, info.compress_size / info.file_size)
+            else:
+                member_ratio = ratio
+            dry_run.add_member(plan, entry.name, int(size * member_ratio))
+        return plan
+
+    def _write_parallel(self, src_zip, out_zip, entries: list, compression: int, raw_copy: bool, workers: int, settings):
+        """
+        Read, transform and compress members on `workers` threads and append
+        the pre-compressed results in plan order. Raw copies and streamed
+        members are written in their slot from a second source handle.
+        """
+        with zipfile.ZipFile(self.src_zip_path, 'r') as raw_src, \
+                ParallelZipWriter(out_zip, workers) as writer:
+            for entry in entries:
+                if raw_copy and entry.is_passthrough and can_copy_raw(entry.info):
+                    writer.call(lambda out, entry=entry: _copy_raw(raw_src, out, entry, settings))
+                elif entry.bundled is not None:
+                    writer.call(lambda out, entry=entry: _splice_entry(out, entry, compression, settings))
+                elif _should_stream(entry, settings):
+                    writer.call(lambda out, entry=entry: _stream_entry(raw_src, out, entry, compression, settings))
+                else:
+                    writer.submit(lambda entry=entry: _prepare_entry(src_zip, entry, compression, settings))
+
+    def _write_pipelined(self, src_zip, out_zip, entries: list, compression: int, raw_copy: bool, workers: int, settings):
+        """
+        Three overlapping stages joined by a bounded queue: a reader thread
+        inflates members in order, a thread pool runs their transforms (JSON
+        edits, bsdiff) and the calling thread deflates and writes results in
+        the original order. zlib and bsdiff release the GIL, so compression
+        overlaps with reading even for a single mod. The queue holds at most
+        PIPELINE_DEPTH batches.
+        """
+        pending = queue.Queue(maxsize=PIPELINE_DEPTH)
+        stop = threading.Event()
+        errors = []
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read_stage(pool):
+            # Members travel in batches so small JSON files do not pay a
+            # queue round trip each
+            batch = []
+            batch_bytes = 0
+            try:
+                for entry in entries:
+                    if raw_copy and entry.is_passthrough and can_copy_raw(entry.info):
+                        batch.append((entry, None))
+                        batch_bytes += entry.info.compress_size
+                    elif entry.bundled is not None:
+                        batch.append((entry, _BUNDLED_MEMBER))
+                    elif _should_stream(entry, settings):
+                        batch.append((entry, _STREAM_MEMBER))
+                    else:
+                        data = _read_entry(src_zip, entry)
+                        batch.append((entry, pool.submit(_transform_entry, entry, data) if entry.transforms else data))
+                        batch_bytes += len(data)
+                    if len(batch) >= PIPELINE_BATCH_MEMBERS or batch_bytes >= PIPELINE_BATCH_BYTES:
+                        if not put(batch):
+                            return
+                        batch = []
+                        batch_bytes = 0
+                if batch:
+                    put(batch)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                put(_PIPELINE_DONE)
+
+        # Raw copies and streamed members seek the source file directly, so
+        # they get their own handle instead of racing the reader thread
+        with zipfile.ZipFile(self.src_zip_path, 'r') as raw_src, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            reader = threading.Thread(target=read_stage, args=(pool,), name="overlay-reader", daemon=True)
+            reader.start()
+            try:
+                while True:
+                    batch = pending.get()
+                    if batch is _PIPELINE_DONE:
+                        break
+                    for entry, data in batch:
+                        if data is None:
+                            _copy_raw(raw_src, out_zip, entry, settings)
+                            continue
+                        if data is _STREAM_MEMBER:
+                            _stream_entry(raw_src, out_zip, entry, compression, settings)
+                            continue
+                        if data is _BUNDLED_MEMBER:
+                            _splice_entry(out_zip, entry, compression, settings)
+                            continue
+                        if isinstance(data, Future):
+                            data = data.result()
+                        _store_entry(out_zip, entry, data, compression, settings)
+            finally:
+                stop.set()
+                reader.join()
+        if errors:
+            raise errors[0]
+
+
+def _copy_raw(src_zip, out_zip, entry: OverlayEntry, settings):
+    info = entry.info
+    copy_member_raw(src_zip, out_zip, info, entry.name, settings.deterministic)
+    instrumentation.count("members_raw_copied")
+    instrumentation.count("bytes_read", info.compress_size)
+    instrumentation.count("bytes_written", info.compress_size)
+
+
+def _find_bundled(entry: OverlayEntry, compression: int, settings, compile: bool = True):
+    """
+    The bundle member to splice for an entry that is a patch_data file
+    written as-is, or None.
+    """
+    if settings.bundle_dir is None or not isinstance(entry.source, str) or entry.transforms:
+        return None
+    compress_type, level = settings.resolve(entry.name, compression)
+    return patch_bundle.lookup(entry.source, compress_type, level, settings.bundle_dir, compile=compile)
+
+
+def _splice_entry(out_zip, entry: OverlayEntry, compression: int, settings):
+    info, _ = _entry_info(entry, compression, settings)
+    bundle_path, bundle_info = entry.bundled
+    with instrumentation.span("member_splice"):
+        splice_bundled(out_zip, info, bundle_path, bundle_info)
+    instrumentation.count("members_spliced")
+    instrumentation.count("bytes_read", info.compress_size)
+    instrumentation.count("bytes_written", info.compress_size)
+
+
+def _entry_size(entry: OverlayEntry) -> int:
+    if entry.source is None:
+        return entry.info.file_size
+    if isinstance(entry.source, str):
+        return os.path.getsize(entry.source)
+    return len(entry.source)
+
+
+def _should_stream(entry: OverlayEntry, settings) -> bool:
+    """
+    Whether an entry goes above the memory ceiling and can be streamed.
+    Transforms need the whole member, so those are read in full anyway.
+    """
+    if settings.memory_ceiling is None or _entry_size(entry) <= settings.memory_ceiling:
+        return False
+    if entry.transforms:
+        instrumentation.count("members_over_memory_ceiling")
+        return False
+    # Replacement bytes are in memory already
+    return entry.source is None or isinstance(entry.source, str)
+
+
+def _stream_entry(src_zip, out_zip, entry: OverlayEntry, compression: int, settings):
+    size = _entry_size(entry)
+    with instrumentation.span("member_stream"):
+        if entry.is_passthrough:
+            info = copy_member_stream(src_zip, out_zip, entry.info, entry.name, settings.deterministic)
+        else:
+            compress_type, level = settings.resolve(entry.name, compression)
+            info = _new_info(entry.name, entry.info, compress_type, settings.deterministic)
+            if entry.source is not None:
+                with open(entry.source, 'rb') as src_fp:
+                    copy_stream(src_fp, out_zip, info, size, level)
+            else:
+                with src_zip.open(entry.info) as src_fp:
+                    copy_stream(src_fp, out_zip, info, size, level)
+    instrumentation.count("members_streamed")
+    instrumentation.count("bytes_read", size)
+    instrumentation.count("bytes_written", info.compress_size)
+
+
+def _read_entry(src_zip, entry: OverlayEntry) -> bytes:
+    with instrumentation.span("member_read"):
+        if entry.source is not None:
+            data = read_source(entry.source)
+        else:
+            data = src_zip.read(entry.info)
+    instrumentation.count("bytes_read", len(data))
+    return data
+
+
+def _transform_entry(entry: OverlayEntry, data: bytes) -> bytes:
+    if not entry.transforms:
+        return data
+    with instrumentation.span("member_transform"):
+        for fn in entry.transforms:
+            data = fn(data)
+    return data
+
+
+def _entry_info(entry: OverlayEntry, compression: int, settings):
+    """
+    The ZipInfo and compression level a transformed or recompressed entry is
+    written with.
+    """
+    if entry.is_passthrough:
+        # Passthrough that could not be raw-copied: keep its original method
+        return _copy_info(entry.info, entry.name, settings.deterministic), None
+    compress_type, level = settings.resolve(entry.name, compression)
+    return _new_info(entry.name, entry.info, compress_type, settings.deterministic), level
+
+
+def _count_stored(entry: OverlayEntry, info: zipfile.ZipInfo):
+    if entry.is_passthrough:
+        instrumentation.count("members_recompressed")
+    else:
+        instrumentation.count("members_added" if entry.info is None else "members_modified")
+    instrumentation.count("bytes_written", info.compress_size)
+
+
+def _store_entry(out_zip, entry: OverlayEntry, data: bytes, compression: int, settings):
+    info, level = _entry_info(entry, compression, settings)
+    with instrumentation.span("member_deflate"):
+        out_zip.writestr(info, data, compresslevel=level)
+    _count_stored(entry, info)
+
+
+def _prepare_entry(src_zip, entry: OverlayEntry, compression: int, settings):
+    """
+    Worker side of _write_parallel: read, transform and compress one entry.
+    """
+    data = _transform_entry(entry, _read_entry(src_zip, entry))
+    info, level = _entry_info(entry, compression, settings)
+    with instrumentation.span("member_deflate"):
+        payload = compress_member(info, data, level)
+    _count_stored(entry, info)
+    return info, payload
+
+
+def _copy_info(info: zipfile.ZipInfo, name: str, deterministic: bool = False) -> zipfile.ZipInfo:
+    new_info = zipfile.ZipInfo(name, date_time=info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.external_attr = info.external_attr
+    new_info.create_system = info.create_system
+    if deterministic:
+        reproducible.stamp(new_info)
+    return new_info
+
+
+def _new_info(name: str, base_info, compression: int, deterministic: bool = False) -> zipfile.ZipInfo:
+    if base_info is not None:
+        info = _copy_info(base_info, name, deterministic)
+    else:
+        info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        info.external_attr = 0o644 << 16
+        if deterministic:
+            reproducible.stamp(info)
+    info.compress_type = compression
+    return info